@@ -0,0 +1,446 @@
+"""
+Approximate nearest-neighbour (IVF) index per (tenant_id, project_id, dim).
+
+Brute-force search scores every stored vector of a tenant/project, which is
+O(N) per query. An IVF index clusters the (L2-normalised) vectors around
+``nlist`` centroids with spherical k-means; a query scores the centroids,
+then only the rows of the ``nprobe`` closest lists. ``nprobe`` is the
+recall-vs-latency knob: ``nprobe >= nlist`` is an exact search.
+
+Indexes live in process (see :class:`IndexRegistry`), are updated
+incrementally as POST /memory inserts rows, and can be snapshotted to an
+embedding segment (api/segments.py) that a cold worker memory-maps instead
+of re-reading every row from Postgres. Vectors may be held as float16 or
+int8 (``ANN_ENCODING``) to fit more tenants per worker.
+
+Requires NumPy; without it the API falls back to exact search.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from api import segments
+
+# Below this many vectors a flat scan is as fast as probing, so no training
+TRAIN_MIN_SIZE = int(os.getenv('ANN_TRAIN_MIN_SIZE', '4096'))
+DEFAULT_NPROBE = int(os.getenv('ANN_NPROBE', '8'))
+DEFAULT_ENCODING = os.getenv('ANN_ENCODING', 'float32')
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+_CHUNK = 65536
+# Upper bound on elements of one (queries x vectors) score block, ~64 MB
+_SCORE_BLOCK_ELEMENTS = 1 << 24
+
+
+def _normalise(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+class _Growable:
+    """Append-only array with amortised O(1) appends along axis 0.
+
+    The view is replaced only after new rows are written, so a reader that
+    does not hold the writer's lock always sees a fully written prefix.
+    """
+
+    def __init__(self, data):
+        self._data = data
+        self._view = data
+
+    def append(self, rows):
+        size = len(self._view)
+        needed = size + len(rows)
+        if needed > len(self._data) or not self._data.flags.writeable:
+            # Also copies a read-only memory-mapped snapshot into RAM on first write
+            capacity = max(needed, 2 * len(self._data), 16)
+            grown = np.empty((capacity,) + self._data.shape[1:], dtype=self._data.dtype)
+            grown[:size] = self._data[:size]
+            self._data = grown
+        self._data[size:needed] = rows
+        self._view = self._data[:needed]
+
+    def view(self):
+        return self._view
+
+    def __len__(self):
+        return len(self._view)
+
+
+# Centroids and their inverted lists, swapped in together when (re)trained
+_Partition = namedtuple('_Partition', ('centroids', 'lists'))
+
+
+class IVFIndex:
+    """Inverted-file index over cosine similarity for one tenant/project/dim.
+
+    Writers (:meth:`add`, :meth:`train`) must be serialised by the caller;
+    searches may run concurrently with them without a lock.
+    """
+
+    def __init__(self, dim, nprobe=DEFAULT_NPROBE, encoding=DEFAULT_ENCODING):
+        if encoding not in segments.ENCODINGS:
+            raise ValueError(f'encoding must be one of {", ".join(segments.ENCODINGS)}')
+        self.dim = dim
+        self.nprobe = nprobe
+        self.encoding = encoding
+        self.ids = []
+        self._positions = {}
+        self._vectors = _Growable(np.empty((0, dim), dtype=np.dtype(encoding)))
+        self._scales = _Growable(np.empty((0,), dtype=np.float32)) if encoding == 'int8' else None
+        self._segment = None
+        self._assign = _Growable(np.empty((0,), dtype=np.int32))
+        self._partition = None
+        self.trained_size = 0
+        # Newest created_at folded in; used to catch up on rows written elsewhere
+        self.watermark = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, row_id):
+        return row_id in self._positions
+
+    @property
+    def centroids(self):
+        partition = self._partition
+        return None if partition is None else partition.centroids
+
+    @property
+    def nlist(self):
+        partition = self._partition
+        return 0 if partition is None else len(partition.centroids)
+
+    def add(self, ids, matrix, created_at=None):
+        """Add vectors (rows of ``matrix``); ids already present are skipped."""
+        matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, self.dim)
+        keep = [i for i, row_id in enumerate(ids) if row_id not in self._positions]
+        if created_at is not None and (self.watermark is None or created_at > self.watermark):
+            self.watermark = created_at
+        if not keep:
+            return 0
+        if len(keep) != len(ids):
+            ids = [ids[i] for i in keep]
+            matrix = matrix[keep]
+
+        start = len(self.ids)
+        matrix = _normalise(matrix)
+        for offset, row_id in enumerate(ids):
+            self._positions[row_id] = start + offset
+        # Ids, then scales, then vectors, then lists: a concurrent search
+        # only sees rows whose earlier parts are already in place
+        self.ids.extend(ids)
+        data, scales = segments.quantize(matrix, self.encoding)
+        if self._scales is not None:
+            self._scales.append(scales)
+        self._vectors.append(data)
+
+        partition = self._partition
+        if partition is not None:
+            assign = self._nearest(matrix, partition.centroids)
+            self._assign.append(assign)
+            positions = start + np.arange(len(assign), dtype=np.int64)
+            for c in np.unique(assign):
+                partition.lists[c].append(positions[assign == c])
+        else:
+            self._assign.append(np.zeros(len(ids), dtype=np.int32))
+
+        # (Re)train once the index is big enough, and again whenever it has
+        # doubled, so list sizes stay near sqrt(N)
+        if len(self) >= TRAIN_MIN_SIZE and len(self) >= 2 * self.trained_size:
+            self.train()
+        return len(ids)
+
+    def _rows(self, rows):
+        """Float32 vectors for ``rows`` (an index array or slice)."""
+        data = self._vectors.view()[rows]
+        if self.encoding == 'float32':
+            return data
+        return segments.dequantize(data, None if self._scales is None else self._scales.view()[rows])
+
+    @staticmethod
+    def _nearest(matrix, centroids):
+        out = np.empty(len(matrix), dtype=np.int32)
+        for lo in range(0, len(matrix), _CHUNK):
+            chunk = matrix[lo:lo + _CHUNK]
+            out[lo:lo + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        return out
+
+    def _scores(self, rows, q):
+        """Cosine scores for ``rows`` (all rows when None), dequantizing in chunks."""
+        return self._score_matrix(rows, q[None, :])[0]
+
+    def _score_matrix(self, rows, queries):
+        """(len(queries), len(rows)) cosine scores; ``queries`` are unit length."""
+        n = len(self._vectors) if rows is None else len(rows)
+        if self.encoding == 'float32':
+            data = self._vectors.view() if rows is None else self._vectors.view()[rows]
+            return queries @ data.T
+        out = np.empty((len(queries), n), dtype=np.float32)
+        for lo in range(0, n, _CHUNK):
+            part = slice(lo, min(n, lo + _CHUNK)) if rows is None else rows[lo:lo + _CHUNK]
+            chunk = queries @ self._rows(part).T
+            out[:, lo:lo + chunk.shape[1]] = chunk
+        return out
+
+    def train(self, seed=0):
+        """Spherical k-means over a sample, then assign every vector to a list."""
+        n = len(self)
+        nlist = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        sample_size = min(n, nlist * KMEANS_SAMPLE_PER_LIST)
+        sample = self._rows(np.sort(rng.choice(n, sample_size, replace=False)))
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.bincount(assign, minlength=nlist) == 0
+            # Re-seed empty clusters from random sample points
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = _normalise(sums)
+        assign = np.empty(n, dtype=np.int32)
+        for lo in range(0, n, _CHUNK):
+            hi = min(n, lo + _CHUNK)
+            assign[lo:hi] = self._nearest(self._rows(slice(lo, hi)), centroids)
+        self._set_partition(centroids, assign)
+        self.trained_size = n
+
+    def _set_partition(self, centroids, assign):
+        """Build the lists for ``assign`` and publish them with ``centroids``."""
+        assign = np.asarray(assign, dtype=np.int32)
+        order = np.argsort(assign, kind='stable')
+        bounds = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+        lists = [
+            _Growable(order[bounds[c]:bounds[c + 1]].astype(np.int64)) for c in range(len(centroids))
+        ]
+        self._assign = _Growable(assign)
+        self._partition = _Partition(centroids, lists)
+
+    def search(self, query, k=10, nprobe=None):
+        """Return up to ``k`` ``(id, cosine score)`` pairs, best first."""
+        n = len(self._vectors)
+        if n == 0 or k <= 0:
+            return []
+        q = _normalise(np.asarray(query, dtype=np.float32).reshape(self.dim))
+        nprobe = max(1, self.nprobe if nprobe is None else nprobe)
+
+        partition = self._partition
+        if partition is None or nprobe >= len(partition.centroids):
+            rows = None
+            scores = self._scores(None, q)
+        else:
+            centroid_scores = partition.centroids @ q
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+            rows = np.concatenate([partition.lists[c].view() for c in probe])
+            if len(rows) == 0:
+                return []
+            scores = self._scores(rows, q)
+
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        positions = best if rows is None else rows[best]
+        return [(self.ids[p], float(s)) for p, s in zip(positions, scores[best])]
+
+    def search_batch(self, queries, k=10, nprobe=None):
+        """:meth:`search` for many queries; one hit list per query.
+
+        Flat indexes score all queries with one (blocked) matrix multiply.
+        Probed searches score the centroids in one multiply, then each probed
+        list once against every query that probes it, and merge per query.
+        """
+        queries = _normalise(np.asarray(queries, dtype=np.float32).reshape(-1, self.dim))
+        n = len(self._vectors)
+        if n == 0 or k <= 0:
+            return [[] for _ in queries]
+        nprobe = max(1, self.nprobe if nprobe is None else nprobe)
+
+        partition = self._partition
+        if partition is None or nprobe >= len(partition.centroids):
+            k = min(k, n)
+            results = []
+            step = max(1, _SCORE_BLOCK_ELEMENTS // n)
+            for lo in range(0, len(queries), step):
+                scores = self._score_matrix(None, queries[lo:lo + step])
+                best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                for row, row_scores in zip(best, scores):
+                    results.append(self._ranked(row, row_scores[row]))
+            return results
+
+        probes = np.argpartition(-(queries @ partition.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        flat = probes.ravel()
+        owners = np.repeat(np.arange(len(queries)), nprobe)
+        order = np.argsort(flat, kind='stable')
+        flat, owners = flat[order], owners[order]
+        starts = np.flatnonzero(np.r_[True, flat[1:] != flat[:-1]])
+        candidates = [([], []) for _ in queries]
+        for lo, hi in zip(starts, np.r_[starts[1:], len(flat)]):
+            rows = partition.lists[flat[lo]].view()
+            if len(rows) == 0:
+                continue
+            members = owners[lo:hi]
+            scores = self._score_matrix(rows, queries[members])
+            kk = min(k, len(rows))
+            best = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+            for j, qi in enumerate(members):
+                candidates[qi][0].append(rows[best[j]])
+                candidates[qi][1].append(scores[j, best[j]])
+
+        results = []
+        for positions, scores in candidates:
+            if not positions:
+                results.append([])
+                continue
+            positions = np.concatenate(positions)
+            scores = np.concatenate(scores)
+            kk = min(k, len(scores))
+            best = np.argpartition(-scores, kk - 1)[:kk]
+            results.append(self._ranked(positions[best], scores[best]))
+        return results
+
+    def _ranked(self, positions, scores):
+        order = np.argsort(-scores)
+        return [(self.ids[p], float(s)) for p, s in zip(positions[order], scores[order])]
+
+    def save(self, path):
+        """Write the index to an embedding segment file (atomic rename)."""
+        partition = self._partition
+        arrays = {'assign': self._assign.view()}
+        if partition is not None:
+            arrays['centroids'] = partition.centroids
+        segments.write_segment(
+            path,
+            self.ids,
+            self._vectors.view(),
+            scales=None if self._scales is None else self._scales.view(),
+            arrays=arrays,
+            meta={
+                'nprobe': self.nprobe,
+                'trained_size': self.trained_size,
+                'watermark': self.watermark.isoformat() if self.watermark else None,
+            },
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Open a snapshot; vectors stay memory-mapped until the first add."""
+        segment = segments.Segment(path)
+        index = cls(segment.dim, nprobe=segment.meta['nprobe'], encoding=segment.encoding)
+        index._segment = segment
+        index.ids = segment.ids()
+        index._positions = {row_id: i for i, row_id in enumerate(index.ids)}
+        index._vectors = _Growable(segment.vectors)
+        if segment.scales is not None:
+            index._scales = _Growable(segment.scales)
+        index.trained_size = segment.meta['trained_size']
+        if segment.meta['watermark']:
+            index.watermark = datetime.fromisoformat(segment.meta['watermark'])
+        if 'centroids' in segment.arrays:
+            index._set_partition(segment.arrays['centroids'], segment.arrays['assign'])
+        else:
+            index._assign = _Growable(segment.arrays['assign'])
+        return index
+
+
+class IndexRegistry:
+    """Per-process indexes keyed by (tenant_id, project_id, dim).
+
+    ``loader(tenant_id, project_id, dim, since)`` must return
+    ``(ids, matrix, newest_created_at)`` for rows created at or after
+    ``since`` (all rows when ``since`` is None). Indexes pull rows written by
+    other workers at most every ``refresh_seconds``.
+
+    The registry lock only guards the dicts. Loading, training, catching up
+    and adding run under a lock per key, so a tenant whose index is being
+    built does not stall lookups of the others, and searches run unlocked.
+    """
+
+    def __init__(self, loader, snapshot_dir=None, refresh_seconds=5.0, overlap_seconds=60.0):
+        self._loader = loader
+        self.snapshot_dir = snapshot_dir
+        self.refresh_seconds = refresh_seconds
+        self.overlap_seconds = overlap_seconds
+        self._indexes = {}
+        self._refreshed = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _snapshot_path(self, key):
+        digest = hashlib.sha1('\x1f'.join(map(str, key)).encode('utf-8')).hexdigest()
+        return os.path.join(self.snapshot_dir, digest + '.seg')
+
+    def _lookup(self, key):
+        """``(index or None, is it fresh, the key's lock)``."""
+        with self._lock:
+            index = self._indexes.get(key)
+            fresh = index is not None and time.monotonic() - self._refreshed[key] < self.refresh_seconds
+            return index, fresh, self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, tenant_id, project_id, dim):
+        key = (tenant_id, project_id, dim)
+        index, fresh, key_lock = self._lookup(key)
+        if fresh:
+            return index
+        with key_lock:
+            # Another thread may have loaded or refreshed it meanwhile
+            index, fresh, _ = self._lookup(key)
+            if fresh:
+                return index
+            if index is None:
+                index = self._open(key)
+            else:
+                self._catch_up(key, index)
+            with self._lock:
+                self._indexes[key] = index
+                self._refreshed[key] = time.monotonic()
+            return index
+
+    def _open(self, key):
+        if self.snapshot_dir and os.path.exists(self._snapshot_path(key)):
+            index = IVFIndex.load(self._snapshot_path(key))
+            self._catch_up(key, index)
+            return index
+        index = IVFIndex(key[2])
+        ids, matrix, newest = self._loader(*key, None)
+        index.add(ids, matrix, newest)
+        self.save(key, index)
+        return index
+
+    def _catch_up(self, key, index):
+        since = index.watermark
+        if since is not None:
+            # Overlap tolerates clock skew between writers; duplicates are skipped
+            since = since - timedelta(seconds=self.overlap_seconds)
+        ids, matrix, newest = self._loader(*key, since)
+        if ids:
+            index.add(ids, matrix, newest)
+
+    def add(self, tenant_id, project_id, row_id, vector, created_at):
+        """Fold a freshly inserted row into an already loaded index."""
+        key = (tenant_id, project_id, len(vector))
+        with self._lock:
+            index = self._indexes.get(key)
+            key_lock = self._key_locks.get(key)
+        if index is not None:
+            with key_lock:
+                index.add([row_id], np.asarray(vector, dtype=np.float32), created_at)
+
+    def save(self, key, index):
+        if self.snapshot_dir:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            index.save(self._snapshot_path(key))
+
+    def save_all(self):
+        with self._lock:
+            loaded = [(key, index, self._key_locks[key]) for key, index in self._indexes.items()]
+        for key, index, key_lock in loaded:
+            with key_lock:
+                self.save(key, index)
+        return len(loaded)
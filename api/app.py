@@ -6,11 +6,21 @@ A scalable RAG (Retrieval-Augmented Generation) platform with multi-tenant archi
 
 import os
 import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
 from dotenv import load_dotenv
 
+from api import hybrid, ingest, vectors
+
+try:
+    from api import ann
+except ImportError:  # NumPy not installed: exact search only
+    ann = None
+
 # Load environment variables
 load_dotenv()
 
@@ -32,6 +42,13 @@ app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
 # Initialize SQLAlchemy
 db = SQLAlchemy(app)
 
+# Upper bound on results per similarity search
+MAX_SEARCH_K = int(os.getenv('MAX_SEARCH_K', '100'))
+# Upper bound on query vectors per batch search
+MAX_SEARCH_BATCH = int(os.getenv('MAX_SEARCH_BATCH', '256'))
+# Upper bound on documents per ingest request
+MAX_INGEST_DOCUMENTS = int(os.getenv('MAX_INGEST_DOCUMENTS', '100'))
+
 # Models
 class Embedding(db.Model):
     __tablename__ = 'embeddings'
@@ -40,9 +57,12 @@ class Embedding(db.Model):
     id = db.Column(db.String(36), primary_key=True)
     tenant_id = db.Column(db.String(255), nullable=False, index=True)
     project_id = db.Column(db.String(255), nullable=False, index=True)
-    embedding = db.Column(db.JSON, nullable=False)
+    # Packed little-endian float32, see api/vectors.py
+    embedding = db.Column(db.LargeBinary, nullable=False)
+    dim = db.Column(db.Integer, nullable=False)
     content = db.Column(db.Text, nullable=False)
-    metadata = db.Column(db.JSON)
+    # 'metadata' is reserved on declarative models, so map it under another name
+    meta = db.Column('metadata', db.JSON)
     source = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
@@ -53,11 +73,61 @@ class FeedbackEntry(db.Model):
     id = db.Column(db.String(36), primary_key=True)
     tenant_id = db.Column(db.String(255), nullable=False, index=True)
     user_id = db.Column(db.String(255), nullable=False, index=True)
-    document_id = db.Column(db.String(36), db.ForeignKey('rag_memory.embeddings.id'), index=True)
+    document_id = db.Column(db.String(36), db.ForeignKey('chat_memory.embeddings.id'), index=True)
     feedback = db.Column(db.JSON, nullable=False)
     signal = db.Column(db.String(50), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
+def load_embeddings(tenant_id, project_id, dim, since=None):
+    """Rows for an ANN index: (ids, float32 matrix, newest created_at)."""
+    query = (
+        db.session.query(Embedding.id, Embedding.embedding, Embedding.created_at)
+        .filter_by(tenant_id=tenant_id, project_id=project_id, dim=dim)
+    )
+    if since is not None:
+        query = query.filter(Embedding.created_at >= since)
+    rows = query.all()
+    matrix = vectors.np.frombuffer(b''.join(r[1] for r in rows), dtype='<f4').reshape(len(rows), dim)
+    newest = max((r[2] for r in rows if r[2] is not None), default=None)
+    return [r[0] for r in rows], matrix, newest
+
+# In-process ANN indexes (cosine only); VECTOR_SEARCH_MODE=exact disables them
+ann_registry = None
+if ann is not None and os.getenv('VECTOR_SEARCH_MODE', 'ann') != 'exact':
+    ann_registry = ann.IndexRegistry(
+        load_embeddings,
+        snapshot_dir=os.getenv('ANN_SNAPSHOT_DIR'),
+        refresh_seconds=float(os.getenv('ANN_REFRESH_SECONDS', '5')),
+    )
+
+def load_feedback_scores(tenant_id, since):
+    """Feedback sums per document_id for hybrid.FeedbackBoosts: (scores, newest updated_at)."""
+    params = {'tenant_id': tenant_id, 'since': since}
+    query = hybrid.feedback_scores_sql(':tenant_id', ':since' if since is not None else None)
+    rows = db.session.execute(text(query), params).fetchall()
+    newest = max((r[2] for r in rows if r[2] is not None), default=None)
+    return {r[0]: int(r[1]) for r in rows}, newest
+
+feedback_boosts = hybrid.FeedbackBoosts(
+    load_feedback_scores,
+    refresh_seconds=float(os.getenv('FEEDBACK_BOOST_REFRESH_SECONDS', '30')),
+)
+
+# Runs the keyword side of hybrid searches alongside the vector side
+keyword_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('HYBRID_KEYWORD_THREADS', '4')), thread_name_prefix='hybrid-keyword'
+)
+
+def keyword_candidates(engine, tenant_id, project_id, query, limit):
+    """Best-first embedding ids matching ``query`` (full-text, websearch syntax)"""
+    sql = hybrid.KEYWORD_SQL.format(tenant=':tenant_id', project=':project_id', query=':query', limit=':limit')
+    # Own connection: this runs in keyword_executor, outside the request's session
+    with engine.connect() as conn:
+        rows = conn.execute(text(sql), {
+            'tenant_id': tenant_id, 'project_id': project_id, 'query': query, 'limit': limit,
+        }).fetchall()
+    return [r[0] for r in rows]
+
 # Helper function to get tenant ID from headers
 def get_tenant_id():
     """Extract tenant ID from X-Tenant-ID header"""
@@ -117,17 +187,48 @@ def create_memory():
     tenant_id = get_tenant_id()
     
     try:
-        # For now, just return a stub response
-        # In production, this would save to the database
         data = request.get_json() or {}
-        
+        tenant_id = tenant_id or data.get('tenant_id')
+        project_id = data.get('project_id')
+        content = data.get('content')
+        if not tenant_id or not project_id or not content:
+            return jsonify({
+                'status': 'error',
+                'message': 'tenant_id (or X-Tenant-ID), project_id and content are required'
+            }), 400
+        try:
+            values = vectors.parse_vector(data.get('embedding'))
+        except vectors.VectorError as e:
+            return jsonify({'status': 'error', 'message': f'embedding: {e}'}), 400
+
+        entry = Embedding(
+            id=str(data.get('id') or uuid.uuid4()),
+            tenant_id=tenant_id,
+            project_id=project_id,
+            embedding=vectors.pack(values),
+            dim=len(values),
+            content=content,
+            meta=data.get('metadata') or {},
+            source=data.get('source'),
+        )
+        db.session.add(entry)
+        db.session.commit()
+        if ann_registry is not None:
+            ann_registry.add(tenant_id, project_id, entry.id, values, entry.created_at)
+
         return jsonify({
             'status': 'success',
-            'message': 'Memory endpoint - POST (stub)',
+            'message': 'Memory saved successfully',
             'tenant_id': tenant_id,
-            'data': data
+            'data': {
+                'id': entry.id,
+                'project_id': project_id,
+                'dim': entry.dim,
+                'source': entry.source,
+            }
         }), 201
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error in create_memory: {e}")
         return jsonify({
             'status': 'error',
@@ -135,6 +236,301 @@ def create_memory():
             'error': str(e)
         }), 500
 
+def hit_results(hit_lists):
+    """Attach content to ``(id, score)`` hit lists with one query for all of them"""
+    # Fetch content only for the winners, not for every scanned row
+    hit_ids = {hit_id for hits in hit_lists for hit_id, _ in hits}
+    by_id = {}
+    if hit_ids:
+        by_id = {e.id: e for e in Embedding.query.filter(Embedding.id.in_(list(hit_ids)))}
+    out = []
+    for hits in hit_lists:
+        results = []
+        for hit_id, score in hits:
+            entry = by_id.get(hit_id)
+            if entry is None:
+                continue
+            results.append({
+                'id': hit_id,
+                'score': score,
+                'content': entry.content,
+                'source': entry.source,
+                'metadata': entry.meta or {},
+                'created_at': entry.created_at.isoformat() if entry.created_at else None,
+            })
+        out.append(results)
+    return out
+
+def vector_search(tenant_id, project_id, query, k, nprobe, metric, exact):
+    """Top-k hits for one query vector; returns (hits, scanned, mode)"""
+    if ann_registry is not None and metric == 'cosine' and not exact:
+        index = ann_registry.get(tenant_id, project_id, len(query))
+        nprobe = nprobe if nprobe is not None else index.nprobe
+        hits = index.search(query, k=k, nprobe=nprobe)
+        mode = 'ann' if index.nlist and nprobe < index.nlist else 'exact'
+        return hits, len(index), mode
+    rows = (
+        db.session.query(Embedding.id, Embedding.embedding)
+        .filter_by(tenant_id=tenant_id, project_id=project_id, dim=len(query))
+        .all()
+    )
+    hits = vectors.top_k(
+        query, [r[0] for r in rows], [r[1] for r in rows], k=k, metric=metric
+    )
+    return hits, len(rows), 'exact'
+
+@app.route('/memory/search', methods=['POST'])
+def search_memory():
+    """Top-k similarity search over a tenant/project's embeddings"""
+    tenant_id = get_tenant_id()
+    
+    try:
+        data = request.get_json() or {}
+        tenant_id = tenant_id or data.get('tenant_id')
+        project_id = data.get('project_id')
+        if not tenant_id or not project_id:
+            return jsonify({
+                'status': 'error',
+                'message': 'tenant_id (or X-Tenant-ID) and project_id are required'
+            }), 400
+        try:
+            query = vectors.parse_vector(data.get('vector'))
+            k = int(data.get('k', 10))
+            nprobe = int(data['nprobe']) if data.get('nprobe') is not None else None
+            metric = data.get('metric', 'cosine')
+            if metric not in vectors.METRICS:
+                raise vectors.VectorError(f'metric must be one of {", ".join(vectors.METRICS)}')
+        except (vectors.VectorError, TypeError, ValueError) as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        k = max(1, min(k, MAX_SEARCH_K))
+
+        hits, scanned, mode = vector_search(
+            tenant_id, project_id, query, k, nprobe, metric, data.get('exact')
+        )
+
+        results = hit_results([hits])[0]
+
+        return jsonify({
+            'status': 'success',
+            'tenant_id': tenant_id,
+            'project_id': project_id,
+            'metric': metric,
+            'mode': mode,
+            'scanned': scanned,
+            'count': len(results),
+            'data': results
+        }), 200
+    except Exception as e:
+        logger.error(f"Error in search_memory: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+@app.route('/memory/search/batch', methods=['POST'])
+def search_memory_batch():
+    """Top-k similarity search for many query vectors in one matrix multiply"""
+    tenant_id = get_tenant_id()
+    
+    try:
+        data = request.get_json() or {}
+        tenant_id = tenant_id or data.get('tenant_id')
+        project_id = data.get('project_id')
+        if not tenant_id or not project_id:
+            return jsonify({
+                'status': 'error',
+                'message': 'tenant_id (or X-Tenant-ID) and project_id are required'
+            }), 400
+        try:
+            raw = data.get('vectors')
+            if not isinstance(raw, list) or not raw:
+                raise vectors.VectorError('vectors must be a non-empty list of vectors')
+            if len(raw) > MAX_SEARCH_BATCH:
+                raise vectors.VectorError(f'at most {MAX_SEARCH_BATCH} vectors per batch')
+            queries = [vectors.parse_vector(v) for v in raw]
+            dim = len(queries[0])
+            if any(len(q) != dim for q in queries):
+                raise vectors.VectorError('all vectors must have the same dimension')
+            k = int(data.get('k', 10))
+            nprobe = int(data['nprobe']) if data.get('nprobe') is not None else None
+            metric = data.get('metric', 'cosine')
+            if metric not in vectors.METRICS:
+                raise vectors.VectorError(f'metric must be one of {", ".join(vectors.METRICS)}')
+        except (vectors.VectorError, TypeError, ValueError) as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        k = max(1, min(k, MAX_SEARCH_K))
+
+        if ann_registry is not None and metric == 'cosine' and not data.get('exact'):
+            index = ann_registry.get(tenant_id, project_id, dim)
+            nprobe = nprobe if nprobe is not None else index.nprobe
+            hit_lists = index.search_batch(queries, k=k, nprobe=nprobe)
+            scanned = len(index)
+            mode = 'ann' if index.nlist and nprobe < index.nlist else 'exact'
+        else:
+            rows = (
+                db.session.query(Embedding.id, Embedding.embedding)
+                .filter_by(tenant_id=tenant_id, project_id=project_id, dim=dim)
+                .all()
+            )
+            hit_lists = vectors.top_k_batch(
+                queries, [r[0] for r in rows], [r[1] for r in rows], k=k, metric=metric
+            )
+            scanned = len(rows)
+            mode = 'exact'
+
+        results = hit_results(hit_lists)
+        return jsonify({
+            'status': 'success',
+            'tenant_id': tenant_id,
+            'project_id': project_id,
+            'metric': metric,
+            'mode': mode,
+            'scanned': scanned,
+            'count': len(results),
+            'data': [{'count': len(r), 'data': r} for r in results]
+        }), 200
+    except Exception as e:
+        logger.error(f"Error in search_memory_batch: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+@app.route('/memory/search/hybrid', methods=['POST'])
+def search_memory_hybrid():
+    """Keyword and vector candidates fused by reciprocal rank, boosted by feedback"""
+    tenant_id = get_tenant_id()
+    
+    try:
+        data = request.get_json() or {}
+        tenant_id = tenant_id or data.get('tenant_id')
+        project_id = data.get('project_id')
+        if not tenant_id or not project_id:
+            return jsonify({
+                'status': 'error',
+                'message': 'tenant_id (or X-Tenant-ID) and project_id are required'
+            }), 400
+        try:
+            query, vector, k, candidates = hybrid.parse_request(data, MAX_SEARCH_K)
+            nprobe = int(data['nprobe']) if data.get('nprobe') is not None else None
+            metric = data.get('metric', 'cosine')
+            if metric not in vectors.METRICS:
+                raise vectors.VectorError(f'metric must be one of {", ".join(vectors.METRICS)}')
+        except (vectors.VectorError, TypeError, ValueError) as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+
+        keyword_future = None
+        if query:
+            keyword_future = keyword_executor.submit(
+                keyword_candidates, db.engine, tenant_id, project_id, query, candidates
+            )
+        vector_ids, mode = [], None
+        if vector is not None:
+            hits, _, mode = vector_search(
+                tenant_id, project_id, vector, candidates, nprobe, metric, data.get('exact')
+            )
+            vector_ids = [hit_id for hit_id, _ in hits]
+        boosts = feedback_boosts.get(tenant_id)
+        keyword_ids = keyword_future.result() if keyword_future is not None else []
+
+        fused = hybrid.fuse(keyword_ids, vector_ids, boosts, k)
+        results = hit_results([[(r['id'], r['score']) for r in fused]])[0]
+        ranks = {r['id']: r for r in fused}
+        for result in results:
+            found = ranks[result['id']]
+            result.update(
+                keyword_rank=found['keyword_rank'],
+                vector_rank=found['vector_rank'],
+                feedback=found['feedback'],
+            )
+
+        return jsonify({
+            'status': 'success',
+            'tenant_id': tenant_id,
+            'project_id': project_id,
+            'metric': metric,
+            'mode': mode,
+            'keyword_candidates': len(keyword_ids),
+            'vector_candidates': len(vector_ids),
+            'count': len(results),
+            'data': results
+        }), 200
+    except Exception as e:
+        logger.error(f"Error in search_memory_hybrid: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+@app.route('/memory/ingest', methods=['POST'])
+def ingest_documents():
+    """Chunk, embed and store documents, skipping chunks already stored (api/ingest.py)"""
+    tenant_id = get_tenant_id()
+    
+    try:
+        data = request.get_json() or {}
+        tenant_id = tenant_id or data.get('tenant_id')
+        project_id = data.get('project_id')
+        documents = data.get('documents')
+        if not tenant_id or not project_id:
+            return jsonify({
+                'status': 'error',
+                'message': 'tenant_id (or X-Tenant-ID) and project_id are required'
+            }), 400
+        if not isinstance(documents, list) or not documents:
+            return jsonify({'status': 'error', 'message': 'documents must be a non-empty list'}), 400
+        if len(documents) > MAX_INGEST_DOCUMENTS:
+            return jsonify({
+                'status': 'error',
+                'message': f'at most {MAX_INGEST_DOCUMENTS} documents per request'
+            }), 400
+        if not all(isinstance(d, dict) and isinstance(d.get('content'), str) for d in documents):
+            return jsonify({'status': 'error', 'message': 'each document needs a content string'}), 400
+
+        conn = db.engine.raw_connection()
+        try:
+            stats = ingest.ingest(conn, tenant_id, project_id, (
+                (d['content'], d.get('source'), d.get('metadata') or {}) for d in documents
+            ))
+        finally:
+            conn.close()
+
+        return jsonify({
+            'status': 'success',
+            'tenant_id': tenant_id,
+            'project_id': project_id,
+            'data': stats
+        }), 200
+    except Exception as e:
+        logger.error(f"Error in ingest_documents: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+@app.route('/memory/index/snapshot', methods=['POST'])
+def snapshot_memory_index():
+    """Write this worker's ANN indexes to ANN_SNAPSHOT_DIR"""
+    if ann_registry is None or not ann_registry.snapshot_dir:
+        return jsonify({
+            'status': 'error',
+            'message': 'ANN indexes or ANN_SNAPSHOT_DIR not configured'
+        }), 400
+    try:
+        saved = ann_registry.save_all()
+        return jsonify({'status': 'success', 'indexes': saved}), 200
+    except Exception as e:
+        logger.error(f"Error in snapshot_memory_index: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
 @app.route('/feedback', methods=['GET'])
 def get_feedback():
     """Get feedback entries"""
@@ -190,6 +586,10 @@ def root():
         'endpoints': {
             'health': '/health',
             'memory': '/memory',
+            'memory_search': '/memory/search',
+            'memory_search_batch': '/memory/search/batch',
+            'memory_search_hybrid': '/memory/search/hybrid',
+            'memory_ingest': '/memory/ingest',
             'feedback': '/feedback'
         }
     }), 200
@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+"""
+Apex MVP - RAG Platform API (asyncio)
+The routes of api/app.py on Quart with an asyncpg connection pool, so requests
+waiting on Postgres multiplex on one event loop instead of each holding a
+gunicorn worker thread. Run one event loop per core with:
+
+    gunicorn -k uvicorn.workers.UvicornWorker -w $(nproc) api.async_app:app
+
+NumPy scoring and ANN index maintenance run in the default thread pool so
+they never block the loop.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import uuid
+from datetime import datetime, timezone
+
+import asyncpg
+from dotenv import load_dotenv
+from quart import Quart, jsonify, request
+
+from api import hybrid, ingest, vectors
+
+try:
+    from api import ann
+except ImportError:  # NumPy not installed: exact search only
+    ann = None
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Initialize Quart app
+app = Quart(__name__)
+
+# Upper bound on results per similarity search
+MAX_SEARCH_K = int(os.getenv('MAX_SEARCH_K', '100'))
+# Upper bound on query vectors per batch search
+MAX_SEARCH_BATCH = int(os.getenv('MAX_SEARCH_BATCH', '256'))
+# Upper bound on documents per ingest request
+MAX_INGEST_DOCUMENTS = int(os.getenv('MAX_INGEST_DOCUMENTS', '100'))
+
+pool = None
+ann_registry = None
+feedback_boosts = None
+
+
+def database_dsn():
+    """POSTGRES_CONNECTION as a libpq DSN (drops a SQLAlchemy '+driver' suffix)."""
+    return re.sub(r'^postgres(ql)?\+\w+://', 'postgresql://', os.getenv('POSTGRES_CONNECTION', ''))
+
+
+async def _init_connection(conn):
+    # Return json/jsonb columns as Python objects, like SQLAlchemy's JSON type
+    for name in ('json', 'jsonb'):
+        await conn.set_type_codec(name, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+async def fetch_embeddings(tenant_id, project_id, dim, since=None):
+    """Rows for an ANN index: (ids, float32 matrix, newest created_at)."""
+    query = (
+        'SELECT id, embedding, created_at FROM chat_memory.embeddings '
+        'WHERE tenant_id = $1 AND project_id = $2 AND dim = $3'
+    )
+    args = [tenant_id, project_id, dim]
+    if since is not None:
+        query += ' AND created_at >= $4'
+        args.append(since)
+    rows = await pool.fetch(query, *args)
+    matrix = vectors.np.frombuffer(b''.join(r['embedding'] for r in rows), dtype='<f4').reshape(len(rows), dim)
+    newest = max((r['created_at'] for r in rows if r['created_at'] is not None), default=None)
+    return [r['id'] for r in rows], matrix, newest
+
+
+async def fetch_feedback_scores(tenant_id, since):
+    """Feedback sums per document_id for hybrid.FeedbackBoosts: (scores, newest updated_at)."""
+    args = [tenant_id]
+    if since is not None:
+        args.append(since)
+    rows = await pool.fetch(hybrid.feedback_scores_sql('$1', '$2' if since is not None else None), *args)
+    newest = max((r['updated_at'] for r in rows if r['updated_at'] is not None), default=None)
+    return {r['document_id']: int(r['score']) for r in rows}, newest
+
+
+def ingest_documents_sync(tenant_id, project_id, documents):
+    """Run the (synchronous, DB-API) ingest pipeline on its own connection.
+
+    Called in a pool thread; the pipeline's batches are committed one by one,
+    which an asyncpg pool connection cannot do from another thread.
+    """
+    # Imported here: only ingestion needs a DB-API driver
+    import psycopg2
+
+    conn = psycopg2.connect(database_dsn())
+    try:
+        return ingest.ingest(conn, tenant_id, project_id, documents)
+    finally:
+        conn.close()
+
+
+async def keyword_candidates(tenant_id, project_id, query, limit):
+    """Best-first embedding ids matching ``query`` (full-text, websearch syntax)"""
+    rows = await pool.fetch(
+        hybrid.KEYWORD_SQL.format(tenant='$1', project='$2', query='$3', limit='$4'),
+        tenant_id, project_id, query, limit,
+    )
+    return [r['id'] for r in rows]
+
+
+@app.before_serving
+async def startup():
+    global pool, ann_registry, feedback_boosts
+    pool = await asyncpg.create_pool(
+        database_dsn(),
+        min_size=int(os.getenv('PG_POOL_MIN_SIZE', '1')),
+        max_size=int(os.getenv('PG_POOL_MAX_SIZE', '10')),
+        max_inactive_connection_lifetime=float(os.getenv('PG_POOL_MAX_AGE', '300')),
+        init=_init_connection,
+    )
+    # In-process ANN indexes (cosine only); VECTOR_SEARCH_MODE=exact disables them
+    if ann is not None and os.getenv('VECTOR_SEARCH_MODE', 'ann') != 'exact':
+        loop = asyncio.get_running_loop()
+
+        def load_embeddings(*args):
+            # Called from a pool thread by the registry: hop back onto the loop
+            return asyncio.run_coroutine_threadsafe(fetch_embeddings(*args), loop).result()
+
+        ann_registry = ann.IndexRegistry(
+            load_embeddings,
+            snapshot_dir=os.getenv('ANN_SNAPSHOT_DIR'),
+            refresh_seconds=float(os.getenv('ANN_REFRESH_SECONDS', '5')),
+        )
+
+    loop = asyncio.get_running_loop()
+
+    def load_feedback_scores(*args):
+        # Called from a pool thread (asyncio.to_thread): hop back onto the loop
+        return asyncio.run_coroutine_threadsafe(fetch_feedback_scores(*args), loop).result()
+
+    feedback_boosts = hybrid.FeedbackBoosts(
+        load_feedback_scores,
+        refresh_seconds=float(os.getenv('FEEDBACK_BOOST_REFRESH_SECONDS', '30')),
+    )
+
+
+@app.after_serving
+async def shutdown():
+    if pool is not None:
+        await pool.close()
+
+
+# Helper function to get tenant ID from headers
+def get_tenant_id():
+    """Extract tenant ID from X-Tenant-ID header"""
+    tenant_id = request.headers.get('X-Tenant-ID')
+    if tenant_id:
+        logger.info(f"Request from tenant: {tenant_id}")
+    else:
+        logger.warning("No X-Tenant-ID header provided")
+    return tenant_id
+
+
+def error_response(where, e):
+    logger.error(f"Error in {where}: {e}")
+    return jsonify({
+        'status': 'error',
+        'message': 'Internal server error',
+        'error': str(e)
+    }), 500
+
+
+# Routes
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint"""
+    try:
+        await pool.fetchval('SELECT 1')
+        return jsonify({
+            'status': 'ok',
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'database': 'connected',
+            'db_pool': {
+                'size': pool.get_size(),
+                'idle': pool.get_idle_size(),
+                'max_size': pool.get_max_size(),
+            }
+        }), 200
+    except Exception as e:
+        logger.error(f"Health check failed: {e}")
+        return jsonify({
+            'status': 'error',
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'database': 'disconnected',
+            'message': f'Database connection failed: {str(e)}'
+        }), 500
+
+
+@app.route('/memory', methods=['GET'])
+async def get_memory():
+    """Get RAG memory entries"""
+    tenant_id = get_tenant_id()
+    # Same stub as the Flask app
+    return jsonify({
+        'status': 'success',
+        'message': 'Memory endpoint - GET (stub)',
+        'tenant_id': tenant_id,
+        'data': []
+    }), 200
+
+
+@app.route('/memory', methods=['POST'])
+async def create_memory():
+    """Create new RAG memory entry"""
+    tenant_id = get_tenant_id()
+
+    try:
+        data = await request.get_json(silent=True) or {}
+        tenant_id = tenant_id or data.get('tenant_id')
+        project_id = data.get('project_id')
+        content = data.get('content')
+        if not tenant_id or not project_id or not content:
+            return jsonify({
+                'status': 'error',
+                'message': 'tenant_id (or X-Tenant-ID), project_id and content are required'
+            }), 400
+        try:
+            values = vectors.parse_vector(data.get('embedding'))
+        except vectors.VectorError as e:
+            return jsonify({'status': 'error', 'message': f'embedding: {e}'}), 400
+
+        entry_id = str(data.get('id') or uuid.uuid4())
+        created_at = datetime.now(timezone.utc)
+        await pool.execute(
+            'INSERT INTO chat_memory.embeddings '
+            '(id, tenant_id, project_id, embedding, dim, content, metadata, source, created_at) '
+            'VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)',
+            entry_id, tenant_id, project_id, vectors.pack(values), len(values),
+            content, data.get('metadata') or {}, data.get('source'), created_at,
+        )
+        if ann_registry is not None:
+            await asyncio.to_thread(
+                ann_registry.add, tenant_id, project_id, entry_id, values, created_at
+            )
+
+        return jsonify({
+            'status': 'success',
+            'message': 'Memory saved successfully',
+            'tenant_id': tenant_id,
+            'data': {
+                'id': entry_id,
+                'project_id': project_id,
+                'dim': len(values),
+                'source': data.get('source'),
+            }
+        }), 201
+    except Exception as e:
+        return error_response('create_memory', e)
+
+
+async def hit_results(hit_lists):
+    """Attach content to ``(id, score)`` hit lists with one query for all of them"""
+    hit_ids = list({hit_id for hits in hit_lists for hit_id, _ in hits})
+    by_id = {}
+    if hit_ids:
+        rows = await pool.fetch(
+            'SELECT id, content, source, metadata, created_at FROM chat_memory.embeddings '
+            'WHERE id = ANY($1::varchar[])',
+            hit_ids,
+        )
+        by_id = {r['id']: r for r in rows}
+    out = []
+    for hits in hit_lists:
+        results = []
+        for hit_id, score in hits:
+            entry = by_id.get(hit_id)
+            if entry is None:
+                continue
+            results.append({
+                'id': hit_id,
+                'score': score,
+                'content': entry['content'],
+                'source': entry['source'],
+                'metadata': entry['metadata'] or {},
+                'created_at': entry['created_at'].isoformat() if entry['created_at'] else None,
+            })
+        out.append(results)
+    return out
+
+
+async def search(tenant_id, project_id, queries, k, nprobe, metric, exact):
+    """Run a (batch) search; returns (hit_lists, scanned, mode)."""
+    dim = len(queries[0])
+    if ann_registry is not None and metric == 'cosine' and not exact:
+        index = await asyncio.to_thread(ann_registry.get, tenant_id, project_id, dim)
+        nprobe = nprobe if nprobe is not None else index.nprobe
+        hit_lists = await asyncio.to_thread(index.search_batch, queries, k, nprobe)
+        mode = 'ann' if index.nlist and nprobe < index.nlist else 'exact'
+        return hit_lists, len(index), mode
+    rows = await pool.fetch(
+        'SELECT id, embedding FROM chat_memory.embeddings '
+        'WHERE tenant_id = $1 AND project_id = $2 AND dim = $3',
+        tenant_id, project_id, dim,
+    )
+    hit_lists = await asyncio.to_thread(
+        vectors.top_k_batch, queries, [r['id'] for r in rows], [r['embedding'] for r in rows], k, metric
+    )
+    return hit_lists, len(rows), 'exact'
+
+
+async def parse_search(batch):
+    """Validated (tenant_id, project_id, queries, k, nprobe, metric, exact) or an error response"""
+    data = await request.get_json(silent=True) or {}
+    tenant_id = get_tenant_id() or data.get('tenant_id')
+    project_id = data.get('project_id')
+    if not tenant_id or not project_id:
+        return None, (jsonify({
+            'status': 'error',
+            'message': 'tenant_id (or X-Tenant-ID) and project_id are required'
+        }), 400)
+    try:
+        if batch:
+            raw = data.get('vectors')
+            if not isinstance(raw, list) or not raw:
+                raise vectors.VectorError('vectors must be a non-empty list of vectors')
+            if len(raw) > MAX_SEARCH_BATCH:
+                raise vectors.VectorError(f'at most {MAX_SEARCH_BATCH} vectors per batch')
+            queries = [vectors.parse_vector(v) for v in raw]
+            if any(len(q) != len(queries[0]) for q in queries):
+                raise vectors.VectorError('all vectors must have the same dimension')
+        else:
+            queries = [vectors.parse_vector(data.get('vector'))]
+        k = int(data.get('k', 10))
+        nprobe = int(data['nprobe']) if data.get('nprobe') is not None else None
+        metric = data.get('metric', 'cosine')
+        if metric not in vectors.METRICS:
+            raise vectors.VectorError(f'metric must be one of {", ".join(vectors.METRICS)}')
+    except (vectors.VectorError, TypeError, ValueError) as e:
+        return None, (jsonify({'status': 'error', 'message': str(e)}), 400)
+    k = max(1, min(k, MAX_SEARCH_K))
+    return (tenant_id, project_id, queries, k, nprobe, metric, bool(data.get('exact'))), None
+
+
+@app.route('/memory/search', methods=['POST'])
+async def search_memory():
+    """Top-k similarity search over a tenant/project's embeddings"""
+    try:
+        params, error = await parse_search(batch=False)
+        if error:
+            return error
+        tenant_id, project_id, _, _, _, metric, _ = params
+        hit_lists, scanned, mode = await search(*params)
+        results = (await hit_results(hit_lists))[0]
+        return jsonify({
+            'status': 'success',
+            'tenant_id': tenant_id,
+            'project_id': project_id,
+            'metric': metric,
+            'mode': mode,
+            'scanned': scanned,
+            'count': len(results),
+            'data': results
+        }), 200
+    except Exception as e:
+        return error_response('search_memory', e)
+
+
+@app.route('/memory/search/batch', methods=['POST'])
+async def search_memory_batch():
+    """Top-k similarity search for many query vectors in one matrix multiply"""
+    try:
+        params, error = await parse_search(batch=True)
+        if error:
+            return error
+        tenant_id, project_id, _, _, _, metric, _ = params
+        hit_lists, scanned, mode = await search(*params)
+        results = await hit_results(hit_lists)
+        return jsonify({
+            'status': 'success',
+            'tenant_id': tenant_id,
+            'project_id': project_id,
+            'metric': metric,
+            'mode': mode,
+            'scanned': scanned,
+            'count': len(results),
+            'data': [{'count': len(r), 'data': r} for r in results]
+        }), 200
+    except Exception as e:
+        return error_response('search_memory_batch', e)
+
+
+@app.route('/memory/search/hybrid', methods=['POST'])
+async def search_memory_hybrid():
+    """Keyword and vector candidates fused by reciprocal rank, boosted by feedback"""
+    try:
+        data = await request.get_json(silent=True) or {}
+        tenant_id = get_tenant_id() or data.get('tenant_id')
+        project_id = data.get('project_id')
+        if not tenant_id or not project_id:
+            return jsonify({
+                'status': 'error',
+                'message': 'tenant_id (or X-Tenant-ID) and project_id are required'
+            }), 400
+        try:
+            query, vector, k, candidates = hybrid.parse_request(data, MAX_SEARCH_K)
+            nprobe = int(data['nprobe']) if data.get('nprobe') is not None else None
+            metric = data.get('metric', 'cosine')
+            if metric not in vectors.METRICS:
+                raise vectors.VectorError(f'metric must be one of {", ".join(vectors.METRICS)}')
+        except (vectors.VectorError, TypeError, ValueError) as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+
+        async def no_candidates():
+            return None
+
+        # Both retrievers and the boost lookup run concurrently
+        keyword_ids, vector_search, boosts = await asyncio.gather(
+            keyword_candidates(tenant_id, project_id, query, candidates) if query else no_candidates(),
+            search(tenant_id, project_id, [vector], candidates, nprobe, metric, bool(data.get('exact')))
+            if vector is not None else no_candidates(),
+            asyncio.to_thread(feedback_boosts.get, tenant_id),
+        )
+        keyword_ids = keyword_ids or []
+        vector_ids, mode = [], None
+        if vector_search is not None:
+            hit_lists, _, mode = vector_search
+            vector_ids = [hit_id for hit_id, _ in hit_lists[0]]
+
+        fused = hybrid.fuse(keyword_ids, vector_ids, boosts, k)
+        results = (await hit_results([[(r['id'], r['score']) for r in fused]]))[0]
+        ranks = {r['id']: r for r in fused}
+        for result in results:
+            found = ranks[result['id']]
+            result.update(
+                keyword_rank=found['keyword_rank'],
+                vector_rank=found['vector_rank'],
+                feedback=found['feedback'],
+            )
+
+        return jsonify({
+            'status': 'success',
+            'tenant_id': tenant_id,
+            'project_id': project_id,
+            'metric': metric,
+            'mode': mode,
+            'keyword_candidates': len(keyword_ids),
+            'vector_candidates': len(vector_ids),
+            'count': len(results),
+            'data': results
+        }), 200
+    except Exception as e:
+        return error_response('search_memory_hybrid', e)
+
+
+@app.route('/memory/ingest', methods=['POST'])
+async def ingest_documents():
+    """Chunk, embed and store documents, skipping chunks already stored (api/ingest.py)"""
+    tenant_id = get_tenant_id()
+
+    try:
+        data = await request.get_json(silent=True) or {}
+        tenant_id = tenant_id or data.get('tenant_id')
+        project_id = data.get('project_id')
+        documents = data.get('documents')
+        if not tenant_id or not project_id:
+            return jsonify({
+                'status': 'error',
+                'message': 'tenant_id (or X-Tenant-ID) and project_id are required'
+            }), 400
+        if not isinstance(documents, list) or not documents:
+            return jsonify({'status': 'error', 'message': 'documents must be a non-empty list'}), 400
+        if len(documents) > MAX_INGEST_DOCUMENTS:
+            return jsonify({
+                'status': 'error',
+                'message': f'at most {MAX_INGEST_DOCUMENTS} documents per request'
+            }), 400
+        if not all(isinstance(d, dict) and isinstance(d.get('content'), str) for d in documents):
+            return jsonify({'status': 'error', 'message': 'each document needs a content string'}), 400
+
+        # Chunking, embedding and the bulk loads all block: keep them off the loop
+        stats = await asyncio.to_thread(ingest_documents_sync, tenant_id, project_id, [
+            (d['content'], d.get('source'), d.get('metadata') or {}) for d in documents
+        ])
+
+        return jsonify({
+            'status': 'success',
+            'tenant_id': tenant_id,
+            'project_id': project_id,
+            'data': stats
+        }), 200
+    except Exception as e:
+        return error_response('ingest_documents', e)
+
+
+@app.route('/memory/index/snapshot', methods=['POST'])
+async def snapshot_memory_index():
+    """Write this worker's ANN indexes to ANN_SNAPSHOT_DIR"""
+    if ann_registry is None or not ann_registry.snapshot_dir:
+        return jsonify({
+            'status': 'error',
+            'message': 'ANN indexes or ANN_SNAPSHOT_DIR not configured'
+        }), 400
+    try:
+        saved = await asyncio.to_thread(ann_registry.save_all)
+        return jsonify({'status': 'success', 'indexes': saved}), 200
+    except Exception as e:
+        return error_response('snapshot_memory_index', e)
+
+
+@app.route('/feedback', methods=['GET'])
+async def get_feedback():
+    """Get feedback entries"""
+    tenant_id = get_tenant_id()
+    # Same stub as the Flask app
+    return jsonify({
+        'status': 'success',
+        'message': 'Feedback endpoint - GET (stub)',
+        'tenant_id': tenant_id,
+        'data': []
+    }), 200
+
+
+@app.route('/feedback', methods=['POST'])
+async def create_feedback():
+    """Create new feedback entry"""
+    tenant_id = get_tenant_id()
+    # Same stub as the Flask app
+    data = await request.get_json(silent=True) or {}
+    return jsonify({
+        'status': 'success',
+        'message': 'Feedback endpoint - POST (stub)',
+        'tenant_id': tenant_id,
+        'data': data
+    }), 201
+
+
+@app.route('/', methods=['GET'])
+async def root():
+    """Root endpoint"""
+    return jsonify({
+        'message': 'Apex MVP API',
+        'version': '1.0.0',
+        'endpoints': {
+            'health': '/health',
+            'memory': '/memory',
+            'memory_search': '/memory/search',
+            'memory_search_batch': '/memory/search/batch',
+            'memory_search_hybrid': '/memory/search/hybrid',
+            'memory_ingest': '/memory/ingest',
+            'feedback': '/feedback'
+        }
+    }), 200
+
+
+# Error handlers
+@app.errorhandler(404)
+async def not_found(error):
+    return jsonify({
+        'status': 'error',
+        'message': 'Endpoint not found'
+    }), 404
+
+
+@app.errorhandler(500)
+async def internal_error(error):
+    return jsonify({
+        'status': 'error',
+        'message': 'Internal server error'
+    }), 500
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
@@ -0,0 +1,185 @@
+"""
+Hybrid retrieval: keyword and vector candidates fused with reciprocal rank
+fusion (RRF), then boosted by user feedback.
+
+Full-text search finds passages sharing the query's words (names, codes,
+rare terms) that an embedding may blur; vector search finds paraphrases with
+no word in common. Each retriever returns its best ``candidates`` ids, and a
+document scores ``sum(1 / (rrf_k + rank))`` over the lists it appears in, so
+neither retriever's raw scores (ts_rank vs cosine) need calibrating against
+the other's.
+
+The fused score is then multiplied by ``1 + FEEDBACK_BOOST_WEIGHT *
+tanh(feedback / FEEDBACK_BOOST_SCALE)``, where ``feedback`` is the document's
+signal_strength-weighted thumbs up minus thumbs down from
+rag_feedback.entries. Those sums come from :class:`FeedbackBoosts`, a
+per-process cache refreshed incrementally, so queries never join the
+feedback table.
+"""
+
+import math
+import os
+import threading
+import time
+from datetime import timedelta
+
+from api import vectors
+
+RRF_K = int(os.getenv('HYBRID_RRF_K', '60'))
+# Candidates taken from each retriever before fusion
+DEFAULT_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '50'))
+MAX_CANDIDATES = int(os.getenv('HYBRID_MAX_CANDIDATES', '500'))
+MAX_QUERY_LENGTH = 256
+BOOST_WEIGHT = float(os.getenv('FEEDBACK_BOOST_WEIGHT', '0.5'))
+BOOST_SCALE = float(os.getenv('FEEDBACK_BOOST_SCALE', '10'))
+
+# Keyword candidates, best first (same English config as the generated column)
+KEYWORD_SQL = """
+    SELECT id FROM chat_memory.embeddings
+    WHERE tenant_id = {tenant} AND project_id = {project}
+        AND content_tsv @@ websearch_to_tsquery('english', {query})
+    ORDER BY ts_rank_cd(content_tsv, websearch_to_tsquery('english', {query}), 32) DESC, id
+    LIMIT {limit}
+"""
+
+# Feedback sum per document of a tenant. {since} is empty for a full load or
+# restricts the aggregate to documents with entries updated since the
+# watermark; every such document is re-summed over all its entries.
+FEEDBACK_SCORES_SQL = """
+    SELECT document_id,
+        SUM(CASE user_feedback
+            WHEN 'thumbs_up' THEN COALESCE(signal_strength, 1)
+            WHEN 'thumbs_down' THEN -COALESCE(signal_strength, 1)
+            ELSE 0 END) AS score,
+        MAX(updated_at) AS updated_at
+    FROM rag_feedback.entries
+    WHERE tenant_id = {tenant} AND document_id IS NOT NULL{since}
+    GROUP BY document_id
+"""
+FEEDBACK_SINCE_SQL = """
+        AND document_id IN (
+            SELECT document_id FROM rag_feedback.entries
+            WHERE tenant_id = {tenant} AND document_id IS NOT NULL AND updated_at >= {watermark}
+        )"""
+
+
+def feedback_scores_sql(tenant, watermark=None):
+    """:data:`FEEDBACK_SCORES_SQL` with the driver's placeholders filled in."""
+    since = FEEDBACK_SINCE_SQL.format(tenant=tenant, watermark=watermark) if watermark else ''
+    return FEEDBACK_SCORES_SQL.format(tenant=tenant, since=since)
+
+
+def parse_request(data, max_k):
+    """Validated ``(query, vector, k, candidates)`` from a request body.
+
+    Either ``query`` (text for the keyword side) or ``vector`` may be left
+    out, which leaves that side's candidate list empty. Raises ``ValueError``.
+    """
+    query = data.get('query')
+    if query is not None:
+        if not isinstance(query, str):
+            raise ValueError('query must be a string')
+        query = query.strip() or None
+        if query and len(query) > MAX_QUERY_LENGTH:
+            raise ValueError(f'query must be at most {MAX_QUERY_LENGTH} characters')
+    vector = vectors.parse_vector(data['vector']) if data.get('vector') is not None else None
+    if query is None and vector is None:
+        raise ValueError('query and/or vector is required')
+    k = max(1, min(int(data.get('k', 10)), max_k))
+    candidates = max(k, min(int(data.get('candidates', DEFAULT_CANDIDATES)), MAX_CANDIDATES))
+    return query, vector, k, candidates
+
+
+def boost_factor(feedback):
+    """Multiplier for a document's fused score, in (1 - weight, 1 + weight)."""
+    if not feedback:
+        return 1.0
+    return 1.0 + BOOST_WEIGHT * math.tanh(feedback / BOOST_SCALE)
+
+
+def fuse(keyword_ids, vector_ids, feedback, limit, rrf_k=RRF_K):
+    """Fuse two best-first id lists; returns up to ``limit`` result dicts, best first.
+
+    Each dict has ``id``, ``score`` and, for explaining the ranking,
+    ``keyword_rank``/``vector_rank`` (1-based, ``None`` when absent) and the
+    document's ``feedback`` sum.
+    """
+    ranks = {}
+    for field, ids in (('keyword_rank', keyword_ids), ('vector_rank', vector_ids)):
+        for position, doc_id in enumerate(ids, 1):
+            ranks.setdefault(doc_id, {'keyword_rank': None, 'vector_rank': None})[field] = position
+    results = []
+    for doc_id, found in ranks.items():
+        rrf = sum(1.0 / (rrf_k + rank) for rank in found.values() if rank is not None)
+        signal = feedback.get(doc_id, 0)
+        results.append(dict(found, id=doc_id, score=rrf * boost_factor(signal), feedback=signal))
+    results.sort(key=lambda r: (-r['score'], r['id']))
+    return results[:limit]
+
+
+class FeedbackBoosts:
+    """Per-process feedback sums per (tenant_id, document_id).
+
+    ``loader(tenant_id, since)`` must return ``(scores, newest_updated_at)``
+    where ``scores`` maps document_id to its feedback sum over all of its
+    entries, for every document with an entry updated at or after ``since``
+    (every document when ``since`` is None). A tenant is loaded in full on
+    first use, caught up at most every ``refresh_seconds`` and reloaded in
+    full every ``reload_seconds`` (which drops documents whose feedback was
+    deleted, e.g. by partition expiry).
+
+    :meth:`get` returns a dict that is replaced, never mutated, on refresh.
+    The loader runs under a lock per tenant, not the registry lock, so one
+    tenant's slow query does not hold up the others.
+    """
+
+    def __init__(self, loader, refresh_seconds=30.0, reload_seconds=3600.0, overlap_seconds=60.0):
+        self._loader = loader
+        self.refresh_seconds = refresh_seconds
+        self.reload_seconds = reload_seconds
+        self.overlap_seconds = overlap_seconds
+        # tenant_id -> (scores, watermark, refreshed_at, loaded_at)
+        self._tenants = {}
+        self._tenant_locks = {}
+        self._lock = threading.Lock()
+
+    def _due(self, tenant_id):
+        """``(entry or None, whether it needs loading, the tenant's lock)``."""
+        with self._lock:
+            now = time.monotonic()
+            entry = self._tenants.get(tenant_id)
+            due = (
+                entry is None
+                or now - entry[3] >= self.reload_seconds
+                or now - entry[2] >= self.refresh_seconds
+            )
+            return entry, due, self._tenant_locks.setdefault(tenant_id, threading.Lock())
+
+    def get(self, tenant_id):
+        entry, due, tenant_lock = self._due(tenant_id)
+        if not due:
+            return entry[0]
+        with tenant_lock:
+            # Another thread may have refreshed it meanwhile
+            entry, due, _ = self._due(tenant_id)
+            if not due:
+                return entry[0]
+            now = time.monotonic()
+            if entry is None or now - entry[3] >= self.reload_seconds:
+                scores, watermark = self._loader(tenant_id, None)
+                entry = (scores, watermark, now, now)
+            else:
+                scores, watermark, _, loaded_at = entry
+                since = watermark
+                if since is not None:
+                    # Overlap tolerates clock skew and late commits; re-summing is idempotent
+                    since = since - timedelta(seconds=self.overlap_seconds)
+                changed, newest = self._loader(tenant_id, since)
+                if changed:
+                    scores = {**scores, **changed}
+                    watermark = max(w for w in (watermark, newest) if w is not None)
+                entry = (scores, watermark, now, loaded_at)
+            with self._lock:
+                self._tenants[tenant_id] = entry
+            return entry[0]
+
@@ -0,0 +1,324 @@
+"""
+Document ingestion: chunk, deduplicate, embed and bulk-load into chat_memory.embeddings.
+
+Documents are streamed through the pipeline one at a time, so memory use
+does not depend on corpus size:
+
+1. **Chunking** (:func:`chunk_text`) splits a document into sentences and
+   groups them into chunks of ``INGEST_CHUNK_MIN_CHARS`` to
+   ``INGEST_CHUNK_MAX_CHARS`` characters. Boundaries are content-defined: a
+   chunk may end after a sentence whose CRC32 is 0 modulo
+   ``INGEST_CHUNK_DIVISOR``, so where chunks break depends only on nearby
+   text. An edit moves at most the boundaries around it and every other chunk
+   of the document comes out byte-identical. Each chunk starts with up to
+   ``INGEST_CHUNK_OVERLAP_CHARS`` of trailing sentences from the previous one.
+2. **Dedup**: each chunk is hashed (SHA-256 of its whitespace-normalized
+   text). Chunks whose hash is already stored for the tenant/project
+   (``content_hash``, unique per tenant/project, migration 012) or was seen
+   earlier in the run are dropped before they reach the embedder, so
+   re-ingesting a mostly unchanged document costs the chunking, the hashing
+   and one indexed lookup per batch.
+3. **Embedding**: new chunks go to the embedder in batches of
+   ``INGEST_BATCH`` on ``INGEST_WORKERS`` threads, with at most two batches
+   per worker in flight.
+4. **Bulk load**: each embedded batch is one ``INSERT ... SELECT FROM
+   unnest(...)`` with ``ON CONFLICT DO NOTHING`` (as in
+   functions/shared_code/writes.py), committed per batch, so a concurrent or
+   repeated run never duplicates a chunk.
+
+``INGEST_EMBEDDER`` picks the embedder: ``stub`` (default,
+:func:`stub_embedder`, deterministic feature hashing into ``EMBEDDING_DIM``
+dimensions, for tests and local runs) or a ``package.module:function`` path
+to any callable ``embed(texts) -> list of vectors``.
+
+Run with ``python -m api.ingest --tenant T --project P docs/*.md`` (plain
+text files, or ``.jsonl``/``.ndjson`` with one ``{"source", "content",
+"metadata"}`` object per line; ``-`` reads NDJSON from stdin). Both the Flask
+app and the Quart app (api/async_app.py, from a pool thread) expose the same
+pipeline as ``POST /memory/ingest``.
+"""
+
+import hashlib
+import importlib
+import json
+import math
+import os
+import re
+import sys
+import time
+import uuid
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from api import vectors
+
+CHUNK_MIN_CHARS = int(os.getenv('INGEST_CHUNK_MIN_CHARS', '400'))
+CHUNK_MAX_CHARS = int(os.getenv('INGEST_CHUNK_MAX_CHARS', '1600'))
+CHUNK_OVERLAP_CHARS = int(os.getenv('INGEST_CHUNK_OVERLAP_CHARS', '200'))
+# One sentence in this many may end a chunk once it has CHUNK_MIN_CHARS
+CHUNK_DIVISOR = int(os.getenv('INGEST_CHUNK_DIVISOR', '6'))
+BATCH = int(os.getenv('INGEST_BATCH', '64'))
+WORKERS = int(os.getenv('INGEST_WORKERS', '4'))
+EMBEDDING_DIM = int(os.getenv('EMBEDDING_DIM', '384'))
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+|\n\s*\n')
+_WORD = re.compile(r'\w+')
+
+EXISTING_SQL = """
+    SELECT content_hash FROM chat_memory.embeddings
+    WHERE tenant_id = %s AND project_id = %s AND content_hash = ANY(%s::bytea[])
+"""
+
+INSERT_SQL = """
+    INSERT INTO chat_memory.embeddings (
+        id, tenant_id, project_id, embedding, dim, content, metadata, source, content_hash
+    )
+    SELECT u.id, %s, %s, u.embedding, u.dim, u.content, u.metadata, u.source, u.content_hash
+    FROM unnest(
+        %s::varchar[], %s::bytea[], %s::int[], %s::text[], %s::jsonb[], %s::varchar[], %s::bytea[]
+    ) AS u (id, embedding, dim, content, metadata, source, content_hash)
+    ON CONFLICT (tenant_id, project_id, content_hash) WHERE content_hash IS NOT NULL DO NOTHING
+"""
+
+
+def _sentences(text):
+    """Sentences and paragraphs of ``text``; pieces over CHUNK_MAX_CHARS are cut at spaces."""
+    for piece in _SENTENCE_END.split(text):
+        piece = ' '.join(piece.split())
+        while len(piece) > CHUNK_MAX_CHARS:
+            cut = piece.rfind(' ', 0, CHUNK_MAX_CHARS)
+            if cut <= 0:
+                cut = CHUNK_MAX_CHARS
+            yield piece[:cut]
+            piece = piece[cut:].lstrip()
+        if piece:
+            yield piece
+
+
+def chunk_text(text, min_chars=CHUNK_MIN_CHARS, max_chars=CHUNK_MAX_CHARS,
+               overlap_chars=CHUNK_OVERLAP_CHARS, divisor=CHUNK_DIVISOR):
+    """Split ``text`` into overlapping chunks with content-defined boundaries."""
+    chunks = []
+    current = []
+    size = 0
+    overlap = []
+    for sentence in _sentences(text):
+        if current and size + 1 + len(sentence) > max_chars:
+            chunks.append(' '.join(overlap + current))
+            overlap, current, size = _tail(current, overlap_chars), [], 0
+        current.append(sentence)
+        size += len(sentence) + (1 if size else 0)
+        if size >= min_chars and zlib.crc32(sentence.encode('utf-8')) % divisor == 0:
+            chunks.append(' '.join(overlap + current))
+            overlap, current, size = _tail(current, overlap_chars), [], 0
+    if current:
+        chunks.append(' '.join(overlap + current))
+    return chunks
+
+
+def _tail(sentences, max_chars):
+    """Trailing sentences of a chunk totalling at most ``max_chars``, carried into the next."""
+    tail = []
+    size = 0
+    for sentence in reversed(sentences):
+        size += len(sentence) + 1
+        if size > max_chars:
+            break
+        tail.append(sentence)
+    return tail[::-1]
+
+
+def content_hash(chunk):
+    return hashlib.sha256(' '.join(chunk.split()).encode('utf-8')).digest()
+
+
+def stub_embedder(texts, dim=None):
+    """Deterministic local embedder: signed feature hashing of lowercase words, unit length.
+
+    Texts sharing words get similar vectors, which is enough to exercise
+    search end to end without a model.
+    """
+    dim = dim or EMBEDDING_DIM
+    out = []
+    for text in texts:
+        values = [0.0] * dim
+        for word in _WORD.findall(text.lower()):
+            h = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+            values[h % dim] += 1.0 if (h >> 63) else -1.0
+        norm = math.sqrt(sum(v * v for v in values))
+        out.append([v / norm for v in values] if norm else values)
+    return out
+
+
+EMBEDDERS = {'stub': stub_embedder}
+
+
+def load_embedder(name=None):
+    """Return ``(name, embed)`` for ``name`` (default ``INGEST_EMBEDDER``)."""
+    name = name or os.getenv('INGEST_EMBEDDER', 'stub')
+    if name in EMBEDDERS:
+        return name, EMBEDDERS[name]
+    module_name, sep, attr = name.partition(':')
+    if not sep:
+        raise ValueError(f'INGEST_EMBEDDER must be one of {", ".join(EMBEDDERS)} or a module:function path')
+    return name, getattr(importlib.import_module(module_name), attr)
+
+
+class Pipeline:
+    """Ingest documents for one tenant/project over a DB-API connection (``%s`` paramstyle).
+
+    Use as a context manager, or call :meth:`close` to flush the batches in
+    flight and stop the worker pool. Only the calling thread touches the
+    connection; the workers only embed.
+    """
+
+    def __init__(self, conn, tenant_id, project_id, embed=None, workers=WORKERS, batch_size=BATCH):
+        self.conn = conn
+        self.tenant_id = tenant_id
+        self.project_id = project_id
+        self.embed = embed or load_embedder()[1]
+        self.batch_size = batch_size
+        self.max_in_flight = 2 * workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest-embed')
+        self._in_flight = deque()
+        self._pending = []
+        self._seen = set()
+        self.stats = {'documents': 0, 'chunks': 0, 'duplicates': 0, 'embedded': 0, 'inserted': 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, content, source=None, metadata=None):
+        """Chunk one document and queue its chunks."""
+        self.stats['documents'] += 1
+        for index, chunk in enumerate(chunk_text(content)):
+            self.stats['chunks'] += 1
+            digest = content_hash(chunk)
+            if digest in self._seen:
+                self.stats['duplicates'] += 1
+                continue
+            self._seen.add(digest)
+            self._pending.append((digest, chunk, source, dict(metadata or {}, chunk=index)))
+            if len(self._pending) >= self.batch_size:
+                self._submit()
+
+    def _submit(self):
+        batch, self._pending = self._pending, []
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(EXISTING_SQL, [self.tenant_id, self.project_id, [b[0] for b in batch]])
+            stored = {bytes(row[0]) for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+        self.conn.commit()
+        fresh = [b for b in batch if b[0] not in stored]
+        self.stats['duplicates'] += len(batch) - len(fresh)
+        if not fresh:
+            return
+        future = self._executor.submit(self.embed, [b[1] for b in fresh])
+        self._in_flight.append((fresh, future))
+        while len(self._in_flight) >= self.max_in_flight:
+            self._load(*self._in_flight.popleft())
+
+    def _load(self, batch, future):
+        embedded = future.result()
+        if len(embedded) != len(batch):
+            raise ValueError(f'embedder returned {len(embedded)} vectors for {len(batch)} texts')
+        self.stats['embedded'] += len(batch)
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(INSERT_SQL, [
+                self.tenant_id,
+                self.project_id,
+                [str(uuid.uuid4()) for _ in batch],
+                [vectors.pack(v) for v in embedded],
+                [len(v) for v in embedded],
+                [b[1] for b in batch],
+                [json.dumps(b[3]) for b in batch],
+                [b[2] for b in batch],
+                [b[0] for b in batch],
+            ])
+            self.stats['inserted'] += max(cursor.rowcount, 0)
+        finally:
+            cursor.close()
+        self.conn.commit()
+
+    def flush(self):
+        """Embed and load everything queued so far."""
+        if self._pending:
+            self._submit()
+        while self._in_flight:
+            self._load(*self._in_flight.popleft())
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+
+
+def ingest(conn, tenant_id, project_id, documents, **options):
+    """Run ``documents`` (``(content, source, metadata)`` tuples) through a :class:`Pipeline`.
+
+    Returns the pipeline counters plus ``seconds``.
+    """
+    started = time.perf_counter()
+    with Pipeline(conn, tenant_id, project_id, **options) as pipeline:
+        for content, source, metadata in documents:
+            pipeline.add(content, source, metadata)
+    return dict(pipeline.stats, seconds=round(time.perf_counter() - started, 3))
+
+
+def read_documents(paths):
+    """Yield ``(content, source, metadata)`` from text files and NDJSON files/stdin (``-``)."""
+    for path in paths:
+        if path == '-' or path.endswith(('.jsonl', '.ndjson')):
+            stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+            try:
+                for line in stream:
+                    if line.strip():
+                        doc = json.loads(line)
+                        yield doc['content'], doc.get('source'), doc.get('metadata') or {}
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+        else:
+            with open(path, encoding='utf-8') as f:
+                yield f.read(), path, {}
+
+
+def main():
+    import argparse
+
+    from dotenv import load_dotenv
+    from sqlalchemy import create_engine
+
+    parser = argparse.ArgumentParser(description='Chunk, embed and load documents into chat_memory.embeddings')
+    parser.add_argument('paths', nargs='+', help='text files, .jsonl/.ndjson files, or - for NDJSON on stdin')
+    parser.add_argument('--tenant', required=True)
+    parser.add_argument('--project', required=True)
+    parser.add_argument('--dsn', help='database URL (default POSTGRES_CONNECTION)')
+    parser.add_argument('--embedder', help='stub or module:function (default INGEST_EMBEDDER)')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--batch', type=int, default=BATCH)
+    args = parser.parse_args()
+
+    load_dotenv()
+    engine = create_engine(args.dsn or os.environ['POSTGRES_CONNECTION'])
+    conn = engine.raw_connection()
+    try:
+        stats = ingest(
+            conn, args.tenant, args.project, read_documents(args.paths),
+            embed=load_embedder(args.embedder)[1], workers=args.workers, batch_size=args.batch,
+        )
+    finally:
+        conn.close()
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+On-disk embedding segments: memory-mapped, zero-copy, optionally quantized.
+
+A tenant's embeddings as JSON lists of Python floats cost 20-30x the bytes of
+a packed float32 array once deserialized. A segment stores them as one
+contiguous matrix plus an id array in a single file. Opening a segment maps
+the file with ``mmap`` and exposes every block through ``numpy.frombuffer``,
+so nothing is copied or parsed until pages are actually touched, and workers
+opening the same file share the page cache.
+
+Layout (all blocks 64-byte aligned)::
+
+    b'APXSEG1\\0' | uint32 header length | JSON header | blocks...
+
+The header lists each named block (dtype, shape, offset) plus free-form
+metadata. Standard blocks are ``vectors`` (count x dim), ``scales`` (int8
+only), ``id_offsets`` (count + 1 uint32) and ``id_bytes`` (UTF-8).
+
+Encodings (bytes per dimension; recall@10 vs float32 measured with
+benchmarks/quantization_recall.py on 100k clustered 384-d vectors):
+
+- ``float32``: 4 bytes, exact
+- ``float16``: 2 bytes, recall@10 1.000 (differences only in ties)
+- ``int8``: 1 byte + 4 bytes/vector scale (symmetric, per vector),
+  recall@10 0.978
+
+Scores from quantized segments are computed in float32 after dequantizing
+only the rows being scored.
+"""
+
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'APXSEG1\x00'
+ALIGN = 64
+ENCODINGS = ('float32', 'float16', 'int8')
+
+
+def quantize(matrix, encoding):
+    """Return ``(data, scales)``; ``scales`` is None except for int8."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if encoding == 'float32':
+        return matrix, None
+    if encoding == 'float16':
+        return matrix.astype(np.float16), None
+    if encoding == 'int8':
+        scales = np.abs(matrix).max(axis=-1) / 127.0
+        safe = np.where(scales > 0, scales, 1.0)
+        data = np.clip(np.rint(matrix / safe[..., None]), -127, 127).astype(np.int8)
+        return data, scales.astype(np.float32)
+    raise ValueError(f'encoding must be one of {", ".join(ENCODINGS)}')
+
+
+def dequantize(data, scales=None):
+    """Float32 copy of (a slice of) quantized rows."""
+    out = data.astype(np.float32)
+    if scales is not None:
+        out *= scales[..., None]
+    return out
+
+
+def _encode_ids(ids):
+    encoded = [str(i).encode('utf-8') for i in ids]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+
+def write_segment(path, ids, data, scales=None, arrays=None, meta=None):
+    """Write ``data`` (already encoded, see :func:`quantize`) and ``ids`` to ``path``.
+
+    ``arrays`` are extra named blocks (e.g. IVF centroids). The file is
+    written next to ``path`` and renamed into place.
+    """
+    blocks = {'vectors': np.ascontiguousarray(data)}
+    if scales is not None:
+        blocks['scales'] = np.ascontiguousarray(scales, dtype=np.float32)
+    blocks['id_offsets'], blocks['id_bytes'] = _encode_ids(ids)
+    for name, array in (arrays or {}).items():
+        blocks[name] = np.ascontiguousarray(array)
+
+    # Offsets depend on the header length, which depends on the offsets:
+    # lay blocks out relative to a padded header size, growing it if needed.
+    header_room = 1024
+    while True:
+        directory = {}
+        offset = header_room
+        for name, array in blocks.items():
+            directory[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset += -(-array.nbytes // ALIGN) * ALIGN
+        header = json.dumps({
+            'count': len(ids),
+            'dim': int(data.shape[1]) if data.ndim == 2 else 0,
+            'encoding': str(data.dtype) if scales is None else 'int8',
+            'blocks': directory,
+            'meta': meta or {},
+        }).encode('utf-8')
+        if len(MAGIC) + 4 + len(header) <= header_room:
+            break
+        header_room = -(-(len(MAGIC) + 4 + len(header)) // ALIGN) * ALIGN
+
+    tmp = f'{path}.tmp-{os.getpid()}'
+    with open(tmp, 'wb') as fh:
+        fh.write(MAGIC)
+        fh.write(struct.pack('<I', len(header)))
+        fh.write(header)
+        for name, array in blocks.items():
+            fh.seek(directory[name]['offset'])
+            fh.write(array.tobytes())
+        fh.truncate(offset)
+    os.replace(tmp, path)
+
+
+class Segment:
+    """Read-only view of a segment file; arrays are zero-copy mmap views."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f'{path} is not an embedding segment')
+        (header_len,) = struct.unpack_from('<I', self._mmap, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(self._mmap[start:start + header_len].decode('utf-8'))
+        self.count = header['count']
+        self.dim = header['dim']
+        self.encoding = header['encoding']
+        self.meta = header['meta']
+        self.arrays = {}
+        for name, block in header['blocks'].items():
+            dtype = np.dtype(block['dtype'])
+            shape = tuple(block['shape'])
+            count = int(np.prod(shape)) if shape else 1
+            self.arrays[name] = np.frombuffer(
+                self._mmap, dtype=dtype, count=count, offset=block['offset']
+            ).reshape(shape)
+
+    @property
+    def vectors(self):
+        return self.arrays['vectors']
+
+    @property
+    def scales(self):
+        return self.arrays.get('scales')
+
+    def id(self, i):
+        offsets = self.arrays['id_offsets']
+        return bytes(self.arrays['id_bytes'][offsets[i]:offsets[i + 1]]).decode('utf-8')
+
+    def ids(self):
+        raw = self.arrays['id_bytes'].tobytes()
+        offsets = self.arrays['id_offsets'].tolist()
+        return [raw[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(self.count)]
+
+    def close(self):
+        # Views must be dropped before the map can be closed
+        self.arrays = {}
+        self._mmap.close()
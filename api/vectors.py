@@ -0,0 +1,161 @@
+"""
+Embedding storage and similarity scoring for the RAG memory endpoints.
+
+Vectors are stored as packed little-endian float32 (``bytea``), 4 bytes per
+dimension instead of ~20 bytes of JSON text, and are scored in process with
+NumPy. When NumPy is not installed a pure-Python path gives identical
+results (slowly), so the search logic can be exercised without extensions.
+"""
+
+import heapq
+import math
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without numpy
+    np = None
+
+METRICS = ('cosine', 'dot', 'l2')
+# Upper bound on elements of one (queries x vectors) score block, ~64 MB
+SCORE_BLOCK_ELEMENTS = 1 << 24
+
+
+class VectorError(ValueError):
+    """Invalid vector input; the message is safe to return to clients."""
+
+
+def parse_vector(raw):
+    """Validate a JSON list of numbers and return it as a list of floats."""
+    if not isinstance(raw, list) or not raw:
+        raise VectorError('vector must be a non-empty list of numbers')
+    try:
+        values = [float(v) for v in raw]
+    except (TypeError, ValueError):
+        raise VectorError('vector must be a non-empty list of numbers')
+    if not all(math.isfinite(v) for v in values):
+        raise VectorError('vector must only contain finite numbers')
+    return values
+
+
+def pack(values):
+    """Pack a vector into little-endian float32 bytes."""
+    if np is not None:
+        return np.asarray(values, dtype='<f4').tobytes()
+    packed = array('f', values)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack(blob):
+    """Inverse of :func:`pack`; zero-copy view when NumPy is available."""
+    if np is not None:
+        return np.frombuffer(blob, dtype='<f4')
+    values = array('f')
+    values.frombytes(bytes(blob))
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def as_matrix(blobs, dim):
+    """Stack packed vectors into one (len(blobs), dim) float32 matrix."""
+    return np.frombuffer(b''.join(blobs), dtype='<f4').reshape(len(blobs), dim)
+
+
+def normalize(matrix):
+    """Scale rows to unit length (zero rows stay zero), so cosine is a dot product."""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix, dtype=np.float32), where=norms > 0)
+
+
+def _score_python(query, vector, metric, query_norm):
+    dot = sum(q * v for q, v in zip(query, vector))
+    if metric == 'dot':
+        return dot
+    if metric == 'l2':
+        return -math.sqrt(sum((q - v) ** 2 for q, v in zip(query, vector)))
+    norm = math.sqrt(sum(v * v for v in vector))
+    return dot / (query_norm * norm) if query_norm and norm else 0.0
+
+
+def top_k(query, ids, blobs, k=10, metric='cosine'):
+    """Return the ``k`` best ``(id, score)`` pairs, highest score first.
+
+    ``blobs`` are packed vectors with the same dimension as ``query``. For
+    ``l2`` the score is the negated Euclidean distance so that higher is
+    always better.
+    """
+    if metric not in METRICS:
+        raise VectorError(f'metric must be one of {", ".join(METRICS)}')
+    if not ids or k <= 0:
+        return []
+    k = min(k, len(ids))
+
+    if np is None:
+        query_norm = math.sqrt(sum(q * q for q in query))
+        scored = (
+            (_score_python(query, unpack(blob), metric, query_norm), i)
+            for i, blob in enumerate(blobs)
+        )
+        return [(ids[i], score) for score, i in heapq.nlargest(k, scored)]
+
+    q = np.asarray(query, dtype=np.float32)
+    matrix = as_matrix(blobs, q.shape[0])
+    if metric == 'l2':
+        scores = -np.sqrt(((matrix - q) ** 2).sum(axis=1))
+    else:
+        scores = matrix @ q
+        if metric == 'cosine':
+            norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(q)
+            scores = np.divide(scores, norms, out=np.zeros_like(scores), where=norms > 0)
+    # argpartition finds the top k in O(N); only those k get sorted
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+    return [(ids[i], float(scores[i])) for i in best]
+
+
+def top_k_batch(queries, ids, blobs, k=10, metric='cosine', normalized=False):
+    """:func:`top_k` for many queries at once; returns one hit list per query.
+
+    All queries are scored with a single (blocked) matrix multiply instead
+    of one pass over the matrix per query. ``blobs`` may also be a float32
+    matrix. For ``cosine`` rows and queries are normalised up front so the
+    product is the score; pass ``normalized=True`` when both already are.
+    """
+    if metric not in METRICS:
+        raise VectorError(f'metric must be one of {", ".join(METRICS)}')
+    if not ids or k <= 0:
+        return [[] for _ in queries]
+    k = min(k, len(ids))
+
+    if np is None:
+        return [top_k(query, ids, blobs, k=k, metric=metric) for query in queries]
+
+    q = np.asarray(queries, dtype=np.float32)
+    matrix = blobs if isinstance(blobs, np.ndarray) else as_matrix(blobs, q.shape[1])
+    if metric == 'cosine' and not normalized:
+        q = normalize(q)
+        matrix = normalize(matrix)
+    elif metric == 'l2':
+        # |q - v|^2 = |q|^2 + |v|^2 - 2 q.v, so l2 also needs only the product
+        row_sq = np.einsum('ij,ij->i', matrix, matrix)
+
+    results = []
+    step = max(1, SCORE_BLOCK_ELEMENTS // len(ids))
+    for lo in range(0, len(q), step):
+        block = q[lo:lo + step]
+        scores = block @ matrix.T
+        if metric == 'l2':
+            sq = row_sq[None, :] + np.einsum('ij,ij->i', block, block)[:, None] - 2 * scores
+            scores = -np.sqrt(np.maximum(sq, 0))
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        for row, row_scores in zip(best.tolist(), best_scores.tolist()):
+            results.append([(ids[i], score) for i, score in zip(row, row_scores)])
+    return results
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Requests/second and p50/p99 latency of the Flask and asyncio APIs under load.
+
+Opens N concurrent HTTP/1.1 clients per target (keep-alive when the server
+allows it, reconnecting when it does not, as gunicorn's sync worker does)
+and has each issue requests back to back for ``--duration`` seconds.
+Clients are spread over ``--processes`` so the load generator is not the
+bottleneck at 5k connections. Start the servers first, against the same
+database, e.g.:
+
+    gunicorn -w 4 -b :8000 api.app:app
+    gunicorn -k uvicorn.workers.UvicornWorker -w 4 -b :8001 api.async_app:app
+
+    python benchmarks/http_concurrency.py \\
+        --target flask=http://127.0.0.1:8000 --target async=http://127.0.0.1:8001 \\
+        --path /health --concurrency 100 1000 5000 --output results.json
+
+``--body`` (JSON) switches to POST, e.g. for /memory/search. 5k clients
+need ``ulimit -n`` above 5000 on both sides.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+import urllib.parse
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def build_request(url, method, body, tenant):
+    parsed = urllib.parse.urlsplit(url)
+    path = parsed.path or '/'
+    if parsed.query:
+        path += '?' + parsed.query
+    lines = [f'{method} {path} HTTP/1.1', f'Host: {parsed.netloc}', 'Connection: keep-alive']
+    if tenant:
+        lines.append(f'X-Tenant-ID: {tenant}')
+    payload = b''
+    if body is not None:
+        payload = body.encode('utf-8')
+        lines += ['Content-Type: application/json', f'Content-Length: {len(payload)}']
+    head = ('\r\n'.join(lines) + '\r\n\r\n').encode('ascii')
+    return parsed.hostname, parsed.port or 80, head + payload
+
+
+async def read_response(reader):
+    """Read one response; returns (status, keep_alive)."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection') != 'close'
+
+
+async def client(host, port, request, deadline, latencies, counts):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            status, keep_alive = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            counts['errors'] += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.01)
+            continue
+        latencies.append(time.perf_counter() - start)
+        counts['ok' if status < 400 else 'http_errors'] += 1
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def drive(url, method, body, tenant, clients, duration):
+    host, port, request = build_request(url, method, body, tenant)
+    latencies = []
+    counts = {'ok': 0, 'http_errors': 0, 'errors': 0}
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(client(host, port, request, deadline, latencies, counts) for _ in range(clients)))
+    return latencies, counts
+
+
+def worker(args):
+    return asyncio.run(drive(*args))
+
+
+def run(url, method, body, tenant, concurrency, duration, processes):
+    processes = max(1, min(processes, concurrency))
+    shares = [concurrency // processes + (i < concurrency % processes) for i in range(processes)]
+    with multiprocessing.Pool(processes) as pool:
+        parts = pool.map(worker, [(url, method, body, tenant, n, duration) for n in shares])
+    latencies = [x for part, _ in parts for x in part]
+    counts = {key: sum(c[key] for _, c in parts) for key in parts[0][1]}
+    result = {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'rps': round(len(latencies) / duration, 1),
+        'errors': counts['errors'],
+        'http_errors': counts['http_errors'],
+    }
+    if latencies:
+        result['p50_ms'] = round(statistics.median(latencies) * 1000, 2)
+        result['p99_ms'] = round(percentile(latencies, 99) * 1000, 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--target', action='append', required=True,
+                        help='name=base_url, repeatable (e.g. flask=http://127.0.0.1:8000)')
+    parser.add_argument('--path', default='/health')
+    parser.add_argument('--body', help='JSON request body; sends POST instead of GET')
+    parser.add_argument('--tenant', help='X-Tenant-ID header to send')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    method = 'POST' if args.body else 'GET'
+    results = []
+    for target in args.target:
+        name, _, base = target.partition('=')
+        if not base:
+            sys.exit(f'--target must be name=url, got {target!r}')
+        for concurrency in args.concurrency:
+            result = dict(run(base.rstrip('/') + args.path, method, args.body, args.tenant, concurrency,
+                              args.duration, args.processes), target=name, path=args.path)
+            results.append(result)
+            print(f"{name:>8}  c={concurrency:<5}  {result['rps']:>9.1f} req/s  "
+                  f"p50 {result.get('p50_ms', float('nan')):>8.2f} ms  "
+                  f"p99 {result.get('p99_ms', float('nan')):>8.2f} ms  "
+                  f"errors {result['errors'] + result['http_errors']}")
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Encoding time of a GET /api/memory page: the old per-row dict + json.dumps
+path against shared_code.encoding with each available backend.
+
+Rows are shaped like pg8000 results (tz-aware created_at, decoded JSONB
+metadata). Each case encodes the full response body, NDJSON lines included
+for the export mode.
+
+    python benchmarks/json_encoding.py --rows 1000 --repeat 200
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'functions'))
+
+from shared_code import encoding  # noqa: E402
+
+COLUMNS = ('id', 'tenant_id', 'user_id', 'session_id', 'content', 'message_type', 'created_at', 'metadata')
+
+
+def sample_rows(n):
+    now = datetime.now(timezone.utc)
+    return [
+        (
+            f'{i:032x}', 'tenant-1', 'user-1', f'session-{i % 10}',
+            'The quarterly report summarises revenue by region. ' * 4, 'chat',
+            now - timedelta(seconds=i), {'source': 'word', 'tags': ['draft', 'q3'], 'turn': i},
+        )
+        for i in range(n)
+    ]
+
+
+def row_to_dict(r):
+    # The handlers' conversion before shared_code.encoding
+    return {
+        'id': r[0],
+        'tenant_id': r[1],
+        'user_id': r[2],
+        'session_id': r[3],
+        'content': r[4],
+        'message_type': r[5],
+        'created_at': (r[6].isoformat() if r[6] else None),
+        'metadata': r[7] if r[7] else {},
+    }
+
+
+def baseline_page(rows):
+    data = [row_to_dict(r) for r in rows]
+    return json.dumps({'status': 'success', 'count': len(data), 'data': data, 'next_cursor': None})
+
+
+def baseline_ndjson(rows):
+    return b''.join(json.dumps(row_to_dict(r)).encode('utf-8') + b'\n' for r in rows)
+
+
+def timed(fn, rows, repeat):
+    fn(rows)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(rows)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    rows = sample_rows(args.rows)
+    results = [
+        {'case': 'baseline page', 'ms': timed(baseline_page, rows, args.repeat)},
+        {'case': 'baseline ndjson', 'ms': timed(baseline_ndjson, rows, args.repeat)},
+    ]
+    for backend in ('stdlib', 'orjson'):
+        os.environ['JSON_ENCODER'] = backend
+        try:
+            enc = importlib.reload(encoding)
+        except ImportError:
+            print(f'{backend}: not installed, skipped')
+            continue
+        encoder = enc.RowEncoder(COLUMNS)
+        results.append({
+            'case': f'{backend} page',
+            'ms': timed(lambda rs: enc.page(encoder.dicts(rs), None), rows, args.repeat),
+        })
+        results.append({
+            'case': f'{backend} ndjson',
+            'ms': timed(lambda rs: b''.join(encoder.line(r) for r in rs), rows, args.repeat),
+        })
+
+    base = {r['case'].split()[1]: r['ms'] for r in results if r['case'].startswith('baseline')}
+    for r in results:
+        r['speedup'] = round(base[r['case'].split()[1]] / r['ms'], 2)
+        r['ms'] = round(r['ms'], 3)
+        print(f"{r['case']:<18} {r['ms']:>9.3f} ms  x{r['speedup']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'rows': args.rows, 'repeat': args.repeat, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Recall and size of quantized embedding segments against exact float32 search.
+
+Generates clustered, L2-normalised vectors (real sentence embeddings are
+far from uniform), writes one segment per encoding with api.segments and
+measures, through the memory-mapped segment, the fraction of the exact
+float32 top-k that each encoding returns.
+
+    python benchmarks/quantization_recall.py --vectors 100000 --dim 384 --k 10
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np  # noqa: E402
+
+from api import segments  # noqa: E402
+
+
+def clustered_vectors(n, dim, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim), dtype=np.float32)
+    matrix = centres[rng.integers(0, clusters, n)]
+    matrix += 0.5 * rng.standard_normal((n, dim), dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+
+def top_k(scores, k):
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [set(row) for row in best]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--vectors', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--clusters', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    matrix = clustered_vectors(args.vectors, args.dim, args.clusters, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    # Queries are perturbed copies of stored vectors, as in retrieval
+    queries = matrix[rng.integers(0, args.vectors, args.queries)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape, dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    exact = top_k(queries @ matrix.T, args.k)
+    ids = [str(i) for i in range(args.vectors)]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for encoding in segments.ENCODINGS:
+            path = os.path.join(tmp, f'{encoding}.seg')
+            data, scales = segments.quantize(matrix, encoding)
+            segments.write_segment(path, ids, data, scales=scales)
+            segment = segments.Segment(path)
+            start = time.perf_counter()
+            stored = segments.dequantize(segment.vectors, segment.scales)
+            found = top_k(queries @ stored.T, args.k)
+            elapsed = time.perf_counter() - start
+            recall = np.mean([len(a & b) / args.k for a, b in zip(exact, found)])
+            results.append({
+                'encoding': encoding,
+                'vectors': args.vectors,
+                'dim': args.dim,
+                'k': args.k,
+                'file_mb': round(os.path.getsize(path) / 2 ** 20, 1),
+                'recall': round(float(recall), 4),
+                'scan_ms_per_query': round(elapsed * 1000 / args.queries, 3),
+            })
+            del stored, segment
+            r = results[-1]
+            print(f"{encoding:>8}  {r['file_mb']:>8.1f} MB  recall@{args.k} {r['recall']:.4f}")
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Latency of the in-process similarity search used by POST /memory/search.
+
+Generates random float32 vectors packed exactly as they are stored in
+chat_memory.embeddings and times api.vectors.top_k (matrix assembly +
+scoring + top-k selection) for a single tenant/project of each size.
+
+    python benchmarks/vector_search.py --sizes 10000 100000 1000000 --dim 384
+
+``--backend python`` scores with the pure-Python fallback used when NumPy
+is not installed (vectors are still generated with NumPy when available).
+
+With ``--batch N [N ...]`` it instead reports queries/second of
+api.vectors.top_k_batch (POST /memory/search/batch) for each batch size,
+next to N sequential top_k calls.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api import vectors  # noqa: E402
+
+
+def random_vectors(n, dim, seed):
+    if vectors.np is not None:
+        rng = vectors.np.random.default_rng(seed)
+        matrix = rng.standard_normal((n, dim), dtype=vectors.np.float32)
+        return [row.tobytes() for row in matrix]
+    rnd = random.Random(seed)
+    return [vectors.pack([rnd.gauss(0, 1) for _ in range(dim)]) for _ in range(n)]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(size, dim, k, metric, repeats, seed, backend='auto'):
+    blobs = random_vectors(size, dim, seed)
+    ids = [str(i) for i in range(size)]
+    numpy = vectors.np
+    if backend == 'python':
+        vectors.np = None
+    rnd = random.Random(seed + 1)
+    timings = []
+    try:
+        for _ in range(repeats):
+            query = [rnd.gauss(0, 1) for _ in range(dim)]
+            start = time.perf_counter()
+            vectors.top_k(query, ids, blobs, k=k, metric=metric)
+            timings.append((time.perf_counter() - start) * 1000)
+        used = 'numpy' if vectors.np is not None else 'python'
+    finally:
+        vectors.np = numpy
+    return {
+        'vectors': size,
+        'dim': dim,
+        'k': k,
+        'metric': metric,
+        'backend': used,
+        'samples': len(timings),
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+def run_batch(size, dim, k, metric, batch, repeats, seed):
+    blobs = random_vectors(size, dim, seed)
+    ids = [str(i) for i in range(size)]
+    rnd = random.Random(seed + 1)
+    queries = [[rnd.gauss(0, 1) for _ in range(dim)] for _ in range(batch)]
+    batched, sequential = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        vectors.top_k_batch(queries, ids, blobs, k=k, metric=metric)
+        batched.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for query in queries:
+            vectors.top_k(query, ids, blobs, k=k, metric=metric)
+        sequential.append(time.perf_counter() - start)
+    return {
+        'vectors': size,
+        'dim': dim,
+        'k': k,
+        'metric': metric,
+        'batch': batch,
+        'backend': 'numpy' if vectors.np is not None else 'python',
+        'batch_qps': round(batch / statistics.median(batched), 1),
+        'sequential_qps': round(batch / statistics.median(sequential), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--metric', choices=vectors.METRICS, default='cosine')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--batch', type=int, nargs='+', help='batch sizes to measure throughput for')
+    parser.add_argument('--backend', choices=('auto', 'python'), default='auto',
+                        help='python forces the pure-Python fallback')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        if args.batch:
+            for batch in args.batch:
+                result = run_batch(size, args.dim, args.k, args.metric, batch, args.repeats, args.seed)
+                results.append(result)
+                print(f"{result['vectors']:>9} vectors  batch {batch:>4}  "
+                      f"{result['batch_qps']:>9.1f} q/s batched  "
+                      f"{result['sequential_qps']:>9.1f} q/s sequential")
+            continue
+        result = run(size, args.dim, args.k, args.metric, args.repeats, args.seed, args.backend)
+        results.append(result)
+        print(f"{result['vectors']:>9} vectors  p50 {result['p50_ms']:>9.3f} ms  "
+              f"p99 {result['p99_ms']:>9.3f} ms  ({result['backend']}, {result['samples']} queries)")
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
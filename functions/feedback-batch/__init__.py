@@ -0,0 +1,173 @@
+import azure.functions as func
+import json
+from datetime import datetime, timedelta, timezone
+import os
+
+from shared_code import cache, db, rollups, schema, timing, validation, writes
+
+# Upper bound on records per call; larger bursts should be split by the client
+MAX_BATCH_ITEMS = int(os.environ.get("FEEDBACK_BATCH_MAX_ITEMS", "1000"))
+
+
+@timing.instrument("feedback-batch")
+def main(req: func.HttpRequest) -> func.HttpResponse:
+	"""POST endpoint to save a batch of feedback, reporting invalid items individually"""
+	try:
+		try:
+			items = validation.parse_batch(req)
+		except validation.ValidationError as e:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": str(e)}),
+				status_code=400,
+				mimetype="application/json",
+			)
+
+		if not items:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": "Batch is empty"}),
+				status_code=400,
+				mimetype="application/json",
+			)
+		if len(items) > MAX_BATCH_ITEMS:
+			return func.HttpResponse(
+				json.dumps({
+					"status": "error",
+					"message": f"Batch exceeds {MAX_BATCH_ITEMS} items",
+				}),
+				status_code=413,
+				mimetype="application/json",
+			)
+
+		# Same rules as POST /api/feedback, applied per item
+		valid = []
+		errors = []
+		for index, item in enumerate(items):
+			try:
+				valid.append((index, validation.feedback_record(item)))
+			except validation.ValidationError as e:
+				errors.append({"index": index, "message": str(e)})
+
+		if not valid:
+			return func.HttpResponse(
+				json.dumps({
+					"status": "error",
+					"message": "No valid feedback records in batch",
+					"errors": errors,
+				}),
+				status_code=400,
+				mimetype="application/json",
+			)
+
+		# Connection string from app settings
+		conn_str = os.environ.get("POSTGRES_CONNECTION")
+		if not conn_str:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": "POSTGRES_CONNECTION not set"}),
+				status_code=500,
+				mimetype="application/json",
+			)
+
+		idempotency_key = req.headers.get("idempotency-key")
+		if idempotency_key:
+			# Keys are scoped to the tenant (migration 013)
+			tenants = {record["tenant_id"] for _, record in valid}
+			if len(tenants) > 1:
+				return func.HttpResponse(
+					json.dumps({
+						"status": "error",
+						"message": "A batch with an Idempotency-Key must belong to a single tenant_id",
+					}),
+					status_code=400,
+					mimetype="application/json",
+				)
+			tenant_id = tenants.pop()
+		now = datetime.now(timezone.utc)
+		created = [now + timedelta(microseconds=i) for i in range(len(valid))]
+		records = [record for _, record in valid]
+
+		with db.connection() as conn:
+			schema.ensure_schema(conn)
+			cursor = conn.cursor()
+			try:
+				if idempotency_key:
+					# Claim the key in the same transaction as the insert. A
+					# concurrent retry blocks on the row until we commit, then
+					# finds it and replays the stored response.
+					cursor.execute(
+						"INSERT INTO rag_feedback.batch_requests (tenant_id, idempotency_key) VALUES (%s, %s) "
+						"ON CONFLICT (tenant_id, idempotency_key) DO NOTHING RETURNING idempotency_key",
+						[tenant_id, idempotency_key],
+					)
+					if not cursor.fetchall():
+						cursor.execute(
+							"SELECT response FROM rag_feedback.batch_requests "
+							"WHERE tenant_id = %s AND idempotency_key = %s",
+							[tenant_id, idempotency_key],
+						)
+						stored = cursor.fetchone()[0] or {}
+						conn.commit()
+						stored["replayed"] = True
+						return func.HttpResponse(
+							json.dumps(stored), status_code=200, mimetype="application/json"
+						)
+
+				with timing.stage("query"):
+					inserted = writes.insert_feedback(cursor, records, created)
+
+				data = []
+				written = []
+				rolled = []
+				for (index, r), created_at in zip(valid, created):
+					status = "created" if r["id"] in inserted else "duplicate"
+					if status == "created":
+						written.append(dict(r, created_at=created_at.isoformat()))
+						rolled.append((r["tenant_id"], r["response_id"], r["rating"], created_at))
+					# Repeated ids inside one batch are only written once
+					inserted.discard(r["id"])
+					data.append({
+						"index": index,
+						"id": r["id"],
+						"status": status,
+						"created_at": created_at.isoformat(),
+					})
+				with timing.stage("rollups"):
+					rollups.record(cursor, rolled)
+				response = {
+					"status": "partial" if errors else "success",
+					"message": "Feedback batch saved",
+					"count": len(data),
+					"created": sum(1 for d in data if d["status"] == "created"),
+					"data": data,
+					"errors": errors,
+				}
+
+				if idempotency_key:
+					cursor.execute(
+						"UPDATE rag_feedback.batch_requests SET response = %s::jsonb "
+						"WHERE tenant_id = %s AND idempotency_key = %s",
+						[json.dumps(response), tenant_id, idempotency_key],
+					)
+				with timing.stage("commit"):
+					conn.commit()
+			finally:
+				try:
+					cursor.close()
+				except Exception:
+					pass
+
+		cache.written("feedback", written)
+
+		return func.HttpResponse(
+			json.dumps(response), status_code=201, mimetype="application/json"
+		)
+
+	except Exception as e:
+		return func.HttpResponse(
+			json.dumps({
+				"status": "error",
+				"message": str(e),
+				"timestamp": datetime.utcnow().isoformat(),
+			}),
+			status_code=500,
+			mimetype="application/json",
+		)
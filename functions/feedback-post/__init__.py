@@ -1,70 +1,24 @@
 import azure.functions as func
 import json
-from datetime import datetime
+from datetime import datetime, timezone
 import os
-import urllib.parse
-import pg8000
-import ssl
 
-
-def get_db_params_from_url(conn_str: str):
-	parsed = urllib.parse.urlparse(conn_str)
-	username = urllib.parse.unquote(parsed.username) if parsed.username else None
-	password = urllib.parse.unquote(parsed.password) if parsed.password else None
-	return {
-		"host": parsed.hostname,
-		"port": parsed.port or 5432,
-		"user": username,
-		"password": password,
-		"database": parsed.path[1:] if parsed.path else "postgres",
-		"ssl_context": ssl.create_default_context(),
-	}
-
-
-def ensure_feedback_table(cursor) -> None:
-	cursor.execute(
-		"""
-		CREATE TABLE IF NOT EXISTS rag_feedback (
-			id VARCHAR(36) PRIMARY KEY,
-			tenant_id VARCHAR(255) NOT NULL,
-			user_id VARCHAR(255) NOT NULL,
-			response_id VARCHAR(255) NOT NULL,
-			feedback TEXT,
-			rating INTEGER CHECK (rating >= 1 AND rating <= 5),
-			created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-			metadata JSONB
-		)
-		"""
-	)
+from shared_code import cache, db, rollups, schema, timing, validation, writebehind, writes
 
 
+@timing.instrument("feedback-post")
 def main(req: func.HttpRequest) -> func.HttpResponse:
 	"""POST endpoint to save feedback to PostgreSQL using pg8000"""
 	try:
 		# Parse request body
 		req_body = req.get_json()
 
-		# Validate required fields
-		required_fields = ["tenant_id", "user_id", "response_id", "rating"]
-		for field in required_fields:
-			if field not in req_body:
-				return func.HttpResponse(
-					json.dumps({
-						"status": "error",
-						"message": f"Missing required field: {field}"
-					}),
-					status_code=400,
-					mimetype="application/json",
-				)
-
-		# Validate rating
-		rating = req_body["rating"]
-		if not isinstance(rating, int) or rating < 1 or rating > 5:
+		# Validate required fields and rating
+		try:
+			record = validation.feedback_record(req_body)
+		except validation.ValidationError as e:
 			return func.HttpResponse(
-				json.dumps({
-					"status": "error",
-					"message": "Rating must be an integer between 1 and 5",
-				}),
+				json.dumps({"status": "error", "message": str(e)}),
 				status_code=400,
 				mimetype="application/json",
 			)
@@ -78,59 +32,59 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 				mimetype="application/json",
 			)
 
-		params = get_db_params_from_url(conn_str)
-		conn = pg8000.connect(**params)
-		try:
-			cursor = conn.cursor()
-
-			# Ensure table exists
-			ensure_feedback_table(cursor)
-
-			# Prepare insert
-			feedback_id = req_body.get("id") or req_body.get("uuid") or __import__("uuid").uuid4().hex
-			feedback_text = req_body.get("feedback_text") or req_body.get("feedback") or ""
-			metadata = req_body.get("metadata") or {}
-
-			cursor.execute(
-				"""
-				INSERT INTO rag_feedback (
-					id, tenant_id, user_id, response_id, feedback, rating, created_at, metadata
-				) VALUES (
-					%s, %s, %s, %s, %s, %s, %s, %s::jsonb
+		created_at = datetime.now(timezone.utc)
+		if writebehind.ENABLED:
+			# Durably queued; the flusher writes it to Postgres shortly after
+			data = dict(record, created_at=created_at.isoformat())
+			try:
+				with timing.stage("enqueue"):
+					writebehind.enqueue("feedback", [data])
+			except writebehind.QueueFull as e:
+				return func.HttpResponse(
+					json.dumps({"status": "error", "message": f"Write queue full, retry later: {e}"}),
+					status_code=503,
+					headers={"Retry-After": "1"},
+					mimetype="application/json",
 				)
-				""",
-				[
-					feedback_id,
-					req_body["tenant_id"],
-					req_body["user_id"],
-					req_body["response_id"],
-					feedback_text,
-					rating,
-					datetime.utcnow(),
-					json.dumps(metadata),
-				],
+			return func.HttpResponse(
+				json.dumps({"status": "accepted", "message": "Feedback queued for saving", "data": data}),
+				status_code=202,
+				mimetype="application/json",
 			)
-			conn.commit()
-		finally:
+
+		with db.connection() as conn:
+			schema.ensure_schema(conn)
+			cursor = conn.cursor()
 			try:
-				cursor.close()
-			except Exception:
-				pass
-			conn.close()
+				with timing.stage("query"):
+					# Skips an id already stored in any month (a retried POST)
+					inserted = writes.insert_feedback(cursor, [record], [created_at])
+				if inserted:
+					with timing.stage("rollups"):
+						rollups.record(
+							cursor, [(record["tenant_id"], record["response_id"], record["rating"], created_at)]
+						)
+				with timing.stage("commit"):
+					conn.commit()
+			finally:
+				try:
+					cursor.close()
+				except Exception:
+					pass
+
+		data = dict(record, created_at=created_at.isoformat())
+		if not inserted:
+			return func.HttpResponse(
+				json.dumps({"status": "success", "message": "Feedback already saved (duplicate id)", "data": data}),
+				status_code=200,
+				mimetype="application/json",
+			)
+		cache.written("feedback", [data])
 
 		response = {
 			"status": "success",
 			"message": "Feedback saved successfully",
-			"data": {
-				"id": feedback_id,
-				"tenant_id": req_body["tenant_id"],
-				"user_id": req_body["user_id"],
-				"response_id": req_body["response_id"],
-				"rating": rating,
-				"feedback_text": feedback_text,
-				"created_at": datetime.utcnow().isoformat(),
-				"metadata": metadata,
-			},
+			"data": data,
 		}
 
 		return func.HttpResponse(
@@ -0,0 +1,94 @@
+import azure.functions as func
+import json
+from datetime import date, datetime
+import os
+
+from shared_code import db, pagination, rollups, schema, timing, validation
+
+
+def parse_day(raw, name):
+	if not raw:
+		return None
+	try:
+		return date.fromisoformat(raw)
+	except ValueError:
+		raise validation.ValidationError(f"{name} must be a date (YYYY-MM-DD)")
+
+
+@timing.instrument("feedback-stats")
+def main(req: func.HttpRequest) -> func.HttpResponse:
+	"""GET endpoint for rating count, mean and 1-5 histogram from the daily rollups"""
+	try:
+		tenant_id = req.params.get("tenant_id")
+		response_id = req.params.get("response_id")
+
+		if not tenant_id:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": "tenant_id is required"}),
+				status_code=400,
+				mimetype="application/json",
+			)
+
+		try:
+			day_from = parse_day(req.params.get("from"), "from")
+			day_to = parse_day(req.params.get("to"), "to")
+			group_by = req.params.get("group_by") or None
+			if group_by not in (None,) + rollups.GROUP_BY:
+				raise validation.ValidationError(
+					f"group_by must be one of {', '.join(rollups.GROUP_BY)}"
+				)
+			limit = pagination.page_limit(req.params.get("limit"))
+		except validation.ValidationError as e:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": str(e)}),
+				status_code=400,
+				mimetype="application/json",
+			)
+
+		conn_str = os.environ.get("POSTGRES_CONNECTION")
+		if not conn_str:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": "POSTGRES_CONNECTION not set"}),
+				status_code=500,
+				mimetype="application/json",
+			)
+
+		with db.connection() as conn:
+			schema.ensure_schema(conn)
+			cursor = conn.cursor()
+			try:
+				with timing.stage("query"):
+					data = rollups.stats(
+						cursor, tenant_id, response_id, day_from, day_to, group_by, limit
+					)
+				conn.commit()
+			finally:
+				try:
+					cursor.close()
+				except Exception:
+					pass
+
+		return func.HttpResponse(
+			json.dumps({
+				"status": "success",
+				"tenant_id": tenant_id,
+				"response_id": response_id,
+				"from": day_from.isoformat() if day_from else None,
+				"to": day_to.isoformat() if day_to else None,
+				"group_by": group_by,
+				"data": data,
+			}),
+			status_code=200,
+			mimetype="application/json",
+		)
+
+	except Exception as e:
+		return func.HttpResponse(
+			json.dumps({
+				"status": "error",
+				"message": str(e),
+				"timestamp": datetime.utcnow().isoformat(),
+			}),
+			status_code=500,
+			mimetype="application/json",
+		)
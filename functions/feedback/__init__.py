@@ -2,49 +2,23 @@ import azure.functions as func
 import json
 from datetime import datetime
 import os
-import urllib.parse
-import pg8000
-import ssl
 
+from shared_code import cache, db, encoding, ndjson, pagination, schema, timing, validation
 
-def get_db_params_from_url(conn_str: str):
-	parsed = urllib.parse.urlparse(conn_str)
-	username = urllib.parse.unquote(parsed.username) if parsed.username else None
-	password = urllib.parse.unquote(parsed.password) if parsed.password else None
-	return {
-		"host": parsed.hostname,
-		"port": parsed.port or 5432,
-		"user": username,
-		"password": password,
-		"database": parsed.path[1:] if parsed.path else "postgres",
-		"ssl_context": ssl.create_default_context(),
-	}
 
-
-def ensure_feedback_table(cursor) -> None:
-	cursor.execute(
-		"""
-		CREATE TABLE IF NOT EXISTS rag_feedback (
-			id VARCHAR(36) PRIMARY KEY,
-			tenant_id VARCHAR(255) NOT NULL,
-			user_id VARCHAR(255) NOT NULL,
-			response_id VARCHAR(255) NOT NULL,
-			feedback TEXT,
-			rating INTEGER CHECK (rating >= 1 AND rating <= 5),
-			created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-			metadata JSONB
-		)
-		"""
-	)
+# Columns of the SELECT below, as named in the response
+ROWS = encoding.RowEncoder((
+	"id", "tenant_id", "user_id", "response_id", "feedback_text", "rating", "created_at", "metadata",
+))
 
 
+@timing.instrument("feedback")
 def main(req: func.HttpRequest) -> func.HttpResponse:
 	"""GET endpoint to retrieve feedback from PostgreSQL using pg8000"""
 	try:
 		tenant_id = req.params.get("tenant_id")
 		user_id = req.params.get("user_id")
 		response_id = req.params.get("response_id")
-		limit = int(req.params.get("limit", "100"))
 
 		if not tenant_id:
 			return func.HttpResponse(
@@ -53,6 +27,36 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 				mimetype="application/json",
 			)
 
+		try:
+			as_ndjson = ndjson.wants_ndjson(req)
+			limit = pagination.page_limit(
+				req.params.get("limit"),
+				ndjson.MAX_LIMIT if as_ndjson else pagination.MAX_LIMIT,
+			)
+			cursor_token = req.params.get("cursor")
+			after = pagination.decode_cursor(cursor_token) if cursor_token else None
+		except validation.ValidationError as e:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": str(e)}),
+				status_code=400,
+				mimetype="application/json",
+			)
+
+		cache_key = None
+		if not as_ndjson and after is None:
+			cache_key = cache.page_key("feedback", tenant_id, user_id, response_id, limit)
+			page = cache.get_page(cache_key)
+			if page is not None:
+				data, next_cursor = page
+				with timing.stage("serialize"):
+					body = encoding.page(data, next_cursor)
+				return func.HttpResponse(
+					body,
+					status_code=200,
+					headers={"X-Cache": "HIT"},
+					mimetype="application/json",
+				)
+
 		conn_str = os.environ.get("POSTGRES_CONNECTION")
 		if not conn_str:
 			return func.HttpResponse(
@@ -61,53 +65,58 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 				mimetype="application/json",
 			)
 
-		params = get_db_params_from_url(conn_str)
-		conn = pg8000.connect(**params)
-		try:
+		with db.connection() as conn:
+			schema.ensure_schema(conn)
 			cursor = conn.cursor()
-			ensure_feedback_table(cursor)
-
-			query = (
-				"SELECT id, tenant_id, user_id, response_id, feedback, rating, created_at, metadata "
-				"FROM rag_feedback WHERE tenant_id = %s"
-			)
-			q_params = [tenant_id]
-			if user_id:
-				query += " AND user_id = %s"
-				q_params.append(user_id)
-			if response_id:
-				query += " AND response_id = %s"
-				q_params.append(response_id)
-			query += " ORDER BY created_at DESC LIMIT %s"
-			q_params.append(limit)
+			try:
+				query = (
+					"SELECT id, tenant_id, user_id, response_id, COALESCE(feedback_note, ''), rating, created_at, "
+					"COALESCE(metadata, '{}'::jsonb) "
+					"FROM rag_feedback.entries WHERE tenant_id = %s"
+				)
+				q_params = [tenant_id]
+				if user_id:
+					query += " AND user_id = %s"
+					q_params.append(user_id)
+				if response_id:
+					query += " AND response_id = %s"
+					q_params.append(response_id)
+				query = pagination.apply(query, q_params, after, limit)
 
-			cursor.execute(query, q_params)
-			rows = cursor.fetchall()
+				if as_ndjson:
+					with timing.stage("export"):
+						body, count, next_cursor = ndjson.export(
+							conn, query, q_params, ROWS, limit, 6
+						)
+					return func.HttpResponse(
+						body,
+						status_code=200,
+						headers={"X-Row-Count": str(count), "X-Next-Cursor": next_cursor or ""},
+						mimetype=ndjson.MIMETYPE,
+					)
 
-			data = []
-			for r in rows:
-				data.append(
-					{
-						"id": r[0],
-						"tenant_id": r[1],
-						"user_id": r[2],
-						"response_id": r[3],
-						"feedback_text": r[4] or "",
-						"rating": r[5],
-						"created_at": (r[6].isoformat() if r[6] else None),
-						"metadata": r[7] if r[7] else {},
-					}
-				)
-		finally:
-			try:
-				cursor.close()
-			except Exception:
-				pass
-			conn.close()
+				with timing.stage("query"):
+					cursor.execute(query, q_params)
+					fetched = cursor.fetchall()
+				with timing.stage("rows"):
+					rows, next_cursor = pagination.split_page(fetched, limit, 6)
+					data = ROWS.dicts(fetched)
+				if cache_key is not None:
+					# Cache the look-ahead row too so writes can keep the page exact
+					cache.put_page(cache_key, data)
+				data = data[:len(rows)]
+			finally:
+				try:
+					cursor.close()
+				except Exception:
+					pass
 
+		with timing.stage("serialize"):
+			body = encoding.page(data, next_cursor)
 		return func.HttpResponse(
-			json.dumps({"status": "success", "count": len(data), "data": data}),
+			body,
 			status_code=200,
+			headers={"X-Cache": "MISS"} if cache_key is not None else None,
 			mimetype="application/json",
 		)
 
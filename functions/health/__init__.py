@@ -2,6 +2,9 @@ import azure.functions as func
 import json
 from datetime import datetime
 
+from shared_code import cache, db, timing, writebehind
+
+@timing.instrument("health")
 def main(req: func.HttpRequest) -> func.HttpResponse:
     """Health check endpoint - Updated to test GitHub deployment"""
     try:
@@ -9,7 +12,11 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             json.dumps({
                 'status': 'ok',
                 'timestamp': datetime.utcnow().isoformat(),
-                'message': 'Apex APIs are running! - GitHub deployment test'
+                'message': 'Apex APIs are running! - GitHub deployment test',
+                'db_pool': db.pool_stats(),
+                'cache': cache.stats(),
+                'write_behind': writebehind.stats(),
+                'timing': timing.stats()
             }),
             status_code=200,
             mimetype="application/json"
@@ -0,0 +1,125 @@
+import azure.functions as func
+import json
+from datetime import datetime, timedelta, timezone
+import os
+
+from shared_code import cache, db, schema, timing, validation, writes
+
+# Upper bound on records per call; larger replays should be split by the client
+MAX_BATCH_ITEMS = int(os.environ.get("MEMORY_BATCH_MAX_ITEMS", "1000"))
+
+
+@timing.instrument("memory-batch")
+def main(req: func.HttpRequest) -> func.HttpResponse:
+	"""POST endpoint to save a batch of chat memory records in one transaction"""
+	try:
+		# Parse and validate every record before touching the database
+		try:
+			items = validation.parse_batch(req)
+		except validation.ValidationError as e:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": str(e)}),
+				status_code=400,
+				mimetype="application/json",
+			)
+
+		if not items:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": "Batch is empty"}),
+				status_code=400,
+				mimetype="application/json",
+			)
+		if len(items) > MAX_BATCH_ITEMS:
+			return func.HttpResponse(
+				json.dumps({
+					"status": "error",
+					"message": f"Batch exceeds {MAX_BATCH_ITEMS} items",
+				}),
+				status_code=413,
+				mimetype="application/json",
+			)
+
+		records = []
+		errors = []
+		for index, item in enumerate(items):
+			try:
+				records.append(validation.memory_record(item))
+			except validation.ValidationError as e:
+				errors.append({"index": index, "message": str(e)})
+		if errors:
+			return func.HttpResponse(
+				json.dumps({
+					"status": "error",
+					"message": "Batch rejected: invalid records",
+					"errors": errors,
+				}),
+				status_code=400,
+				mimetype="application/json",
+			)
+
+		# Connection string from app settings
+		conn_str = os.environ.get("POSTGRES_CONNECTION")
+		if not conn_str:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": "POSTGRES_CONNECTION not set"}),
+				status_code=500,
+				mimetype="application/json",
+			)
+
+		# Offset each row by a microsecond so "newest first" reads return a
+		# replayed conversation in the order it was submitted
+		now = datetime.now(timezone.utc)
+		created = [now + timedelta(microseconds=i) for i in range(len(records))]
+
+		with db.connection() as conn:
+			schema.ensure_schema(conn)
+			cursor = conn.cursor()
+			try:
+				with timing.stage("query"):
+					inserted = writes.insert_memory(cursor, records, created)
+				with timing.stage("commit"):
+					conn.commit()
+			finally:
+				try:
+					cursor.close()
+				except Exception:
+					pass
+
+		cache.written("memory", [
+			dict(r, created_at=c.isoformat()) for r, c in writes.stored(records, created, inserted)
+		])
+
+		data = []
+		for index, r in enumerate(records):
+			status = "created" if r["id"] in inserted else "duplicate"
+			# Repeated ids inside one batch are only written once
+			inserted.discard(r["id"])
+			data.append({
+				"index": index,
+				"id": r["id"],
+				"status": status,
+				"created_at": created[index].isoformat(),
+			})
+
+		return func.HttpResponse(
+			json.dumps({
+				"status": "success",
+				"message": "Memory batch saved successfully",
+				"count": len(data),
+				"created": sum(1 for d in data if d["status"] == "created"),
+				"data": data,
+			}),
+			status_code=201,
+			mimetype="application/json",
+		)
+
+	except Exception as e:
+		return func.HttpResponse(
+			json.dumps({
+				"status": "error",
+				"message": str(e),
+				"timestamp": datetime.utcnow().isoformat(),
+			}),
+			status_code=500,
+			mimetype="application/json",
+		)
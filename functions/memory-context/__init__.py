@@ -0,0 +1,86 @@
+import azure.functions as func
+import json
+from datetime import datetime
+import os
+
+from shared_code import compaction, context, db, encoding, schema, timing, validation
+
+ROWS = encoding.RowEncoder(context.COLUMNS)
+
+
+@timing.instrument("memory-context")
+def main(req: func.HttpRequest) -> func.HttpResponse:
+	"""GET endpoint for the newest messages of a session that fit a token budget"""
+	try:
+		tenant_id = req.params.get("tenant_id")
+		user_id = req.params.get("user_id")
+		session_id = req.params.get("session_id")
+
+		if not tenant_id or not session_id:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": "tenant_id and session_id are required"}),
+				status_code=400,
+				mimetype="application/json",
+			)
+
+		try:
+			budget = context.parse_budget(req.params.get("token_budget"))
+		except validation.ValidationError as e:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": str(e)}),
+				status_code=400,
+				mimetype="application/json",
+			)
+
+		conn_str = os.environ.get("POSTGRES_CONNECTION")
+		if not conn_str:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": "POSTGRES_CONNECTION not set"}),
+				status_code=500,
+				mimetype="application/json",
+			)
+
+		with db.connection() as conn:
+			schema.ensure_schema(conn)
+			cursor = conn.cursor()
+			try:
+				with timing.stage("query"):
+					summary = compaction.fetch_summary(cursor, tenant_id, session_id)
+				rows, summary, used, truncated = context.collect(
+					cursor, tenant_id, session_id, budget, user_id, summary
+				)
+				conn.commit()
+			finally:
+				try:
+					cursor.close()
+				except Exception:
+					pass
+
+		with timing.stage("serialize"):
+			data = ROWS.dicts(rows)
+			body = encoding.dumps({
+				"status": "success",
+				"session_id": session_id,
+				"token_budget": budget,
+				"token_count": used,
+				"truncated": truncated,
+				"summary": summary,
+				"count": len(data),
+				"data": data,
+			})
+		return func.HttpResponse(
+			body,
+			status_code=200,
+			mimetype="application/json",
+		)
+
+	except Exception as e:
+		return func.HttpResponse(
+			json.dumps({
+				"status": "error",
+				"message": str(e),
+				"timestamp": datetime.utcnow().isoformat(),
+			}),
+			status_code=500,
+			mimetype="application/json",
+		)
@@ -1,43 +1,12 @@
 import azure.functions as func
 import json
-from datetime import datetime
+from datetime import datetime, timezone
 import os
-import urllib.parse
-import pg8000
-import ssl
 
-
-def get_db_params_from_url(conn_str: str):
-	parsed = urllib.parse.urlparse(conn_str)
-	username = urllib.parse.unquote(parsed.username) if parsed.username else None
-	password = urllib.parse.unquote(parsed.password) if parsed.password else None
-	return {
-		"host": parsed.hostname,
-		"port": parsed.port or 5432,
-		"user": username,
-		"password": password,
-		"database": parsed.path[1:] if parsed.path else "postgres",
-		"ssl_context": ssl.create_default_context(),
-	}
-
-
-def ensure_memory_table(cursor) -> None:
-	cursor.execute(
-		"""
-		CREATE TABLE IF NOT EXISTS chat_memory (
-			id VARCHAR(36) PRIMARY KEY,
-			tenant_id VARCHAR(255) NOT NULL,
-			user_id VARCHAR(255) NOT NULL,
-			session_id VARCHAR(255) NOT NULL,
-			content TEXT NOT NULL,
-			message_type VARCHAR(50) NOT NULL,
-			created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-			metadata JSONB
-		)
-		"""
-	)
+from shared_code import cache, db, schema, timing, validation, writebehind, writes
 
 
+@timing.instrument("memory-post")
 def main(req: func.HttpRequest) -> func.HttpResponse:
 	"""POST endpoint to save chat memory to PostgreSQL using pg8000"""
 	try:
@@ -45,17 +14,14 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 		req_body = req.get_json()
 
 		# Validate required fields
-		required_fields = ["tenant_id", "user_id", "session_id", "content"]
-		for field in required_fields:
-			if field not in req_body:
-				return func.HttpResponse(
-					json.dumps({
-						"status": "error",
-						"message": f"Missing required field: {field}"
-					}),
-					status_code=400,
-					mimetype="application/json",
-				)
+		try:
+			record = validation.memory_record(req_body)
+		except validation.ValidationError as e:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": str(e)}),
+				status_code=400,
+				mimetype="application/json",
+			)
 
 		# Connection string from app settings
 		conn_str = os.environ.get("POSTGRES_CONNECTION")
@@ -66,59 +32,54 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 				mimetype="application/json",
 			)
 
-		params = get_db_params_from_url(conn_str)
-		conn = pg8000.connect(**params)
-		try:
-			cursor = conn.cursor()
-
-			# Ensure table exists
-			ensure_memory_table(cursor)
-
-			# Prepare insert
-			memory_id = req_body.get("id") or req_body.get("uuid") or __import__("uuid").uuid4().hex
-			message_type = req_body.get("message_type", "chat")
-			metadata = req_body.get("metadata") or {}
-
-			cursor.execute(
-				"""
-				INSERT INTO chat_memory (
-					id, tenant_id, user_id, session_id, content, message_type, created_at, metadata
-				) VALUES (
-					%s, %s, %s, %s, %s, %s, %s, %s::jsonb
+		created_at = datetime.now(timezone.utc)
+		if writebehind.ENABLED:
+			# Durably queued; the flusher writes it to Postgres shortly after
+			data = dict(record, created_at=created_at.isoformat())
+			try:
+				with timing.stage("enqueue"):
+					writebehind.enqueue("memory", [data])
+			except writebehind.QueueFull as e:
+				return func.HttpResponse(
+					json.dumps({"status": "error", "message": f"Write queue full, retry later: {e}"}),
+					status_code=503,
+					headers={"Retry-After": "1"},
+					mimetype="application/json",
 				)
-				""",
-				[
-					memory_id,
-					req_body["tenant_id"],
-					req_body["user_id"],
-					req_body["session_id"],
-					req_body["content"],
-					message_type,
-					datetime.utcnow(),
-					json.dumps(metadata),
-				],
+			return func.HttpResponse(
+				json.dumps({"status": "accepted", "message": "Memory queued for saving", "data": data}),
+				status_code=202,
+				mimetype="application/json",
 			)
-			conn.commit()
-		finally:
+
+		with db.connection() as conn:
+			schema.ensure_schema(conn)
+			cursor = conn.cursor()
 			try:
-				cursor.close()
-			except Exception:
-				pass
-			conn.close()
+				with timing.stage("query"):
+					# Skips an id already stored in any month (a retried POST)
+					inserted = writes.insert_memory(cursor, [record], [created_at])
+				with timing.stage("commit"):
+					conn.commit()
+			finally:
+				try:
+					cursor.close()
+				except Exception:
+					pass
+
+		data = dict(record, created_at=created_at.isoformat())
+		if not inserted:
+			return func.HttpResponse(
+				json.dumps({"status": "success", "message": "Memory already saved (duplicate id)", "data": data}),
+				status_code=200,
+				mimetype="application/json",
+			)
+		cache.written("memory", [data])
 
 		response = {
 			"status": "success",
 			"message": "Memory saved successfully",
-			"data": {
-				"id": memory_id,
-				"tenant_id": req_body["tenant_id"],
-				"user_id": req_body["user_id"],
-				"session_id": req_body["session_id"],
-				"content": req_body["content"],
-				"message_type": message_type,
-				"created_at": datetime.utcnow().isoformat(),
-				"metadata": metadata,
-			},
+			"data": data,
 		}
 
 		return func.HttpResponse(
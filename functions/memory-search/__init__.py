@@ -0,0 +1,79 @@
+import azure.functions as func
+import json
+from datetime import datetime
+import os
+
+from shared_code import db, encoding, pagination, schema, search, timing, validation
+
+ROWS = encoding.RowEncoder(search.COLUMNS)
+
+
+@timing.instrument("memory-search")
+def main(req: func.HttpRequest) -> func.HttpResponse:
+	"""GET endpoint for ranked full-text search over chat memory content"""
+	try:
+		tenant_id = req.params.get("tenant_id")
+		user_id = req.params.get("user_id")
+		session_id = req.params.get("session_id")
+
+		if not tenant_id:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": "tenant_id is required"}),
+				status_code=400,
+				mimetype="application/json",
+			)
+
+		try:
+			q = search.parse_query(req.params.get("q"))
+			limit = pagination.page_limit(req.params.get("limit"))
+			cursor_token = req.params.get("cursor")
+			after = search.decode_cursor(cursor_token) if cursor_token else None
+		except validation.ValidationError as e:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": str(e)}),
+				status_code=400,
+				mimetype="application/json",
+			)
+
+		conn_str = os.environ.get("POSTGRES_CONNECTION")
+		if not conn_str:
+			return func.HttpResponse(
+				json.dumps({"status": "error", "message": "POSTGRES_CONNECTION not set"}),
+				status_code=500,
+				mimetype="application/json",
+			)
+
+		with db.connection() as conn:
+			schema.ensure_schema(conn)
+			cursor = conn.cursor()
+			try:
+				query, q_params = search.build_query(q, tenant_id, user_id, session_id, after, limit)
+				with timing.stage("query"):
+					cursor.execute(query, q_params)
+					fetched = cursor.fetchall()
+				conn.commit()
+			finally:
+				try:
+					cursor.close()
+				except Exception:
+					pass
+
+		with timing.stage("serialize"):
+			rows, next_cursor = search.split_page(fetched, limit)
+			body = encoding.page(ROWS.dicts(rows), next_cursor)
+		return func.HttpResponse(
+			body,
+			status_code=200,
+			mimetype="application/json",
+		)
+
+	except Exception as e:
+		return func.HttpResponse(
+			json.dumps({
+				"status": "error",
+				"message": str(e),
+				"timestamp": datetime.utcnow().isoformat(),
+			}),
+			status_code=500,
+			mimetype="application/json",
+		)
@@ -0,0 +1,19 @@
+import azure.functions as func
+import logging
+import os
+
+from shared_code import db, partitions, schema
+
+
+def main(timer: func.TimerRequest) -> None:
+	"""Daily timer: create upcoming monthly partitions and expire old ones"""
+	if not os.environ.get("POSTGRES_CONNECTION"):
+		logging.error("Partition maintenance skipped: POSTGRES_CONNECTION not set")
+		return
+	if timer.past_due:
+		logging.warning("Partition maintenance timer is running late")
+
+	with db.connection() as conn:
+		schema.ensure_schema(conn)
+		summary = partitions.run(conn)
+	logging.info("Partition maintenance finished: %s", summary)
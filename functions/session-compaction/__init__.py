@@ -0,0 +1,19 @@
+import azure.functions as func
+import logging
+import os
+
+from shared_code import compaction, db, schema
+
+
+def main(timer: func.TimerRequest) -> None:
+	"""Hourly timer: fold messages past the compaction horizon into session summaries"""
+	if not os.environ.get("POSTGRES_CONNECTION"):
+		logging.error("Session compaction skipped: POSTGRES_CONNECTION not set")
+		return
+	if timer.past_due:
+		logging.warning("Session compaction timer is running late")
+
+	with db.connection() as conn:
+		schema.ensure_schema(conn)
+		summary = compaction.run(conn)
+	logging.info("Session compaction finished: %s", summary)
@@ -0,0 +1 @@
+"""Helpers shared by the Apex Azure Functions handlers."""
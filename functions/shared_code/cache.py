@@ -0,0 +1,401 @@
+"""Read-through cache for the first page of ``GET /api/memory`` and ``/api/feedback``.
+
+The add-in re-reads a session's recent messages before every prompt. First
+pages are cached under ``(kind, tenant_id, user_id, session_id|response_id,
+limit)``. A cached page holds the first ``limit + 1`` rows, look-ahead row
+included (see :func:`pagination.apply`), so the POST handlers can keep it
+exact by pushing new rows on the front and trimming back to ``limit + 1``
+(write-through) instead of dropping it (``CACHE_MODE=invalidate``). Session
+summaries (:mod:`shared_code.compaction`) are cached next to the pages and
+dropped, with the session's pages, when the session is compacted.
+
+Backends (``CACHE_BACKEND``):
+
+- ``memory`` (default): per worker process LRU bounded by the encoded size of
+  the cached rows (``CACHE_MAX_BYTES``, default 16 MiB, ``0`` disables)
+- ``redis``: any Redis-protocol server at ``CACHE_REDIS_URL`` (Azure Cache for
+  Redis: ``rediss://:<key>@<name>.redis.cache.windows.net:6380/0``), shared
+  by every worker and instance, so scaled-out workers start warm. Requires
+  the ``redis`` package. Multi-key reads and writes are pipelined.
+
+``CACHE_TTL`` (seconds, default 30) bounds staleness from writes that bypass
+this module, e.g. another worker's writes with the ``memory`` backend. Cache
+errors are counted and treated as misses; requests never fail on the cache.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from shared_code import encoding, pagination, timing
+
+# Row fields that the two filter slots of a key refer to, per kind
+FILTERS = {
+	"memory": ("user_id", "session_id"),
+	"feedback": ("user_id", "response_id"),
+}
+
+
+def _encode(obj) -> str:
+	return json.dumps(obj, separators=(",", ":"))
+
+
+class CacheBackend:
+	"""Storage for cached pages: lists of row dicts, newest first.
+
+	Keys are tuples whose first two items, ``(kind, tenant_id)``, form the tag
+	used to find every page a write may touch, and whose last item is the
+	page limit.
+	"""
+
+	def get_many(self, keys) -> list:
+		"""Row lists for ``keys`` (``None`` for misses), in one round trip."""
+		raise NotImplementedError
+
+	def put(self, key, rows) -> None:
+		raise NotImplementedError
+
+	def prepend(self, tag, rows_for) -> None:
+		"""Push ``rows_for(key)`` (oldest first) onto each cached page under ``tag``.
+
+		Pages are trimmed back to ``limit + 1`` rows; missing pages stay missing.
+		"""
+		raise NotImplementedError
+
+	def delete(self, tag, match) -> None:
+		raise NotImplementedError
+
+	def stats(self) -> dict:
+		raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+	"""Thread-safe in-process LRU with per-entry TTL and a size budget in bytes."""
+
+	def __init__(self, max_bytes, ttl) -> None:
+		self.max_bytes = max_bytes
+		self.ttl = ttl
+		self._entries = OrderedDict()  # key -> (expires, size, rows)
+		self._tags = {}  # tag -> set of keys
+		self._bytes = 0
+		self._lock = threading.Lock()
+		self._stats = {
+			"hits": 0,
+			"misses": 0,
+			"evictions": 0,
+			"expirations": 0,
+			"invalidations": 0,
+			"updates": 0,
+		}
+
+	def _drop(self, key) -> None:
+		_, size, _ = self._entries.pop(key)
+		self._bytes -= size
+		keys = self._tags.get(key[:2])
+		if keys is not None:
+			keys.discard(key)
+			if not keys:
+				del self._tags[key[:2]]
+
+	def _store(self, key, expires, rows) -> None:
+		size = sum(len(encoding.dumps(r)) for r in rows)
+		if size > self.max_bytes:
+			return
+		self._entries[key] = (expires, size, rows)
+		self._tags.setdefault(key[:2], set()).add(key)
+		self._bytes += size
+		while self._bytes > self.max_bytes:
+			self._drop(next(iter(self._entries)))
+			self._stats["evictions"] += 1
+
+	def get_many(self, keys) -> list:
+		out = []
+		with self._lock:
+			now = time.monotonic()
+			for key in keys:
+				entry = self._entries.get(key)
+				if entry is not None and entry[0] <= now:
+					self._drop(key)
+					self._stats["expirations"] += 1
+					entry = None
+				if entry is None:
+					self._stats["misses"] += 1
+					out.append(None)
+					continue
+				self._entries.move_to_end(key)
+				self._stats["hits"] += 1
+				out.append(entry[2])
+		return out
+
+	def put(self, key, rows) -> None:
+		with self._lock:
+			if key in self._entries:
+				self._drop(key)
+			self._store(key, time.monotonic() + self.ttl, list(rows))
+
+	def prepend(self, tag, rows_for) -> None:
+		with self._lock:
+			for key in list(self._tags.get(tag, ())):
+				pushed = rows_for(key)
+				if not pushed:
+					continue
+				expires, _, rows = self._entries[key]
+				self._drop(key)
+				self._store(key, expires, (pushed[::-1] + rows)[:key[-1] + 1])
+				self._stats["updates"] += 1
+
+	def delete(self, tag, match) -> None:
+		with self._lock:
+			for key in [k for k in self._tags.get(tag, ()) if match(k)]:
+				self._drop(key)
+				self._stats["invalidations"] += 1
+
+	def stats(self) -> dict:
+		with self._lock:
+			stats = dict(self._stats)
+			stats["entries"] = len(self._entries)
+			stats["bytes"] = self._bytes
+			stats["max_bytes"] = self.max_bytes
+		return stats
+
+
+class RedisBackend(CacheBackend):
+	"""Pages as Redis lists of JSON rows, shared by every worker.
+
+	``client`` is a ``redis.Redis`` (or compatible, e.g. ``fakeredis``) client.
+	Each list ends with an empty-string marker so an empty page can be cached;
+	the marker falls off the end once a page is full. A set per tag records
+	the page keys so writes find them without ``SCAN``.
+	"""
+
+	def __init__(self, client, ttl, prefix="apex:cache:") -> None:
+		self._client = client
+		self.ttl = ttl
+		self.prefix = prefix
+		self._lock = threading.Lock()
+		self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "updates": 0}
+
+	@classmethod
+	def from_url(cls, url, ttl):
+		import redis
+
+		return cls(
+			redis.Redis.from_url(url, socket_timeout=1.0, socket_connect_timeout=1.0),
+			ttl,
+		)
+
+	def _name(self, key) -> str:
+		return self.prefix + _encode(list(key))
+
+	def _tag(self, tag) -> str:
+		return self.prefix + "tag:" + _encode(list(tag))
+
+	def _members(self, tag) -> list:
+		names = self._client.smembers(self._tag(tag))
+		return [
+			(name, tuple(json.loads(name[len(self.prefix):])))
+			for name in (n.decode("utf-8") if isinstance(n, bytes) else n for n in names)
+		]
+
+	def _count(self, stat, n=1) -> None:
+		with self._lock:
+			self._stats[stat] += n
+
+	def get_many(self, keys) -> list:
+		pipe = self._client.pipeline(transaction=False)
+		for key in keys:
+			pipe.lrange(self._name(key), 0, -1)
+		out = []
+		for items in pipe.execute():
+			if not items:
+				self._count("misses")
+				out.append(None)
+				continue
+			self._count("hits")
+			out.append([encoding.loads(item) for item in items if item not in (b"", "")])
+		return out
+
+	def put(self, key, rows) -> None:
+		name = self._name(key)
+		tag = self._tag(key[:2])
+		pipe = self._client.pipeline(transaction=True)
+		pipe.delete(name)
+		pipe.rpush(name, *[encoding.dumps(r) for r in rows], "")
+		pipe.expire(name, max(1, int(self.ttl)))
+		pipe.sadd(tag, name)
+		pipe.expire(tag, max(1, int(self.ttl)))
+		pipe.execute()
+
+	def prepend(self, tag, rows_for) -> None:
+		pipe = self._client.pipeline(transaction=True)
+		updates = 0
+		for name, key in self._members(tag):
+			pushed = rows_for(key)
+			if not pushed:
+				continue
+			# LPUSHX leaves expired pages missing; LPUSH order puts the last row first
+			pipe.lpushx(name, *[encoding.dumps(r) for r in pushed])
+			pipe.ltrim(name, 0, key[-1])
+			updates += 1
+		if updates:
+			pipe.execute()
+			self._count("updates", updates)
+
+	def delete(self, tag, match) -> None:
+		names = [name for name, key in self._members(tag) if match(key)]
+		if names:
+			pipe = self._client.pipeline(transaction=True)
+			pipe.delete(*names)
+			pipe.srem(self._tag(tag), *names)
+			pipe.execute()
+			self._count("invalidations", len(names))
+
+	def stats(self) -> dict:
+		with self._lock:
+			return dict(self._stats, backend="redis")
+
+
+TTL = float(os.environ.get("CACHE_TTL", "30"))
+WRITE_THROUGH = os.environ.get("CACHE_MODE", "write-through") != "invalidate"
+
+_backend = None
+_backend_lock = threading.Lock()
+_errors = 0
+
+
+def get_backend():
+	"""Return the worker's backend from app settings, or None when disabled."""
+	global _backend
+	if _backend is None:
+		with _backend_lock:
+			if _backend is None:
+				kind = os.environ.get("CACHE_BACKEND", "memory")
+				max_bytes = int(os.environ.get("CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+				if kind == "redis":
+					_backend = RedisBackend.from_url(os.environ["CACHE_REDIS_URL"], TTL)
+				elif kind == "memory" and max_bytes > 0:
+					_backend = LRUCache(max_bytes, TTL)
+				else:
+					_backend = False
+	return _backend or None
+
+
+def set_backend(backend) -> None:
+	"""Install a backend explicitly (e.g. ``RedisBackend(fakeredis.FakeRedis(), ttl)``)."""
+	global _backend
+	_backend = backend if backend is not None else False
+
+
+def _failed() -> None:
+	global _errors
+	_errors += 1
+
+
+def page_key(kind, tenant_id, first, second, limit):
+	"""Cache key of a first page; ``first``/``second`` follow :data:`FILTERS`."""
+	return (kind, tenant_id, first or None, second or None, limit)
+
+
+def get_page(key):
+	"""``(data, next_cursor)`` for a cached first page, or None on a miss."""
+	backend = get_backend()
+	if backend is None:
+		return None
+	try:
+		with timing.stage("cache"):
+			rows = backend.get_many([key])[0]
+	except Exception:
+		_failed()
+		return None
+	if rows is None:
+		return None
+	limit = key[-1]
+	if len(rows) <= limit:
+		return rows, None
+	last = rows[limit - 1]
+	created_at = last["created_at"]
+	if isinstance(created_at, str):
+		# Rows from Redis and from the write-through path carry ISO strings
+		created_at = datetime.fromisoformat(created_at)
+	return rows[:limit], pagination.encode_cursor(created_at, last["id"])
+
+
+def put_page(key, rows) -> None:
+	"""Cache a first page: ``rows`` are up to ``limit + 1`` row dicts, newest first."""
+	backend = get_backend()
+	if backend is None:
+		return
+	try:
+		with timing.stage("cache"):
+			backend.put(key, rows)
+	except Exception:
+		_failed()
+
+
+def written(kind, rows) -> None:
+	"""Apply freshly inserted row dicts (oldest first) to the cached pages they belong to."""
+	backend = get_backend()
+	if backend is None or not rows:
+		return
+	first, second = FILTERS[kind]
+
+	def belongs(key, row):
+		return key[2] in (None, row[first]) and key[3] in (None, row[second])
+
+	by_tenant = {}
+	for row in rows:
+		by_tenant.setdefault(row["tenant_id"], []).append(row)
+	for tenant_id, tenant_rows in by_tenant.items():
+		tag = (kind, tenant_id)
+		try:
+			if WRITE_THROUGH:
+				backend.prepend(tag, lambda key: [r for r in tenant_rows if belongs(key, r)])
+			else:
+				backend.delete(tag, lambda key: any(belongs(key, r) for r in tenant_rows))
+		except Exception:
+			_failed()
+
+
+def summary_key(tenant_id, session_id):
+	"""Cache key of a session summary (tagged apart from pages, see :func:`written`)."""
+	return ("summary", tenant_id, None, session_id, 0)
+
+
+def get_summary(tenant_id, session_id):
+	"""``[summary]`` or ``[]`` (session not compacted) when cached, None on a miss."""
+	backend = get_backend()
+	if backend is None:
+		return None
+	try:
+		with timing.stage("cache"):
+			return backend.get_many([summary_key(tenant_id, session_id)])[0]
+	except Exception:
+		_failed()
+		return None
+
+
+def put_summary(tenant_id, session_id, summary) -> None:
+	"""Cache a session summary dict, or its absence for ``None``."""
+	put_page(summary_key(tenant_id, session_id), [summary] if summary else [])
+
+
+def compacted(tenant_id, session_id) -> None:
+	"""Drop the cached summary and pages of a session whose messages were just archived."""
+	backend = get_backend()
+	if backend is None:
+		return
+	try:
+		backend.delete(("memory", tenant_id), lambda key: key[3] in (None, session_id))
+		backend.delete(("summary", tenant_id), lambda key: key[3] == session_id)
+	except Exception:
+		_failed()
+
+
+def stats() -> dict:
+	backend = get_backend()
+	if backend is None:
+		return {"enabled": False}
+	return dict(backend.stats(), errors=_errors)
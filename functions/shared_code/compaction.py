@@ -0,0 +1,267 @@
+"""Session compaction: fold old chat memory into one rolling summary per session.
+
+Long-running sessions accumulate thousands of ``chat_memory.messages`` rows.
+This job runs hourly as the ``session-compaction`` timer function and by hand
+with ``python -m shared_code.compaction`` from the ``functions`` folder. For
+each session with at least ``COMPACTION_MIN_MESSAGES`` (default 50) live
+messages older than ``COMPACTION_HORIZON_HOURS`` (default 168), it:
+
+1. reads up to ``COMPACTION_BATCH`` (default 1000) of them, oldest first;
+2. passes the session's previous summary and those messages to the
+   summarizer, which returns the new summary text;
+3. upserts ``chat_memory.session_summaries`` (migration 011) with the new
+   text and the ``(created_at, id)`` of the newest message folded in, and
+   sets ``archived_at`` on the folded messages, in one transaction.
+
+Reads (``GET /api/memory`` and ``/api/memory/context`` with a ``session_id``)
+return the summary plus the session's live rows (:data:`LIVE_FILTER`), a
+range of the partial index on live messages (migration 014) that does not
+grow with the session's age. They do not start after the summary's keyset
+position: a message written late with an older ``created_at`` is live
+behind it until the next run folds it in. The position only ever moves
+forward. Archived rows stay in place (and expire with their partition).
+
+``COMPACTION_SUMMARIZER`` picks the summarizer: ``stub`` (default, the
+deterministic :func:`stub_summarizer`) or a ``package.module:function`` path
+to any callable ``summarize(previous, messages) -> str``, where ``previous``
+is the current summary text or ``None`` and ``messages`` are dicts with
+``id``, ``user_id``, ``message_type``, ``content`` and ``created_at``, oldest
+first. :func:`set_summarizer` installs one in process.
+"""
+
+import importlib
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from shared_code import cache, tokens
+
+HORIZON_HOURS = float(os.environ.get("COMPACTION_HORIZON_HOURS", "168"))
+MIN_MESSAGES = int(os.environ.get("COMPACTION_MIN_MESSAGES", "50"))
+BATCH = int(os.environ.get("COMPACTION_BATCH", "1000"))
+MAX_SESSIONS = int(os.environ.get("COMPACTION_MAX_SESSIONS", "200"))
+# Upper bound on the stub summary; custom summarizers should keep theirs short too
+SUMMARY_MAX_TOKENS = int(os.environ.get("COMPACTION_SUMMARY_TOKENS", "1000"))
+STUB_LINE_CHARS = 160
+
+# Arbitrary key for pg_advisory_lock so the timer and a manual run never overlap
+_ADVISORY_LOCK_KEY = 7200111
+
+# Restricts a message query to rows not folded into a summary
+LIVE_FILTER = " AND archived_at IS NULL"
+
+SUMMARY_COLUMNS = (
+	"content", "token_count", "message_count", "first_created_at",
+	"through_created_at", "through_id", "updated_at",
+)
+
+_summarizer = None
+_summarizer_lock = threading.Lock()
+
+
+def stub_summarizer(previous, messages) -> str:
+	"""Deterministic extractive summary: one clipped line per message, newest kept.
+
+	Lines are ``[YYYY-MM-DD HH:MM] message_type: content``; the oldest lines
+	are dropped once the summary exceeds ``COMPACTION_SUMMARY_TOKENS``.
+	"""
+	lines = previous.splitlines() if previous else []
+	for message in messages:
+		text = " ".join(message["content"].split())
+		if len(text) > STUB_LINE_CHARS:
+			text = text[:STUB_LINE_CHARS - 3] + "..."
+		lines.append(f"[{message['created_at']:%Y-%m-%d %H:%M}] {message['message_type']}: {text}")
+	kept = []
+	used = 0
+	for line in reversed(lines):
+		cost = tokens.count(line) + 1
+		if used + cost > SUMMARY_MAX_TOKENS:
+			break
+		kept.append(line)
+		used += cost
+	return "\n".join(reversed(kept))
+
+
+SUMMARIZERS = {"stub": stub_summarizer}
+
+
+def _load_summarizer(name):
+	if name in SUMMARIZERS:
+		return SUMMARIZERS[name]
+	module_name, sep, attr = name.partition(":")
+	if not sep:
+		raise ValueError(
+			f"COMPACTION_SUMMARIZER must be one of {', '.join(SUMMARIZERS)} or a module:function path"
+		)
+	return getattr(importlib.import_module(module_name), attr)
+
+
+def get_summarizer():
+	"""Return ``(name, summarize)`` from app settings."""
+	global _summarizer
+	if _summarizer is None:
+		with _summarizer_lock:
+			if _summarizer is None:
+				name = os.environ.get("COMPACTION_SUMMARIZER", "stub")
+				_summarizer = (name, _load_summarizer(name))
+	return _summarizer
+
+
+def set_summarizer(summarize, name=None) -> None:
+	"""Install a summarizer explicitly (``None`` goes back to the app setting)."""
+	global _summarizer
+	if summarize is None:
+		_summarizer = None
+	else:
+		_summarizer = (name or getattr(summarize, "__name__", "custom"), summarize)
+
+
+def fetch_summary(cursor, tenant_id, session_id):
+	"""The session's summary as a dict of :data:`SUMMARY_COLUMNS`, or None."""
+	cursor.execute(
+		f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM chat_memory.session_summaries "
+		"WHERE tenant_id = %s AND session_id = %s",
+		[tenant_id, session_id],
+	)
+	row = cursor.fetchone()
+	return dict(zip(SUMMARY_COLUMNS, row)) if row else None
+
+
+def candidate_sessions(cursor, cutoff, min_messages=MIN_MESSAGES, limit=MAX_SESSIONS, tenant_id=None) -> list:
+	"""``[(tenant_id, session_id, messages)]`` due for compaction, longest waiting first."""
+	query = (
+		"SELECT tenant_id, session_id, count(*) FROM chat_memory.messages "
+		"WHERE archived_at IS NULL AND created_at < %s"
+	)
+	q_params = [cutoff]
+	if tenant_id:
+		query += " AND tenant_id = %s"
+		q_params.append(tenant_id)
+	query += " GROUP BY tenant_id, session_id HAVING count(*) >= %s ORDER BY min(created_at) LIMIT %s"
+	q_params.extend([min_messages, limit])
+	cursor.execute(query, q_params)
+	return [tuple(row) for row in cursor.fetchall()]
+
+
+def compact_session(cursor, tenant_id, session_id, cutoff, batch=BATCH) -> int:
+	"""Fold up to ``batch`` messages older than ``cutoff`` into the summary; returns how many.
+
+	The caller commits.
+	"""
+	name, summarize = get_summarizer()
+	cursor.execute(
+		"SELECT content FROM chat_memory.session_summaries "
+		"WHERE tenant_id = %s AND session_id = %s FOR UPDATE",
+		[tenant_id, session_id],
+	)
+	row = cursor.fetchone()
+	previous = row[0] if row else None
+	cursor.execute(
+		"SELECT id, user_id, message_type, content, created_at FROM chat_memory.messages "
+		"WHERE tenant_id = %s AND session_id = %s AND archived_at IS NULL AND created_at < %s "
+		"ORDER BY created_at, id LIMIT %s",
+		[tenant_id, session_id, cutoff, batch],
+	)
+	messages = [
+		dict(zip(("id", "user_id", "message_type", "content", "created_at"), r))
+		for r in cursor.fetchall()
+	]
+	if not messages:
+		return 0
+	text = summarize(previous, messages)
+	first, last = messages[0], messages[-1]
+	cursor.execute(
+		"""
+		INSERT INTO chat_memory.session_summaries (
+			tenant_id, session_id, content, token_count, message_count,
+			first_created_at, through_created_at, through_id, summarizer
+		) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+		ON CONFLICT (tenant_id, session_id) DO UPDATE SET
+			content = EXCLUDED.content,
+			token_count = EXCLUDED.token_count,
+			message_count = chat_memory.session_summaries.message_count + EXCLUDED.message_count,
+			first_created_at = LEAST(chat_memory.session_summaries.first_created_at, EXCLUDED.first_created_at),
+			-- Late writes fold in behind the position; never move it back
+			through_created_at = CASE
+				WHEN (EXCLUDED.through_created_at, EXCLUDED.through_id)
+					> (chat_memory.session_summaries.through_created_at, chat_memory.session_summaries.through_id)
+				THEN EXCLUDED.through_created_at ELSE chat_memory.session_summaries.through_created_at END,
+			through_id = CASE
+				WHEN (EXCLUDED.through_created_at, EXCLUDED.through_id)
+					> (chat_memory.session_summaries.through_created_at, chat_memory.session_summaries.through_id)
+				THEN EXCLUDED.through_id ELSE chat_memory.session_summaries.through_id END,
+			summarizer = EXCLUDED.summarizer,
+			updated_at = CURRENT_TIMESTAMP
+		""",
+		[
+			tenant_id, session_id, text, tokens.count(text), len(messages),
+			first["created_at"], last["created_at"], last["id"], name,
+		],
+	)
+	# created_at bounds prune the update to the months involved
+	cursor.execute(
+		"UPDATE chat_memory.messages SET archived_at = CURRENT_TIMESTAMP "
+		"WHERE tenant_id = %s AND session_id = %s AND id = ANY(%s::varchar[]) "
+		"AND created_at >= %s AND created_at <= %s",
+		[tenant_id, session_id, [m["id"] for m in messages], first["created_at"], last["created_at"]],
+	)
+	return len(messages)
+
+
+def run(conn, now=None, horizon_hours=HORIZON_HOURS, tenant_id=None, dry_run=False) -> dict:
+	"""Compact every due session, committing after each one."""
+	now = now or datetime.now(timezone.utc)
+	cutoff = now - timedelta(hours=horizon_hours)
+	summary = {"cutoff": cutoff.isoformat(), "sessions": 0, "messages": 0}
+	cursor = conn.cursor()
+	locked = False
+	try:
+		cursor.execute("SELECT pg_try_advisory_lock(%s)", [_ADVISORY_LOCK_KEY])
+		locked = cursor.fetchone()[0]
+		conn.commit()
+		if not locked:
+			return dict(summary, skipped="another compaction is running")
+		sessions = candidate_sessions(cursor, cutoff, tenant_id=tenant_id)
+		conn.commit()
+		if dry_run:
+			return dict(summary, candidates=[
+				{"tenant_id": t, "session_id": s, "messages": n} for t, s, n in sessions
+			])
+		for session_tenant, session_id, _ in sessions:
+			folded = compact_session(cursor, session_tenant, session_id, cutoff)
+			conn.commit()
+			cache.compacted(session_tenant, session_id)
+			summary["sessions"] += 1
+			summary["messages"] += folded
+			logging.info("Compacted %d messages of %s/%s", folded, session_tenant, session_id)
+	except Exception:
+		conn.rollback()
+		raise
+	finally:
+		if locked:
+			cursor.execute("SELECT pg_advisory_unlock(%s)", [_ADVISORY_LOCK_KEY])
+			conn.commit()
+		cursor.close()
+	return summary
+
+
+if __name__ == "__main__":
+	import argparse
+	import json
+
+	from shared_code import db, schema
+
+	parser = argparse.ArgumentParser(description="Fold old chat memory into per-session summaries")
+	parser.add_argument("--horizon-hours", type=float, default=HORIZON_HOURS)
+	parser.add_argument("--tenant", help="only compact this tenant's sessions")
+	parser.add_argument("--dry-run", action="store_true", help="list the sessions due without changing them")
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.INFO)
+	with db.connection() as conn:
+		schema.ensure_schema(conn)
+		print(json.dumps(
+			run(conn, horizon_hours=args.horizon_hours, tenant_id=args.tenant, dry_run=args.dry_run),
+			indent=2,
+		))
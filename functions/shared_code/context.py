@@ -0,0 +1,97 @@
+"""Token-budgeted session context behind ``GET /api/memory/context``.
+
+The add-in used to download a session's whole history with ``GET
+/api/memory`` and trim it to the model's context window itself. Instead
+:func:`collect` walks the session newest first in keyset pages on the
+``(tenant_id, session_id, created_at DESC, id DESC)`` index and stops reading
+at the first message that no longer fits, so a request reads about as many
+rows as it returns however long the session is.
+
+Each message costs its stored ``token_count`` (:mod:`shared_code.tokens`)
+plus ``TOKENS_PER_MESSAGE`` of framing. Messages written before migration 010
+have no stored count and are estimated from ``length(content)`` in SQL. The
+selection is always a contiguous newest tail: an older message is never
+included in place of a newer one that did not fit. A compacted session
+(:mod:`shared_code.compaction`) contributes only its live messages, and the
+summary counts as the oldest item: it is included when every live message
+fit and its ``token_count`` fits in what is left.
+"""
+
+import os
+
+from shared_code import compaction, pagination, timing, tokens
+from shared_code.validation import ValidationError
+
+MAX_TOKEN_BUDGET = int(os.environ.get("CONTEXT_MAX_TOKEN_BUDGET", "200000"))
+# Guess used to size the first page; later pages double up to MAX_PAGE_SIZE
+ASSUMED_MESSAGE_TOKENS = 64
+MIN_PAGE_SIZE = 16
+MAX_PAGE_SIZE = 500
+
+COLUMNS = ("id", "user_id", "session_id", "content", "message_type", "created_at", "metadata", "token_count")
+CREATED_AT = 5
+TOKEN_COUNT = 7
+
+SELECT_SQL = f"""
+	SELECT id, user_id, session_id, content, message_type, created_at,
+		COALESCE(metadata, '{{}}'::jsonb),
+		COALESCE(token_count, ceil(length(content) / {float(tokens.CHARS_PER_TOKEN)})::int)
+	FROM chat_memory.messages
+	WHERE tenant_id = %s AND session_id = %s"""
+
+
+def parse_budget(raw) -> int:
+	"""Parse the ``token_budget`` query parameter (1 to ``MAX_TOKEN_BUDGET``)."""
+	if raw is None or raw == "":
+		raise ValidationError("token_budget is required")
+	try:
+		budget = int(raw)
+	except ValueError:
+		raise ValidationError("token_budget must be an integer")
+	if budget < 1 or budget > MAX_TOKEN_BUDGET:
+		raise ValidationError(f"token_budget must be between 1 and {MAX_TOKEN_BUDGET}")
+	return budget
+
+
+def collect(cursor, tenant_id, session_id, budget, user_id=None, summary=None):
+	"""Newest messages of a session that fit in ``budget`` tokens.
+
+	Returns ``(rows, summary, used, truncated)``: the rows (:data:`COLUMNS`)
+	oldest first, ready to be laid out as a prompt; ``summary`` if it fit,
+	else None; the tokens they use, framing included; and whether older
+	messages (or the summary) were left out.
+	"""
+	selected = []
+	used = 0
+	after = None
+	size = max(MIN_PAGE_SIZE, min(budget // ASSUMED_MESSAGE_TOKENS, MAX_PAGE_SIZE))
+	while True:
+		query = SELECT_SQL
+		q_params = [tenant_id, session_id]
+		if user_id:
+			query += " AND user_id = %s"
+			q_params.append(user_id)
+		query += compaction.LIVE_FILTER
+		query = pagination.apply(query, q_params, after, size)
+		with timing.stage("query"):
+			cursor.execute(query, q_params)
+			rows = cursor.fetchall()
+		for row in rows:
+			cost = row[TOKEN_COUNT] + tokens.MESSAGE_OVERHEAD
+			if used + cost > budget:
+				selected.reverse()
+				return selected, None, used, True
+			selected.append(row)
+			used += cost
+		# pagination.apply reads one row past the page: all of them were used
+		if len(rows) <= size:
+			selected.reverse()
+			if summary is None:
+				return selected, None, used, False
+			cost = summary["token_count"] + tokens.MESSAGE_OVERHEAD
+			if used + cost > budget:
+				return selected, None, used, True
+			return selected, summary, used + cost, False
+		last = rows[-1]
+		after = (last[CREATED_AT], last[0])
+		size = min(size * 2, MAX_PAGE_SIZE)
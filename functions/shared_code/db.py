@@ -0,0 +1,291 @@
+"""Per-worker pg8000 connection pool shared by the Functions handlers.
+
+Every handler used to parse ``POSTGRES_CONNECTION``, build an SSL context and
+open a fresh TLS connection per request. The pool below keeps a bounded set of
+warm connections per worker process so steady-state requests skip the
+reconnect entirely.
+
+Tunables (application settings):
+
+- ``PG_POOL_MAX_SIZE``: connections kept per worker process (default 5)
+- ``PG_POOL_MAX_AGE``: seconds before a connection is recycled (default 300)
+- ``PG_POOL_PING_AFTER``: idle seconds after which a connection is pinged
+  with ``SELECT 1`` before being handed out (default 30, ``0`` pings always)
+- ``PG_POOL_TIMEOUT``: seconds to wait for a free connection (default 10)
+- ``PG_PREWARM``: connections to open in the background as soon as a handler
+  loads, i.e. when the host starts the worker, schema check included (default
+  0, off). The ``warmup`` function does the same on Premium plans before an
+  instance receives traffic.
+
+``pg8000`` and ``ssl`` are imported with the first connection rather than with
+this module, and the SSL context is built once per process, so handlers that
+never reach the database (health, cache hits) do not pay for them.
+"""
+
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from collections import deque
+from contextlib import contextmanager
+
+from shared_code import encoding, timing
+
+
+class PoolTimeout(Exception):
+	"""Raised when no pooled connection becomes available in time."""
+
+
+_ssl = None
+_ssl_lock = threading.Lock()
+
+
+def _ssl_context():
+	"""The process-wide client SSL context (verifying, system CAs)."""
+	global _ssl
+	if _ssl is None:
+		with _ssl_lock:
+			if _ssl is None:
+				with timing.stage("ssl_context"):
+					import ssl
+
+					_ssl = ssl.create_default_context()
+	return _ssl
+
+
+def get_db_params_from_url(conn_str: str):
+	parsed = urllib.parse.urlparse(conn_str)
+	username = urllib.parse.unquote(parsed.username) if parsed.username else None
+	password = urllib.parse.unquote(parsed.password) if parsed.password else None
+	# TLS unless the URL says ?sslmode=disable (local Postgres, benchmarks)
+	sslmode = urllib.parse.parse_qs(parsed.query).get("sslmode", ["require"])[0]
+	return {
+		"host": parsed.hostname,
+		"port": parsed.port or 5432,
+		"user": username,
+		"password": password,
+		"database": parsed.path[1:] if parsed.path else "postgres",
+		"ssl_context": None if sslmode == "disable" else _ssl_context(),
+	}
+
+
+class _PooledConnection:
+	__slots__ = ("conn", "created_at", "last_used")
+
+	def __init__(self, conn) -> None:
+		now = time.monotonic()
+		self.conn = conn
+		self.created_at = now
+		self.last_used = now
+
+
+class ConnectionPool:
+	"""Bounded pool of warm pg8000 connections for one worker process."""
+
+	def __init__(self, params, max_size=5, max_age=300.0, ping_after=30.0, timeout=10.0) -> None:
+		self._params = params
+		self.max_size = max_size
+		self.max_age = max_age
+		self.ping_after = ping_after
+		self.timeout = timeout
+		self._idle = deque()
+		self._size = 0
+		self._cond = threading.Condition()
+		self._stats = {"hits": 0, "misses": 0, "recycled": 0, "discarded": 0, "timeouts": 0}
+
+	def _close(self, pooled) -> None:
+		try:
+			pooled.conn.close()
+		except Exception:
+			pass
+
+	def _check(self, pooled):
+		"""Return ``None`` if healthy, else the stats counter to bump."""
+		now = time.monotonic()
+		if now - pooled.created_at > self.max_age:
+			return "recycled"
+		if now - pooled.last_used >= self.ping_after:
+			try:
+				cursor = pooled.conn.cursor()
+				try:
+					cursor.execute("SELECT 1")
+					cursor.fetchall()
+				finally:
+					cursor.close()
+			except Exception:
+				return "discarded"
+		return None
+
+	def acquire(self):
+		with timing.stage("db_acquire"):
+			return self._acquire()
+
+	def _acquire(self):
+		deadline = time.monotonic() + self.timeout
+		while True:
+			with self._cond:
+				if self._idle:
+					pooled = self._idle.pop()
+				elif self._size < self.max_size:
+					self._size += 1
+					break
+				else:
+					remaining = deadline - time.monotonic()
+					if remaining <= 0:
+						self._stats["timeouts"] += 1
+						raise PoolTimeout(
+							f"No database connection available within {self.timeout}s"
+						)
+					self._cond.wait(remaining)
+					continue
+
+			# Health checks run outside the lock so a slow ping does not
+			# stall other threads of the same worker.
+			problem = self._check(pooled)
+			with self._cond:
+				if problem is None:
+					self._stats["hits"] += 1
+					return pooled
+				self._stats[problem] += 1
+				self._size -= 1
+				self._cond.notify()
+			self._close(pooled)
+
+		try:
+			with timing.stage("db_connect"):
+				import pg8000
+
+				conn = pg8000.connect(**self._params)
+				encoding.register_decoders(conn)
+				pooled = _PooledConnection(conn)
+		except Exception:
+			with self._cond:
+				self._size -= 1
+				self._cond.notify()
+			raise
+		with self._cond:
+			self._stats["misses"] += 1
+		return pooled
+
+	def release(self, pooled, discard=False) -> None:
+		if not discard:
+			try:
+				# Never hand out a connection with an open transaction
+				pooled.conn.rollback()
+			except Exception:
+				discard = True
+		with self._cond:
+			if discard:
+				self._size -= 1
+				self._stats["discarded"] += 1
+			else:
+				pooled.last_used = time.monotonic()
+				self._idle.append(pooled)
+			self._cond.notify()
+		if discard:
+			self._close(pooled)
+
+	@contextmanager
+	def connection(self):
+		pooled = self.acquire()
+		try:
+			yield pooled.conn
+		except Exception:
+			self.release(pooled, discard=True)
+			raise
+		else:
+			self.release(pooled)
+
+	def close(self) -> None:
+		with self._cond:
+			idle = list(self._idle)
+			self._idle.clear()
+			self._size -= len(idle)
+		for pooled in idle:
+			self._close(pooled)
+
+	def stats(self) -> dict:
+		with self._cond:
+			stats = dict(self._stats)
+			stats["size"] = self._size
+			stats["idle"] = len(self._idle)
+			stats["max_size"] = self.max_size
+		return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+	"""Return the worker's pool, creating it from app settings on first use."""
+	global _pool
+	if _pool is None:
+		with _pool_lock:
+			if _pool is None:
+				conn_str = os.environ.get("POSTGRES_CONNECTION")
+				if not conn_str:
+					raise RuntimeError("POSTGRES_CONNECTION not set")
+				_pool = ConnectionPool(
+					get_db_params_from_url(conn_str),
+					max_size=int(os.environ.get("PG_POOL_MAX_SIZE", "5")),
+					max_age=float(os.environ.get("PG_POOL_MAX_AGE", "300")),
+					ping_after=float(os.environ.get("PG_POOL_PING_AFTER", "30")),
+					timeout=float(os.environ.get("PG_POOL_TIMEOUT", "10")),
+				)
+	return _pool
+
+
+def connection():
+	"""Borrow a pooled connection: ``with db.connection() as conn: ...``"""
+	return get_pool().connection()
+
+
+def pool_stats():
+	"""Hit/miss counters for the worker's pool, or ``None`` before first use."""
+	return _pool.stats() if _pool is not None else None
+
+
+def prewarm(count=1) -> int:
+	"""Open up to ``count`` pooled connections and run the schema check on one.
+
+	Returns the number of connections opened.
+	"""
+	from shared_code import schema
+
+	pool = get_pool()
+	held = []
+	try:
+		# Held together so each one is a separate connection
+		for _ in range(min(count, pool.max_size)):
+			held.append(pool.acquire())
+			if len(held) == 1:
+				schema.ensure_schema(held[0].conn)
+	finally:
+		for pooled in held:
+			pool.release(pooled)
+	return len(held)
+
+
+def _prewarm_in_background(count) -> None:
+	start = time.perf_counter()
+	try:
+		opened = prewarm(count)
+	except Exception as e:
+		logging.warning("Connection pre-warm failed: %s", e)
+		return
+	logging.info(
+		"Pre-warmed %d database connection(s) in %.1f ms",
+		opened,
+		(time.perf_counter() - start) * 1000,
+	)
+
+
+PREWARM = int(os.environ.get("PG_PREWARM", "0"))
+
+# Handlers import this module when the host loads them: warm up before the first request
+if PREWARM > 0 and os.environ.get("POSTGRES_CONNECTION"):
+	threading.Thread(
+		target=_prewarm_in_background, args=(PREWARM,), name="pg-prewarm", daemon=True
+	).start()
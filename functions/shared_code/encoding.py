@@ -0,0 +1,111 @@
+"""JSON encoding for the list endpoints, with an optional fast backend.
+
+``JSON_ENCODER`` picks the backend:
+
+- ``auto`` (default): ``orjson`` when it is installed, else the stdlib
+- ``orjson``: require it (import error at startup otherwise)
+- ``stdlib``: always the stdlib ``json`` module
+
+Both write compact JSON with ``datetime``/``date`` values as ISO 8601 strings
+(what ``isoformat()`` returns), so handlers pass the driver's values through
+unconverted. Values orjson refuses (integers beyond 64 bits, non-string keys
+in metadata) fall back to the stdlib for that call.
+
+:class:`RowEncoder` encodes query results from the driver's row tuples. The
+queries shape the columns in SQL (``COALESCE(metadata, '{}')`` and the like),
+so a row only needs pairing with the column names, which ``dict(zip(...))``
+does in C; ``created_at`` and the JSONB ``metadata`` (decoded by the driver,
+with orjson when available, see :func:`register_decoders`) go to the encoder
+as they are. With orjson a 1,000-row page encodes about 4x faster than
+the former ``row_to_dict`` + ``json.dumps`` (``benchmarks/json_encoding.py``).
+"""
+
+import json
+import os
+
+BACKENDS = ("auto", "orjson", "stdlib")
+
+# PostgreSQL type oids decoded with the backend's ``loads``
+JSON_OID = 114
+JSONB_OID = 3802
+
+
+def _default(obj):
+	# datetime, date and time; cheaper than an isinstance check per value
+	try:
+		return obj.isoformat()
+	except AttributeError:
+		raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable") from None
+
+
+_stdlib_encode = json.JSONEncoder(separators=(",", ":"), default=_default).encode
+
+
+def _stdlib_dumps(obj) -> bytes:
+	return _stdlib_encode(obj).encode("utf-8")
+
+
+def _select_backend():
+	name = os.environ.get("JSON_ENCODER", "auto")
+	if name not in BACKENDS:
+		raise ValueError(f"JSON_ENCODER must be one of {', '.join(BACKENDS)}")
+	if name != "stdlib":
+		try:
+			import orjson
+		except ImportError:
+			if name == "orjson":
+				raise
+		else:
+			return "orjson", orjson
+	return "stdlib", None
+
+
+BACKEND, _orjson = _select_backend()
+
+if _orjson is not None:
+
+	def dumps(obj) -> bytes:
+		"""Encode ``obj`` as compact JSON bytes."""
+		try:
+			return _orjson.dumps(obj)
+		except TypeError:
+			return _stdlib_dumps(obj)
+
+	loads = _orjson.loads
+else:
+	dumps = _stdlib_dumps
+	loads = json.loads
+
+
+def register_decoders(conn) -> None:
+	"""Decode ``json``/``jsonb`` columns on a pg8000 connection with :data:`loads`."""
+	if _orjson is not None:
+		conn.register_in_adapter(JSON_OID, loads)
+		conn.register_in_adapter(JSONB_OID, loads)
+
+
+class RowEncoder:
+	"""Encode result tuples whose columns are, in order, ``columns``."""
+
+	def __init__(self, columns) -> None:
+		self.columns = tuple(columns)
+
+	def dicts(self, rows) -> list:
+		"""Row dicts for ``rows`` (what the cache stores)."""
+		columns = self.columns
+		return [dict(zip(columns, r)) for r in rows]
+
+	def line(self, row) -> bytes:
+		"""One NDJSON line (newline included)."""
+		return dumps(dict(zip(self.columns, row))) + b"\n"
+
+
+def page(data, next_cursor, **fields) -> bytes:
+	"""List response body for ``data``, a list of row dicts, plus any extra ``fields``."""
+	return dumps({
+		"status": "success",
+		"count": len(data),
+		"data": data,
+		"next_cursor": next_cursor,
+		**fields,
+	})
@@ -0,0 +1,78 @@
+"""Keyset pagination for the newest-first list endpoints.
+
+Pages are ordered by ``(created_at DESC, id DESC)`` and the cursor is an
+opaque token encoding the last row of the previous page, so every page is an
+index range scan on ``(tenant_id, ..., created_at DESC, id DESC)`` no matter
+how deep into the history it starts.
+"""
+
+import base64
+import json
+import os
+from datetime import datetime
+
+from shared_code.validation import ValidationError
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = int(os.environ.get("API_MAX_PAGE_LIMIT", "1000"))
+
+
+def page_limit(raw, maximum: int = MAX_LIMIT) -> int:
+	"""Parse the ``limit`` query parameter, capped at ``maximum``."""
+	if raw is None or raw == "":
+		return min(DEFAULT_LIMIT, maximum)
+	try:
+		limit = int(raw)
+	except ValueError:
+		raise ValidationError("limit must be an integer")
+	return max(1, min(limit, maximum))
+
+
+def encode_token(values) -> str:
+	"""Opaque URL-safe cursor token for a list of JSON values."""
+	payload = json.dumps(values, separators=(",", ":"))
+	return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_token(token: str) -> list:
+	"""Inverse of :func:`encode_token`; raises ``ValueError`` on garbage."""
+	padded = token + "=" * (-len(token) % 4)
+	values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+	if not isinstance(values, list):
+		raise ValueError("cursor is not a list")
+	return values
+
+
+def encode_cursor(created_at, row_id) -> str:
+	return encode_token([created_at.isoformat(), row_id])
+
+
+def decode_cursor(token: str):
+	"""Return ``(created_at, id)`` from a cursor produced by :func:`encode_cursor`."""
+	try:
+		created_at, row_id = decode_token(token)
+		return datetime.fromisoformat(created_at), str(row_id)
+	except Exception:
+		raise ValidationError("Invalid cursor")
+
+
+def apply(query: str, q_params: list, after, limit: int) -> str:
+	"""Append the keyset predicate, ordering and ``LIMIT limit + 1`` to a query.
+
+	``after`` is a decoded cursor or ``None`` for the first page. The extra row
+	tells :func:`split_page` whether another page exists.
+	"""
+	if after:
+		query += " AND (created_at, id) < (%s, %s)"
+		q_params.extend(after)
+	query += " ORDER BY created_at DESC, id DESC LIMIT %s"
+	q_params.append(limit + 1)
+	return query
+
+
+def split_page(rows, limit: int, created_at_index: int, id_index: int = 0):
+	"""Drop the look-ahead row; returns ``(page_rows, next_cursor or None)``."""
+	if len(rows) <= limit:
+		return rows, None
+	last = rows[limit - 1]
+	return rows[:limit], encode_cursor(last[created_at_index], last[id_index])
@@ -0,0 +1,203 @@
+"""Monthly partition maintenance for ``chat_memory.messages`` and ``rag_feedback.entries``.
+
+Migration 007 partitions both tables by UTC month of ``created_at``. This job
+keeps that layout healthy; it runs daily as the ``partition-maintenance``
+timer function and by hand with ``python -m shared_code.partitions`` from the
+``functions`` folder:
+
+1. Creates the current month and the next ``PARTITION_PREMAKE_MONTHS``
+   (default 3), so inserts never land in the DEFAULT partition.
+2. Expires old data. Retention is ``PARTITION_RETENTION_MONTHS`` (unset keeps
+   everything) unless a tenant has its own months in
+   ``public.tenant_retention``. A month whose every row is past every
+   tenant's retention is detached as a whole; rows that expire earlier for
+   some tenants than for others are deleted per tenant.
+3. ``PARTITION_EXPIRE=archive`` (default) moves expired partitions into the
+   ``archive`` schema and expired rows into ``archive.<table>_expired``;
+   ``drop`` deletes them.
+
+Rating rollups (``rag_feedback.rating_rollups``) are aggregates and keep
+counting expired feedback.
+
+The job also deletes feedback batch idempotency keys
+(``rag_feedback.batch_requests``) older than
+``IDEMPOTENCY_KEY_RETENTION_DAYS`` (default 7); a batch retried after that
+is written again, skipping ids already stored.
+"""
+
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+
+TABLES = {
+	"memory": "chat_memory.messages",
+	"feedback": "rag_feedback.entries",
+}
+
+PREMAKE_MONTHS = int(os.environ.get("PARTITION_PREMAKE_MONTHS", "3"))
+IDEMPOTENCY_KEY_RETENTION_DAYS = int(os.environ.get("IDEMPOTENCY_KEY_RETENTION_DAYS", "7"))
+EXPIRE_MODES = ("archive", "drop")
+
+
+def default_retention():
+	raw = os.environ.get("PARTITION_RETENTION_MONTHS")
+	return int(raw) if raw else None
+
+
+def expire_mode() -> str:
+	mode = os.environ.get("PARTITION_EXPIRE", "archive")
+	if mode not in EXPIRE_MODES:
+		raise ValueError(f"PARTITION_EXPIRE must be one of {', '.join(EXPIRE_MODES)}")
+	return mode
+
+
+def add_months(day, months) -> date:
+	"""First day of the month ``months`` after (or before) ``day``'s month."""
+	index = day.year * 12 + day.month - 1 + months
+	return date(index // 12, index % 12 + 1, 1)
+
+
+def cutoff(today, months) -> datetime:
+	"""Oldest ``created_at`` kept by a retention of ``months`` (whole UTC months)."""
+	start = add_months(today, -months)
+	return datetime(start.year, start.month, 1, tzinfo=timezone.utc)
+
+
+def month_partitions(cursor, table):
+	"""Return ``[(month, name)]`` for the attached monthly partitions of ``table``."""
+	schema_name, table_name = table.split(".")
+	cursor.execute(
+		"""
+		SELECT c.relname FROM pg_inherits i
+		JOIN pg_class c ON c.oid = i.inhrelid
+		WHERE i.inhparent = %s::regclass
+		""",
+		[table],
+	)
+	found = []
+	for (name,) in cursor.fetchall():
+		match = re.match(rf"^{re.escape(table_name)}_p(\d{{4}})_(\d{{2}})$", name)
+		if match:
+			found.append((date(int(match.group(1)), int(match.group(2)), 1), f"{schema_name}.{name}"))
+	return sorted(found)
+
+
+def create_partitions(cursor, table, today, ahead=PREMAKE_MONTHS) -> list:
+	"""Create missing partitions for this month and ``ahead`` more; returns the new months."""
+	created = []
+	for offset in range(ahead + 1):
+		month = add_months(today, offset)
+		cursor.execute("SELECT public.create_month_partition(%s::regclass, %s)", [table, month])
+		if cursor.fetchone()[0]:
+			created.append(month.isoformat()[:7])
+	return created
+
+
+def tenant_retention(cursor, kind) -> dict:
+	cursor.execute(
+		f"SELECT tenant_id, {kind}_months FROM public.tenant_retention WHERE {kind}_months IS NOT NULL"
+	)
+	return {tenant_id: months for tenant_id, months in cursor.fetchall()}
+
+
+def _archive_rows_table(cursor, table) -> str:
+	archived = f"archive.{table.split('.')[1]}_expired"
+	cursor.execute(f"CREATE TABLE IF NOT EXISTS {archived} (LIKE {table})")
+	return archived
+
+
+def _expire_rows(cursor, table, mode, where, q_params) -> int:
+	if mode == "archive":
+		archived = _archive_rows_table(cursor, table)
+		cursor.execute(
+			f"WITH moved AS (DELETE FROM {table} WHERE {where} RETURNING *) "
+			f"INSERT INTO {archived} SELECT * FROM moved",
+			q_params,
+		)
+	else:
+		cursor.execute(f"DELETE FROM {table} WHERE {where}", q_params)
+	return cursor.rowcount
+
+
+def expire(cursor, kind, today, default_months, mode) -> dict:
+	"""Detach whole expired months, then delete rows expired for some tenants only."""
+	table = TABLES[kind]
+	overrides = tenant_retention(cursor, kind)
+	# Months older than the longest retention in force hold no row anyone keeps
+	horizon = max([default_months] + list(overrides.values())) if default_months else None
+
+	detached = []
+	if horizon:
+		oldest_kept = add_months(today, -horizon)
+		for month, name in month_partitions(cursor, table):
+			if month >= oldest_kept:
+				break
+			cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+			if mode == "archive":
+				cursor.execute(f"ALTER TABLE {name} SET SCHEMA archive")
+			else:
+				cursor.execute(f"DROP TABLE {name}")
+			detached.append(month.isoformat()[:7])
+
+	rows = 0
+	# Tenants whose own retention is shorter than what the partitions keep
+	for tenant_id, months in sorted(overrides.items()):
+		if horizon is None or months < horizon:
+			rows += _expire_rows(
+				cursor, table, mode, "tenant_id = %s AND created_at < %s",
+				[tenant_id, cutoff(today, months)],
+			)
+	# Everyone else on the default, when an override keeps partitions longer
+	if default_months and default_months < horizon:
+		rows += _expire_rows(
+			cursor, table, mode, "created_at < %s AND NOT (tenant_id = ANY(%s::varchar[]))",
+			[cutoff(today, default_months), list(overrides)],
+		)
+	return {"detached": detached, "expired_rows": rows}
+
+
+def purge_batch_requests(cursor, today, days=IDEMPOTENCY_KEY_RETENTION_DAYS) -> int:
+	"""Delete idempotency keys claimed more than ``days`` before ``today``; returns how many."""
+	start = datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
+	cursor.execute(
+		"DELETE FROM rag_feedback.batch_requests WHERE created_at < %s",
+		[start - timedelta(days=days)],
+	)
+	return cursor.rowcount
+
+
+def run(conn, today=None) -> dict:
+	"""Create upcoming partitions, expire old data and purge old idempotency keys, committing each step."""
+	today = today or datetime.now(timezone.utc).date()
+	default_months = default_retention()
+	mode = expire_mode()
+	summary = {}
+	cursor = conn.cursor()
+	try:
+		for kind, table in TABLES.items():
+			created = create_partitions(cursor, table, today)
+			conn.commit()
+			result = expire(cursor, kind, today, default_months, mode)
+			conn.commit()
+			summary[kind] = dict(result, created=created, mode=mode)
+			logging.info("Partition maintenance for %s: %s", table, summary[kind])
+		summary["idempotency_keys"] = {"purged": purge_batch_requests(cursor, today)}
+		conn.commit()
+	except Exception:
+		conn.rollback()
+		raise
+	finally:
+		cursor.close()
+	return summary
+
+
+if __name__ == "__main__":
+	import json
+
+	from shared_code import db, schema
+
+	logging.basicConfig(level=logging.INFO)
+	with db.connection() as conn:
+		schema.ensure_schema(conn)
+		print(json.dumps(run(conn), indent=2))
@@ -0,0 +1,98 @@
+"""Incremental rating rollups behind ``GET /api/feedback/stats``.
+
+``rag_feedback.rating_rollups`` holds one row per (tenant, response, UTC day)
+with the rating count, sum and 1-5 histogram (see
+``migrations/006_feedback_rollups.sql``). The feedback POST handlers call
+:func:`record` in the same transaction as their insert, so the rollups never
+disagree with the committed entries and a stats read only touches buckets.
+"""
+
+from shared_code.validation import ValidationError
+
+UPSERT_SQL = """
+	INSERT INTO rag_feedback.rating_rollups AS r (
+		tenant_id, response_id, day, rating_count, rating_sum,
+		rating_1, rating_2, rating_3, rating_4, rating_5
+	)
+	SELECT * FROM unnest(
+		%s::varchar[], %s::varchar[], %s::date[], %s::bigint[], %s::bigint[],
+		%s::bigint[], %s::bigint[], %s::bigint[], %s::bigint[], %s::bigint[]
+	)
+	ON CONFLICT (tenant_id, response_id, day) DO UPDATE SET
+		rating_count = r.rating_count + EXCLUDED.rating_count,
+		rating_sum = r.rating_sum + EXCLUDED.rating_sum,
+		rating_1 = r.rating_1 + EXCLUDED.rating_1,
+		rating_2 = r.rating_2 + EXCLUDED.rating_2,
+		rating_3 = r.rating_3 + EXCLUDED.rating_3,
+		rating_4 = r.rating_4 + EXCLUDED.rating_4,
+		rating_5 = r.rating_5 + EXCLUDED.rating_5
+"""
+
+_TOTALS = (
+	"sum(rating_count)::bigint, sum(rating_sum)::bigint, sum(rating_1)::bigint, "
+	"sum(rating_2)::bigint, sum(rating_3)::bigint, sum(rating_4)::bigint, sum(rating_5)::bigint"
+)
+
+GROUP_BY = ("day", "response_id")
+
+
+def record(cursor, entries) -> None:
+	"""Fold ``(tenant_id, response_id, rating, created_at)`` tuples into the rollups.
+
+	Must run in the transaction that inserted the entries.
+	"""
+	buckets = {}
+	for tenant_id, response_id, rating, created_at in entries:
+		key = (tenant_id, response_id or "", created_at.date())
+		bucket = buckets.setdefault(key, [0, 0, 0, 0, 0, 0, 0])
+		bucket[0] += 1
+		bucket[1] += rating
+		bucket[1 + rating] += 1
+	if not buckets:
+		return
+	# Sorted so concurrent batches lock shared buckets in the same order
+	keys = sorted(buckets)
+	columns = [[k[i] for k in keys] for i in range(3)]
+	columns += [[buckets[k][i] for k in keys] for i in range(7)]
+	cursor.execute(UPSERT_SQL, columns)
+
+
+def _summary(row) -> dict:
+	count = row[0] or 0
+	return {
+		"count": count,
+		"mean": round(row[1] / count, 4) if count else None,
+		"histogram": {str(i + 1): row[2 + i] or 0 for i in range(5)},
+	}
+
+
+def stats(cursor, tenant_id, response_id=None, day_from=None, day_to=None, group_by=None, limit=100) -> dict:
+	"""Totals (and optionally per-day or per-response buckets) for a tenant."""
+	if group_by not in (None,) + GROUP_BY:
+		raise ValidationError(f"group_by must be one of {', '.join(GROUP_BY)}")
+	where = " FROM rag_feedback.rating_rollups WHERE tenant_id = %s"
+	q_params = [tenant_id]
+	if response_id:
+		where += " AND response_id = %s"
+		q_params.append(response_id)
+	if day_from:
+		where += " AND day >= %s"
+		q_params.append(day_from)
+	if day_to:
+		where += " AND day <= %s"
+		q_params.append(day_to)
+
+	cursor.execute("SELECT " + _TOTALS + where, q_params)
+	result = _summary(cursor.fetchone())
+	if group_by:
+		# Newest days first; busiest responses first
+		order = "day DESC" if group_by == "day" else "sum(rating_count) DESC, response_id"
+		cursor.execute(
+			f"SELECT {group_by}, {_TOTALS}{where} GROUP BY {group_by} ORDER BY {order} LIMIT %s",
+			q_params + [limit],
+		)
+		result["groups"] = [
+			dict(_summary(r[1:]), **{group_by: r[0].isoformat() if group_by == "day" else r[0]})
+			for r in cursor.fetchall()
+		]
+	return result
@@ -0,0 +1,140 @@
+"""Once-per-worker schema bootstrap for the Functions handlers.
+
+Handlers used to run ``CREATE TABLE IF NOT EXISTS`` on every request. Instead
+the first request of a worker checks ``public.schema_migrations`` and, if the
+database is behind ``REQUIRED_VERSION``, applies the pending SQL files from
+``migrations/`` under an advisory lock. The outcome is cached for the life of
+the process so steady-state requests issue no DDL and no catalog lookups.
+
+``001_create_schemas.sql`` is the historical baseline (not idempotent, seeds
+sample rows) and is never applied automatically; ``002`` onwards are.
+
+Settings:
+
+- ``SCHEMA_BOOTSTRAP=0`` skips the check entirely (schema owned by the
+  migration runner / deploy pipeline)
+- ``MIGRATIONS_DIR`` overrides where the SQL files are looked up
+
+Run pending migrations by hand with ``python -m shared_code.schema`` from the
+``functions`` folder.
+"""
+
+import logging
+import os
+import re
+import threading
+
+from shared_code import timing
+
+REQUIRED_VERSION = 14
+
+# Arbitrary key for pg_advisory_lock so concurrent workers migrate one at a time
+_ADVISORY_LOCK_KEY = 7200102
+
+_ensured = False
+_lock = threading.Lock()
+
+
+def migrations_dir():
+	override = os.environ.get("MIGRATIONS_DIR")
+	if override:
+		return override
+	here = os.path.dirname(os.path.abspath(__file__))
+	for candidate in (
+		# Bundled next to the function folders at deploy time
+		os.path.join(here, "..", "migrations"),
+		# Repository checkout
+		os.path.join(here, "..", "..", "migrations"),
+	):
+		if os.path.isdir(candidate):
+			return os.path.normpath(candidate)
+	return None
+
+
+def available_migrations():
+	"""Return ``[(version, path)]`` for every automatically applied migration."""
+	directory = migrations_dir()
+	if not directory:
+		return []
+	found = []
+	for name in os.listdir(directory):
+		match = re.match(r"^(\d+)_.*\.sql$", name)
+		if match and int(match.group(1)) > 1:
+			found.append((int(match.group(1)), os.path.join(directory, name)))
+	return sorted(found)
+
+
+def applied_versions(conn) -> set:
+	cursor = conn.cursor()
+	try:
+		cursor.execute("SELECT to_regclass('public.schema_migrations') IS NOT NULL")
+		if not cursor.fetchone()[0]:
+			return set()
+		cursor.execute("SELECT version FROM public.schema_migrations")
+		return {r[0] for r in cursor.fetchall()}
+	finally:
+		cursor.close()
+		conn.commit()
+
+
+def migrate(conn) -> list:
+	"""Apply pending migrations; returns the versions that were applied."""
+	applied = []
+	cursor = conn.cursor()
+	try:
+		cursor.execute("SELECT pg_advisory_lock(%s)", [_ADVISORY_LOCK_KEY])
+		conn.commit()
+		try:
+			done = applied_versions(conn)
+			for version, path in available_migrations():
+				if version in done:
+					continue
+				with open(path, encoding="utf-8") as fh:
+					sql = fh.read()
+				logging.info("Applying migration %s", os.path.basename(path))
+				# Simple query protocol: the whole file runs as one implicit
+				# transaction, DO blocks and all.
+				conn.execute_simple(sql)
+				cursor.execute(
+					"INSERT INTO public.schema_migrations (version, name) VALUES (%s, %s) "
+					"ON CONFLICT (version) DO NOTHING",
+					[version, os.path.basename(path)[:-4]],
+				)
+				conn.commit()
+				applied.append(version)
+		finally:
+			cursor.execute("SELECT pg_advisory_unlock(%s)", [_ADVISORY_LOCK_KEY])
+			conn.commit()
+	finally:
+		cursor.close()
+	return applied
+
+
+def ensure_schema(conn) -> None:
+	"""Make sure the handler schema exists; no-op after the first success."""
+	global _ensured
+	if _ensured:
+		return
+	with timing.stage("schema"), _lock:
+		if _ensured:
+			return
+		if os.environ.get("SCHEMA_BOOTSTRAP", "1") != "0":
+			current = max(applied_versions(conn), default=0)
+			if current < REQUIRED_VERSION:
+				migrate(conn)
+				current = max(applied_versions(conn), default=0)
+			if current < REQUIRED_VERSION:
+				raise RuntimeError(
+					f"Database schema is at version {current}, handlers need "
+					f"{REQUIRED_VERSION}; run the SQL files in migrations/"
+				)
+		_ensured = True
+
+
+if __name__ == "__main__":
+	from shared_code import db
+
+	logging.basicConfig(level=logging.INFO)
+	with db.connection() as conn:
+		versions = migrate(conn)
+	print(f"Applied migrations: {versions or 'none (up to date)'}")
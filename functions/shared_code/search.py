@@ -0,0 +1,98 @@
+"""Full-text search over chat memory behind ``GET /api/memory/search``.
+
+``chat_memory.messages.content_tsv`` is a stored ``to_tsvector('english',
+content)`` with a GIN index (``migrations/008_memory_search.sql``), so a
+search reads the index postings for its terms instead of the tenant's whole
+history. ``q`` is parsed with ``websearch_to_tsquery``: plain words are ANDed,
+``"quoted phrases"``, ``or`` and ``-excluded`` words work as in web search
+engines, and stop words are dropped.
+
+Results are ordered by ``ts_rank_cd`` (cover density, normalized to 0-1),
+then newest first. Pages use a keyset cursor on ``(rank, created_at, id)``;
+the rank of a row for a given query is deterministic, so the next page
+carries on exactly where the previous one ended. Snippets
+(``ts_headline``) are built for the returned page only.
+"""
+
+from datetime import datetime
+
+from shared_code import pagination
+from shared_code.validation import ValidationError
+
+TS_CONFIG = "english"
+MAX_QUERY_LENGTH = 256
+# ts_rank_cd normalization 32: rank / (rank + 1), i.e. 0-1
+RANK_NORMALIZATION = 32
+HEADLINE_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, MaxWords=24, MinWords=8, MaxFragments=2, FragmentDelimiter=" ... "'
+
+COLUMNS = ("id", "tenant_id", "user_id", "session_id", "message_type", "created_at", "rank", "snippet")
+
+
+def parse_query(raw) -> str:
+	q = (raw or "").strip()
+	if not q:
+		raise ValidationError("q is required")
+	if len(q) > MAX_QUERY_LENGTH:
+		raise ValidationError(f"q must be at most {MAX_QUERY_LENGTH} characters")
+	return q
+
+
+def encode_cursor(rank, created_at, row_id) -> str:
+	return pagination.encode_token([rank, created_at.isoformat(), row_id])
+
+
+def decode_cursor(token: str):
+	"""Return ``(rank, created_at, id)`` from a cursor produced by :func:`encode_cursor`."""
+	try:
+		rank, created_at, row_id = pagination.decode_token(token)
+		return float(rank), datetime.fromisoformat(created_at), str(row_id)
+	except Exception:
+		raise ValidationError("Invalid cursor")
+
+
+def build_query(q, tenant_id, user_id, session_id, after, limit):
+	"""SQL and parameters for one page (``limit + 1`` rows, see :func:`split_page`).
+
+	Rows are :data:`COLUMNS`.
+	"""
+	tsquery = f"websearch_to_tsquery('{TS_CONFIG}', %s)"
+	# Placeholders in the order they appear below: headline, rank, filters, keyset, limit
+	q_params = [q, HEADLINE_OPTIONS, q, tenant_id, q]
+	filters = ""
+	if user_id:
+		filters += " AND user_id = %s"
+		q_params.append(user_id)
+	if session_id:
+		filters += " AND session_id = %s"
+		q_params.append(session_id)
+	keyset = ""
+	if after:
+		keyset = "WHERE (rank, created_at, id) < (%s::real, %s, %s)"
+		q_params.extend(after)
+	q_params.append(limit + 1)
+	query = f"""
+		SELECT id, tenant_id, user_id, session_id, message_type, created_at, rank,
+			ts_headline('{TS_CONFIG}', content, {tsquery}, %s::text)
+		FROM (
+			SELECT id, tenant_id, user_id, session_id, message_type, created_at, content, rank
+			FROM (
+				SELECT id, tenant_id, user_id, session_id, message_type, created_at, content,
+					ts_rank_cd(content_tsv, {tsquery}, {RANK_NORMALIZATION}) AS rank
+				FROM chat_memory.messages
+				WHERE tenant_id = %s AND content_tsv @@ {tsquery}{filters}
+			) hits
+			{keyset}
+			ORDER BY rank DESC, created_at DESC, id DESC
+			LIMIT %s
+		) page
+		ORDER BY rank DESC, created_at DESC, id DESC
+	"""
+	return query, q_params
+
+
+def split_page(rows, limit: int):
+	"""Drop the look-ahead row; returns ``(page_rows, next_cursor or None)``."""
+	if len(rows) <= limit:
+		return rows, None
+	last = rows[limit - 1]
+	return rows[:limit], encode_cursor(last[6], last[5], last[0])
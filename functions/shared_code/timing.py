@@ -0,0 +1,171 @@
+"""Per-stage request timing for the Functions HTTP handlers.
+
+``@timing.instrument("memory")`` on a handler's ``main`` starts a timer for the
+request; code anywhere below it (handler, pool, schema bootstrap, cache) marks
+stages with ``with timing.stage("query"): ...``. Outside an instrumented
+request ``stage`` does nothing. Stages may nest (``db_connect`` is part of
+``db_acquire``) and a stage entered twice in one request adds up.
+
+When the handler returns, the durations are:
+
+- sent as a ``Server-Timing`` header (``db_acquire;dur=0.04, query;dur=3.10,
+  ..., total;dur=4.02``), which browser dev tools show per request
+- logged as one ``timing handler=memory status=200 total_ms=4.02 ...`` line
+  with the same fields as ``custom_dimensions`` (``TIMING_LOG=0`` turns it off)
+- with ``TIMING_HISTOGRAM=1``, folded into per handler/stage histograms kept
+  for the life of the worker and reported under ``timing`` by ``/api/health``
+
+Stages recorded by the shared code: ``ssl_context``, ``db_acquire``,
+``db_connect``, ``schema``, ``cache``; the handlers add ``query``, ``rows``,
+``commit`` and ``serialize`` where they apply.
+"""
+
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+LOG_ENABLED = os.environ.get("TIMING_LOG", "1") != "0"
+HISTOGRAM_ENABLED = os.environ.get("TIMING_HISTOGRAM", "0") == "1"
+
+# Histogram bucket upper bounds in milliseconds (log spaced, plus overflow)
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_local = threading.local()
+
+
+class RequestTimer:
+	"""Stage durations (milliseconds) of one request."""
+
+	def __init__(self, handler) -> None:
+		self.handler = handler
+		self.stages = {}
+		self.total_ms = None
+		self._start = time.perf_counter()
+
+	def add(self, name, ms) -> None:
+		self.stages[name] = self.stages.get(name, 0.0) + ms
+
+	def finish(self) -> float:
+		self.total_ms = (time.perf_counter() - self._start) * 1000
+		return self.total_ms
+
+	def header(self) -> str:
+		parts = [f"{name};dur={ms:.2f}" for name, ms in self.stages.items()]
+		parts.append(f"total;dur={self.total_ms:.2f}")
+		return ", ".join(parts)
+
+	def fields(self, status) -> dict:
+		fields = {"handler": self.handler, "status": status, "total_ms": round(self.total_ms, 3)}
+		for name, ms in self.stages.items():
+			fields[f"{name}_ms"] = round(ms, 3)
+		return fields
+
+
+class Histogram:
+	"""Fixed-bucket latency histogram; quantiles are bucket upper bounds (capped at the max)."""
+
+	def __init__(self) -> None:
+		self.counts = [0] * (len(BUCKETS_MS) + 1)
+		self.count = 0
+		self.sum_ms = 0.0
+		self.max_ms = 0.0
+
+	def observe(self, ms) -> None:
+		self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+		self.count += 1
+		self.sum_ms += ms
+		self.max_ms = max(self.max_ms, ms)
+
+	def quantile(self, q) -> float:
+		rank = q * self.count
+		seen = 0
+		for index, n in enumerate(self.counts):
+			seen += n
+			if seen >= rank and n:
+				return round(min(BUCKETS_MS[index], self.max_ms) if index < len(BUCKETS_MS) else self.max_ms, 3)
+		return round(self.max_ms, 3)
+
+	def summary(self) -> dict:
+		return {
+			"count": self.count,
+			"mean_ms": round(self.sum_ms / self.count, 3) if self.count else None,
+			"p50_ms": self.quantile(0.50),
+			"p95_ms": self.quantile(0.95),
+			"p99_ms": self.quantile(0.99),
+			"max_ms": round(self.max_ms, 3),
+		}
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def _observe(timer) -> None:
+	with _histograms_lock:
+		stages = _histograms.setdefault(timer.handler, {})
+		for name, ms in list(timer.stages.items()) + [("total", timer.total_ms)]:
+			stages.setdefault(name, Histogram()).observe(ms)
+
+
+@contextmanager
+def stage(name):
+	"""Time the enclosed block as ``name`` in the current request, if any."""
+	timer = getattr(_local, "timer", None)
+	if timer is None:
+		yield
+		return
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		timer.add(name, (time.perf_counter() - start) * 1000)
+
+
+def instrument(handler):
+	"""Decorate an HTTP handler ``main`` to time its requests as ``handler``."""
+
+	def decorate(main):
+		@functools.wraps(main)
+		def wrapper(*args, **kwargs):
+			timer = RequestTimer(handler)
+			previous = getattr(_local, "timer", None)
+			_local.timer = timer
+			try:
+				response = main(*args, **kwargs)
+			finally:
+				_local.timer = previous
+				timer.finish()
+			status = getattr(response, "status_code", None)
+			try:
+				response.headers["Server-Timing"] = timer.header()
+			except Exception:
+				pass
+			if LOG_ENABLED and logging.getLogger().isEnabledFor(logging.INFO):
+				fields = timer.fields(status)
+				logging.info(
+					"timing %s",
+					" ".join(f"{k}={v}" for k, v in fields.items()),
+					extra={"custom_dimensions": fields},
+				)
+			if HISTOGRAM_ENABLED:
+				_observe(timer)
+			return response
+
+		return wrapper
+
+	return decorate
+
+
+def stats():
+	"""``{handler: {stage: summary}}`` when ``TIMING_HISTOGRAM=1``, else ``None``."""
+	if not HISTOGRAM_ENABLED:
+		return None
+	with _histograms_lock:
+		return {
+			handler: {name: h.summary() for name, h in stages.items()}
+			for handler, stages in _histograms.items()
+		}
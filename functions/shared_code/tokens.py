@@ -0,0 +1,79 @@
+"""Token counts of chat memory content, computed once when a message is written.
+
+``chat_memory.messages.token_count`` (migration 010) is filled by every write
+path (``POST /api/memory``, the batch endpoint and the write-behind flusher),
+so ``GET /api/memory/context`` can fill a token budget from stored integers
+without reading or re-tokenizing content it will not return.
+
+``TOKENIZER`` picks how content is counted:
+
+- ``auto`` (default): ``tiktoken`` when it is installed, else ``estimate``
+- ``tiktoken``: require it; ``TOKEN_ENCODING`` names the encoding (default
+  ``cl100k_base``)
+- ``estimate``: one token per 4 characters, rounded up, which is close for
+  English prose and needs no dependency
+
+The choice is made and the tiktoken encoding loaded on first use, not at
+import, so neither adds to handler cold start.
+"""
+
+import importlib.util
+import os
+import threading
+
+TOKENIZERS = ("auto", "tiktoken", "estimate")
+CHARS_PER_TOKEN = 4
+# Per-message framing (role, separators) added by chat prompt formats
+MESSAGE_OVERHEAD = int(os.environ.get("TOKENS_PER_MESSAGE", "4"))
+
+_tokenizer = None
+_encoding = None
+_lock = threading.Lock()
+
+
+def _select_tokenizer():
+	name = os.environ.get("TOKENIZER", "auto")
+	if name not in TOKENIZERS:
+		raise ValueError(f"TOKENIZER must be one of {', '.join(TOKENIZERS)}")
+	if name == "estimate":
+		return "estimate"
+	# find_spec looks for the package without importing it
+	if importlib.util.find_spec("tiktoken") is not None:
+		return "tiktoken"
+	if name == "tiktoken":
+		raise ImportError("TOKENIZER=tiktoken but tiktoken is not installed")
+	return "estimate"
+
+
+def tokenizer() -> str:
+	"""The tokenizer in use, ``tiktoken`` or ``estimate``, decided on first call."""
+	global _tokenizer
+	if _tokenizer is None:
+		with _lock:
+			if _tokenizer is None:
+				_tokenizer = _select_tokenizer()
+	return _tokenizer
+
+
+def _tiktoken_encoding():
+	global _encoding
+	if _encoding is None:
+		with _lock:
+			if _encoding is None:
+				import tiktoken
+
+				_encoding = tiktoken.get_encoding(os.environ.get("TOKEN_ENCODING", "cl100k_base"))
+	return _encoding
+
+
+def estimate(text: str) -> int:
+	return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def count(text) -> int:
+	"""Number of tokens in ``text`` (0 for empty or ``None``)."""
+	if not text:
+		return 0
+	if tokenizer() == "tiktoken":
+		return len(_tiktoken_encoding().encode(text, disallowed_special=()))
+	return estimate(text)
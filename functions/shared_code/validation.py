@@ -0,0 +1,94 @@
+"""Request body validation shared by the single-record and batch handlers."""
+
+import json
+import uuid
+
+MEMORY_REQUIRED_FIELDS = ["tenant_id", "user_id", "session_id", "content"]
+FEEDBACK_REQUIRED_FIELDS = ["tenant_id", "user_id", "response_id", "rating"]
+
+
+class ValidationError(ValueError):
+	"""A record failed validation; ``str(exc)`` is the client-facing message."""
+
+
+def _require(body, required_fields) -> None:
+	if not isinstance(body, dict):
+		raise ValidationError("Record must be a JSON object")
+	for field in required_fields:
+		if body.get(field) is None:
+			raise ValidationError(f"Missing required field: {field}")
+
+
+def _reject_nul(value, field) -> None:
+	"""Postgres text and jsonb cannot store NUL; fail here rather than at insert time."""
+	if isinstance(value, str):
+		if "\x00" in value:
+			raise ValidationError(f"{field} must not contain NUL characters")
+	elif isinstance(value, dict):
+		for key, item in value.items():
+			_reject_nul(key, field)
+			_reject_nul(item, field)
+	elif isinstance(value, list):
+		for item in value:
+			_reject_nul(item, field)
+
+
+def _checked(record) -> dict:
+	for field, value in record.items():
+		_reject_nul(value, field)
+	return record
+
+
+def memory_record(body) -> dict:
+	"""Normalize a chat memory body into the columns written to the database."""
+	_require(body, MEMORY_REQUIRED_FIELDS)
+	return _checked({
+		"id": str(body.get("id") or body.get("uuid") or uuid.uuid4().hex),
+		"tenant_id": str(body["tenant_id"]),
+		"user_id": str(body["user_id"]),
+		"session_id": str(body["session_id"]),
+		"content": str(body["content"]),
+		"message_type": str(body.get("message_type") or "chat"),
+		"metadata": body.get("metadata") or {},
+	})
+
+
+def feedback_record(body) -> dict:
+	"""Normalize a feedback body; ``rating`` must be an integer from 1 to 5."""
+	_require(body, FEEDBACK_REQUIRED_FIELDS)
+	rating = body["rating"]
+	if not isinstance(rating, int) or rating < 1 or rating > 5:
+		raise ValidationError("Rating must be an integer between 1 and 5")
+	return _checked({
+		"id": str(body.get("id") or body.get("uuid") or uuid.uuid4().hex),
+		"tenant_id": str(body["tenant_id"]),
+		"user_id": str(body["user_id"]),
+		"response_id": str(body["response_id"]),
+		"rating": rating,
+		"feedback_text": body.get("feedback_text") or body.get("feedback") or "",
+		"metadata": body.get("metadata") or {},
+	})
+
+
+def parse_batch(req):
+	"""Return the list of records in a JSON array, ``{"items": [...]}`` or NDJSON body."""
+	content_type = (req.headers.get("content-type") or "").lower()
+	text = req.get_body().decode("utf-8")
+	if "ndjson" in content_type or "jsonlines" in content_type:
+		items = []
+		for line_no, line in enumerate(text.splitlines(), start=1):
+			if line.strip():
+				try:
+					items.append(json.loads(line))
+				except ValueError as e:
+					raise ValidationError(f"Invalid JSON on line {line_no}: {e}")
+		return items
+	try:
+		payload = json.loads(text)
+	except ValueError as e:
+		raise ValidationError(f"Invalid JSON body: {e}")
+	if isinstance(payload, dict) and isinstance(payload.get("items"), list):
+		return payload["items"]
+	if isinstance(payload, list):
+		return payload
+	raise ValidationError("Body must be a JSON array, an object with an 'items' array, or NDJSON")
@@ -0,0 +1,381 @@
+"""Optional write-behind mode for ``POST /api/memory`` and ``POST /api/feedback``.
+
+With ``WRITE_BEHIND=1`` the handlers validate a record, append it to a durable
+local queue and answer ``202 Accepted`` with the assigned id, so a slow
+database no longer shows up in the add-in's latency. A background thread per
+worker process drains the queue to Postgres in batches through the same bulk
+inserts as the batch endpoints.
+
+The queue is a SQLite database in WAL mode with ``synchronous=FULL``: a
+record is on disk before the 202 goes out. Worker processes on one instance
+share the file; a batch is claimed with a lease, so a flusher that dies
+mid-batch has its rows redelivered once the lease runs out. Delivery is
+at-least-once and the inserts skip ids that already exist, so redelivery
+never duplicates rows. A batch Postgres rejects is split in halves until the
+records at fault are isolated, so the rest of it is still written. Failed
+records are retried with exponential backoff; records failing
+``WRITE_BEHIND_MAX_ATTEMPTS`` times move to a ``dead`` table
+(``python -m shared_code.writebehind --requeue-dead`` puts them back).
+
+Queued records are not visible to reads until flushed. The queue is as durable
+as the instance's local disk: point ``WRITE_BEHIND_PATH`` at storage that
+outlives the instance if records must survive its loss.
+
+Settings:
+
+- ``WRITE_BEHIND``: ``1`` enables the mode (default off)
+- ``WRITE_BEHIND_PATH``: queue file (default ``<tempdir>/apex-write-behind.sqlite``)
+- ``WRITE_BEHIND_MAX_PENDING``: queued records beyond which POSTs get
+  ``503`` with ``Retry-After`` (default 10000)
+- ``WRITE_BEHIND_BATCH``: records per flush (default 500)
+- ``WRITE_BEHIND_MAX_ATTEMPTS``: attempts before dead-lettering (default 10)
+- ``WRITE_BEHIND_LEASE``: seconds a claimed batch stays invisible (default 60)
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+ENABLED = os.environ.get("WRITE_BEHIND", "0") == "1"
+# Unset: apex-write-behind.sqlite in the temp directory, see queue_path()
+PATH = os.environ.get("WRITE_BEHIND_PATH")
+MAX_PENDING = int(os.environ.get("WRITE_BEHIND_MAX_PENDING", "10000"))
+BATCH_SIZE = int(os.environ.get("WRITE_BEHIND_BATCH", "500"))
+MAX_ATTEMPTS = int(os.environ.get("WRITE_BEHIND_MAX_ATTEMPTS", "10"))
+LEASE_SECONDS = float(os.environ.get("WRITE_BEHIND_LEASE", "60"))
+# Idle poll interval; enqueues wake the flusher immediately
+POLL_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+
+_SCHEMA = """
+	CREATE TABLE IF NOT EXISTS queue (
+		seq INTEGER PRIMARY KEY AUTOINCREMENT,
+		kind TEXT NOT NULL,
+		record_id TEXT NOT NULL,
+		payload TEXT NOT NULL,
+		enqueued_at REAL NOT NULL,
+		attempts INTEGER NOT NULL DEFAULT 0,
+		next_attempt REAL NOT NULL DEFAULT 0,
+		claimed_until REAL NOT NULL DEFAULT 0,
+		last_error TEXT
+	);
+	CREATE INDEX IF NOT EXISTS queue_ready ON queue (kind, next_attempt, seq);
+	CREATE TABLE IF NOT EXISTS dead (
+		seq INTEGER PRIMARY KEY,
+		kind TEXT NOT NULL,
+		record_id TEXT NOT NULL,
+		payload TEXT NOT NULL,
+		enqueued_at REAL NOT NULL,
+		attempts INTEGER NOT NULL,
+		last_error TEXT
+	);
+"""
+
+
+class QueueFull(Exception):
+	"""Raised when accepting more records would exceed ``MAX_PENDING``."""
+
+
+class WriteBehindQueue:
+	"""Durable FIFO of pending records in a SQLite file shared by local processes."""
+
+	def __init__(self, path, max_pending=MAX_PENDING, lease=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS) -> None:
+		self.path = path
+		self.max_pending = max_pending
+		self.lease = lease
+		self.max_attempts = max_attempts
+		self._local = threading.local()
+		self._connect().executescript(_SCHEMA)
+
+	def _connect(self):
+		conn = getattr(self._local, "conn", None)
+		if conn is None:
+			# Imported here: handlers load this module even with the mode off
+			import sqlite3
+
+			# Autocommit mode: transactions are opened explicitly below
+			conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.execute("PRAGMA synchronous=FULL")
+			self._local.conn = conn
+		return conn
+
+	def enqueue(self, kind, records) -> None:
+		"""Durably append ``records`` (dicts with an ``id``); all or nothing."""
+		conn = self._connect()
+		now = time.time()
+		conn.execute("BEGIN IMMEDIATE")
+		try:
+			(pending,) = conn.execute("SELECT count(*) FROM queue").fetchone()
+			if pending + len(records) > self.max_pending:
+				raise QueueFull(f"{pending} records already waiting to be written")
+			conn.executemany(
+				"INSERT INTO queue (kind, record_id, payload, enqueued_at) VALUES (?, ?, ?, ?)",
+				[(kind, r["id"], json.dumps(r), now) for r in records],
+			)
+			conn.execute("COMMIT")
+		except BaseException:
+			conn.execute("ROLLBACK")
+			raise
+
+	def claim(self, limit):
+		"""Lease up to ``limit`` ready records of one kind: ``(kind, [(seq, attempts, record)])``."""
+		conn = self._connect()
+		now = time.time()
+		conn.execute("BEGIN IMMEDIATE")
+		try:
+			head = conn.execute(
+				"SELECT kind FROM queue WHERE next_attempt <= ? AND claimed_until <= ? "
+				"ORDER BY seq LIMIT 1",
+				(now, now),
+			).fetchone()
+			if head is None:
+				conn.execute("COMMIT")
+				return None, []
+			rows = conn.execute(
+				"SELECT seq, attempts, payload FROM queue "
+				"WHERE kind = ? AND next_attempt <= ? AND claimed_until <= ? ORDER BY seq LIMIT ?",
+				(head[0], now, now, limit),
+			).fetchall()
+			conn.executemany(
+				"UPDATE queue SET claimed_until = ? WHERE seq = ?",
+				[(now + self.lease, seq) for seq, _, _ in rows],
+			)
+			conn.execute("COMMIT")
+		except BaseException:
+			conn.execute("ROLLBACK")
+			raise
+		return head[0], [(seq, attempts, json.loads(payload)) for seq, attempts, payload in rows]
+
+	def ack(self, seqs) -> None:
+		conn = self._connect()
+		conn.execute("BEGIN IMMEDIATE")
+		try:
+			conn.executemany("DELETE FROM queue WHERE seq = ?", [(s,) for s in seqs])
+			conn.execute("COMMIT")
+		except BaseException:
+			conn.execute("ROLLBACK")
+			raise
+
+	def fail(self, claimed, error) -> None:
+		"""Schedule a retry with backoff, or dead-letter after ``max_attempts``."""
+		conn = self._connect()
+		now = time.time()
+		message = str(error)[:1000]
+		conn.execute("BEGIN IMMEDIATE")
+		try:
+			for seq, attempts, _ in claimed:
+				attempts += 1
+				if attempts >= self.max_attempts:
+					conn.execute(
+						"INSERT OR REPLACE INTO dead (seq, kind, record_id, payload, enqueued_at, attempts, last_error) "
+						"SELECT seq, kind, record_id, payload, enqueued_at, ?, ? FROM queue WHERE seq = ?",
+						(attempts, message, seq),
+					)
+					conn.execute("DELETE FROM queue WHERE seq = ?", (seq,))
+				else:
+					conn.execute(
+						"UPDATE queue SET attempts = ?, next_attempt = ?, claimed_until = 0, last_error = ? "
+						"WHERE seq = ?",
+						(attempts, now + min(MAX_BACKOFF_SECONDS, 2.0 ** attempts), message, seq),
+					)
+			conn.execute("COMMIT")
+		except BaseException:
+			conn.execute("ROLLBACK")
+			raise
+
+	def requeue_dead(self) -> int:
+		conn = self._connect()
+		conn.execute("BEGIN IMMEDIATE")
+		try:
+			moved = conn.execute(
+				"INSERT INTO queue (seq, kind, record_id, payload, enqueued_at) "
+				"SELECT seq, kind, record_id, payload, enqueued_at FROM dead"
+			).rowcount
+			conn.execute("DELETE FROM dead")
+			conn.execute("COMMIT")
+		except BaseException:
+			conn.execute("ROLLBACK")
+			raise
+		return moved
+
+	def stats(self) -> dict:
+		conn = self._connect()
+		pending, oldest = conn.execute("SELECT count(*), min(enqueued_at) FROM queue").fetchone()
+		(dead,) = conn.execute("SELECT count(*) FROM dead").fetchone()
+		return {
+			"pending": pending,
+			"dead": dead,
+			"oldest_age_seconds": round(time.time() - oldest, 3) if oldest else None,
+			"max_pending": self.max_pending,
+		}
+
+
+def _flush(kind, records) -> None:
+	"""Write one claimed batch to Postgres (idempotent by id)."""
+	from shared_code import cache, db, rollups, schema, writes
+
+	created = []
+	for r in records:
+		created_at = datetime.fromisoformat(r["created_at"])
+		if created_at.tzinfo is None:
+			# Queued before the handlers stamped an offset; they always used UTC
+			created_at = created_at.replace(tzinfo=timezone.utc)
+		created.append(created_at)
+	with db.connection() as conn:
+		schema.ensure_schema(conn)
+		cursor = conn.cursor()
+		try:
+			if kind == "memory":
+				inserted = writes.insert_memory(cursor, records, created)
+			else:
+				inserted = writes.insert_feedback(cursor, records, created)
+				rollups.record(
+					cursor,
+					[
+						(r["tenant_id"], r["response_id"], r["rating"], c)
+						for r, c in writes.stored(records, created, inserted)
+					],
+				)
+			conn.commit()
+		finally:
+			try:
+				cursor.close()
+			except Exception:
+				pass
+	cache.written(kind, [dict(r, created_at=c.isoformat()) for r, c in writes.stored(records, created, inserted)])
+
+
+def _unavailable(error) -> bool:
+	"""Whether ``error`` means Postgres could not be reached, not that it rejected the write."""
+	from shared_code import db
+
+	if isinstance(error, (OSError, db.PoolTimeout)):
+		return True
+	# Only loaded once a connection has been attempted
+	pg8000 = sys.modules.get("pg8000")
+	return pg8000 is not None and isinstance(error, pg8000.InterfaceError)
+
+
+class Flusher(threading.Thread):
+	"""Daemon thread draining the queue in batches of ``BATCH_SIZE``."""
+
+	def __init__(self, queue, batch_size=BATCH_SIZE) -> None:
+		super().__init__(name="write-behind-flusher", daemon=True)
+		self.queue = queue
+		self.batch_size = batch_size
+		self.wake = threading.Event()
+		self._stats = {"flushed": 0, "batches": 0, "failures": 0, "last_error": None}
+
+	def run(self) -> None:
+		while True:
+			try:
+				kind, claimed = self.queue.claim(self.batch_size)
+			except Exception:
+				logging.exception("write-behind: claiming a batch failed")
+				kind, claimed = None, []
+			if not claimed:
+				self.wake.wait(POLL_SECONDS)
+				self.wake.clear()
+				continue
+			failed = self.write(kind, claimed)
+			if failed:
+				self._stats["failures"] += 1
+				self._stats["last_error"] = str(failed[0][1])[:200]
+				# One fail() per distinct error, so each record keeps its own message
+				by_error = {}
+				for entry, error in failed:
+					by_error.setdefault(id(error), (error, []))[1].append(entry)
+				for error, entries in by_error.values():
+					logging.warning("write-behind: writing %d %s records failed: %s", len(entries), kind, error)
+					try:
+						self.queue.fail(entries, error)
+					except Exception:
+						# Lease expiry redelivers them
+						logging.exception("write-behind: recording the failure failed")
+			failed_seqs = {entry[0] for entry, _ in failed}
+			written = [seq for seq, _, _ in claimed if seq not in failed_seqs]
+			if not written:
+				continue
+			try:
+				self.queue.ack(written)
+			except Exception:
+				# Lease expiry redelivers the batch; the inserts skip ids already stored
+				logging.exception("write-behind: acknowledging a flushed batch failed")
+			self._stats["flushed"] += len(written)
+			self._stats["batches"] += 1
+
+	def write(self, kind, claimed) -> list:
+		"""Flush ``claimed`` entries; returns ``[(entry, error)]`` for those not written.
+
+		A rejected batch is bisected until the failing records are isolated;
+		when Postgres is unreachable the whole batch fails without splitting.
+		"""
+		try:
+			_flush(kind, [record for _, _, record in claimed])
+			return []
+		except Exception as e:
+			if len(claimed) == 1 or _unavailable(e):
+				return [(entry, e) for entry in claimed]
+			logging.info("write-behind: %d %s records rejected, splitting: %s", len(claimed), kind, e)
+		middle = len(claimed) // 2
+		return self.write(kind, claimed[:middle]) + self.write(kind, claimed[middle:])
+
+	def stats(self) -> dict:
+		return dict(self._stats)
+
+
+def queue_path() -> str:
+	if PATH:
+		return PATH
+	import tempfile
+
+	return os.path.join(tempfile.gettempdir(), "apex-write-behind.sqlite")
+
+
+_queue = None
+_flusher = None
+_start_lock = threading.Lock()
+
+
+def start():
+	"""Open the queue and start this process's flusher (idempotent)."""
+	global _queue, _flusher
+	if _flusher is None:
+		with _start_lock:
+			if _flusher is None:
+				_queue = WriteBehindQueue(queue_path())
+				flusher = Flusher(_queue)
+				flusher.start()
+				_flusher = flusher
+	return _queue
+
+
+def enqueue(kind, records) -> None:
+	"""Queue validated records (with ``created_at`` ISO strings); raises :class:`QueueFull`."""
+	start().enqueue(kind, records)
+	_flusher.wake.set()
+
+
+def stats() -> dict:
+	if not ENABLED:
+		return {"enabled": False}
+	return dict(start().stats(), **_flusher.stats())
+
+
+# Drain whatever a previous process left behind as soon as a handler loads
+if ENABLED:
+	start()
+
+
+if __name__ == "__main__":
+	import sys
+
+	queue = WriteBehindQueue(queue_path())
+	if "--requeue-dead" in sys.argv:
+		print(f"Requeued {queue.requeue_dead()} dead records")
+	print(json.dumps(queue.stats()))
@@ -0,0 +1,110 @@
+"""Bulk inserts for chat memory and feedback records.
+
+Shared by the batch endpoints and the write-behind flusher. One statement per
+batch: each column travels as a single array parameter, so the statement text
+(and pg8000's prepared statement) is the same whatever the batch size.
+Existing ids are skipped, which makes replays of the same records harmless.
+Memory token counts (:mod:`shared_code.tokens`) are computed here, so queued
+write-behind records are counted when they reach Postgres.
+
+The tables are partitioned by month of ``created_at`` (migration 007), so the
+primary key is ``(id, created_at)``: ``ON CONFLICT`` catches exact replays and
+the ``NOT EXISTS`` probe (one primary key lookup per month) catches ids stored
+earlier under another timestamp. Neither sees rows of the same statement, and
+copies of an id inside one batch carry different ``created_at`` values, so
+only the first record per id is bound (:func:`_first_per_id`).
+"""
+
+import json
+
+from shared_code import tokens
+
+MEMORY_INSERT_SQL = """
+	INSERT INTO chat_memory.messages (
+		id, tenant_id, user_id, session_id, content, message_type, created_at, metadata, token_count
+	)
+	SELECT * FROM unnest(
+		%s::varchar[], %s::varchar[], %s::varchar[], %s::varchar[],
+		%s::text[], %s::varchar[], %s::timestamptz[], %s::jsonb[], %s::int[]
+	) AS u (id, tenant_id, user_id, session_id, content, message_type, created_at, metadata, token_count)
+	WHERE NOT EXISTS (SELECT 1 FROM chat_memory.messages e WHERE e.id = u.id)
+	ON CONFLICT DO NOTHING
+	RETURNING id
+"""
+
+FEEDBACK_INSERT_SQL = """
+	INSERT INTO rag_feedback.entries (
+		id, tenant_id, user_id, response_id, feedback_note, rating, created_at, metadata
+	)
+	SELECT * FROM unnest(
+		%s::varchar[], %s::varchar[], %s::varchar[], %s::varchar[],
+		%s::text[], %s::int[], %s::timestamptz[], %s::jsonb[]
+	) AS u (id, tenant_id, user_id, response_id, feedback_note, rating, created_at, metadata)
+	WHERE NOT EXISTS (SELECT 1 FROM rag_feedback.entries e WHERE e.id = u.id)
+	ON CONFLICT DO NOTHING
+	RETURNING id
+"""
+
+
+def _first_per_id(records, created):
+	"""``(records, created)`` without the later copies of ids repeated in the batch."""
+	seen = set()
+	keep = []
+	for index, r in enumerate(records):
+		if r["id"] not in seen:
+			seen.add(r["id"])
+			keep.append(index)
+	if len(keep) == len(records):
+		return records, list(created)
+	created = list(created)
+	return [records[i] for i in keep], [created[i] for i in keep]
+
+
+def stored(records, created, inserted) -> list:
+	"""``(record, created_at)`` of the copy actually written for each id in ``inserted``."""
+	remaining = set(inserted)
+	out = []
+	for r, c in zip(records, created):
+		if r["id"] in remaining:
+			remaining.discard(r["id"])
+			out.append((r, c))
+	return out
+
+
+def insert_memory(cursor, records, created) -> set:
+	"""Insert validated memory records; returns the ids actually inserted."""
+	records, created = _first_per_id(records, created)
+	cursor.execute(
+		MEMORY_INSERT_SQL,
+		[
+			[r["id"] for r in records],
+			[r["tenant_id"] for r in records],
+			[r["user_id"] for r in records],
+			[r["session_id"] for r in records],
+			[r["content"] for r in records],
+			[r["message_type"] for r in records],
+			list(created),
+			[json.dumps(r["metadata"]) for r in records],
+			[tokens.count(r["content"]) for r in records],
+		],
+	)
+	return {row[0] for row in cursor.fetchall()}
+
+
+def insert_feedback(cursor, records, created) -> set:
+	"""Insert validated feedback records; returns the ids actually inserted."""
+	records, created = _first_per_id(records, created)
+	cursor.execute(
+		FEEDBACK_INSERT_SQL,
+		[
+			[r["id"] for r in records],
+			[r["tenant_id"] for r in records],
+			[r["user_id"] for r in records],
+			[r["response_id"] for r in records],
+			[r["feedback_text"] for r in records],
+			[r["rating"] for r in records],
+			list(created),
+			[json.dumps(r["metadata"]) for r in records],
+		],
+	)
+	return {row[0] for row in cursor.fetchall()}
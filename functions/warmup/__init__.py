@@ -0,0 +1,21 @@
+import azure.functions as func
+import logging
+import os
+import time
+
+from shared_code import db
+
+
+def main(warmupContext: func.Context) -> None:
+	"""Warmup trigger (Premium plans): open pooled connections before the instance gets traffic"""
+	if not os.environ.get("POSTGRES_CONNECTION"):
+		logging.warning("Warmup skipped: POSTGRES_CONNECTION not set")
+		return
+
+	start = time.perf_counter()
+	opened = db.prewarm(max(db.PREWARM, 1))
+	logging.info(
+		"Warmup opened %d database connection(s) in %.1f ms",
+		opened,
+		(time.perf_counter() - start) * 1000,
+	)
@@ -0,0 +1,142 @@
+-- =====================================================
+-- Apex MVP Database Schema - 002
+-- Settles the Azure Functions handlers on the chat_memory / rag_feedback
+-- schemas from 001 instead of their ad-hoc public.chat_memory and
+-- public.rag_feedback tables, and adds the composite indexes used by
+-- "WHERE tenant_id = ... ORDER BY created_at DESC LIMIT n".
+--
+-- Idempotent: safe on a fresh database and on one where 001 was applied.
+-- The Functions app applies the same statements once per worker when the
+-- database is behind (functions/shared_code/schema.py); keep both in sync.
+-- =====================================================
+
+CREATE SCHEMA IF NOT EXISTS rag_feedback;
+CREATE SCHEMA IF NOT EXISTS chat_memory;
+
+CREATE TABLE IF NOT EXISTS public.schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS chat_memory.conversations (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id VARCHAR(255) NOT NULL,
+    tenant_id VARCHAR(255) NOT NULL,
+    project_id VARCHAR(255),
+    session_id VARCHAR(255),
+    conversation_title VARCHAR(500),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS chat_memory.messages (
+    id VARCHAR(36) PRIMARY KEY DEFAULT gen_random_uuid()::text,
+    conversation_id UUID REFERENCES chat_memory.conversations(id) ON DELETE CASCADE,
+    user_id VARCHAR(255) NOT NULL,
+    tenant_id VARCHAR(255) NOT NULL,
+    session_id VARCHAR(255),
+    message_type VARCHAR(50) NOT NULL,
+    content TEXT NOT NULL,
+    metadata JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS rag_feedback.entries (
+    id VARCHAR(36) PRIMARY KEY DEFAULT gen_random_uuid()::text,
+    user_id VARCHAR(255) NOT NULL,
+    tenant_id VARCHAR(255) NOT NULL,
+    project_id VARCHAR(255),
+    document_id VARCHAR(255),
+    response_id VARCHAR(255),
+    query TEXT,
+    result TEXT,
+    user_feedback VARCHAR(10) CHECK (user_feedback IN ('thumbs_up', 'thumbs_down')),
+    rating INTEGER CHECK (rating >= 1 AND rating <= 5),
+    feedback_note TEXT,
+    signal_strength INTEGER DEFAULT 1 CHECK (signal_strength >= 1 AND signal_strength <= 10),
+    metadata JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Bring 001 tables up to the handler contract: client supplied string ids,
+-- free-form message types, session/response ids, 1-5 ratings and metadata.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'chat_memory' AND table_name = 'messages' AND column_name = 'session_id'
+    ) THEN
+        ALTER TABLE chat_memory.messages
+            ALTER COLUMN id DROP DEFAULT,
+            ALTER COLUMN id TYPE VARCHAR(36) USING id::text,
+            ALTER COLUMN id SET DEFAULT gen_random_uuid()::text,
+            ALTER COLUMN conversation_id DROP NOT NULL,
+            ALTER COLUMN message_type TYPE VARCHAR(50),
+            DROP CONSTRAINT IF EXISTS messages_message_type_check,
+            ADD COLUMN session_id VARCHAR(255);
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'rag_feedback' AND table_name = 'entries' AND column_name = 'response_id'
+    ) THEN
+        ALTER TABLE rag_feedback.entries
+            ALTER COLUMN id DROP DEFAULT,
+            ALTER COLUMN id TYPE VARCHAR(36) USING id::text,
+            ALTER COLUMN id SET DEFAULT gen_random_uuid()::text,
+            ALTER COLUMN query DROP NOT NULL,
+            ALTER COLUMN result DROP NOT NULL,
+            ALTER COLUMN user_feedback DROP NOT NULL,
+            ADD COLUMN response_id VARCHAR(255),
+            ADD COLUMN rating INTEGER CHECK (rating >= 1 AND rating <= 5),
+            ADD COLUMN metadata JSONB;
+    END IF;
+END
+$$;
+
+-- Carry over rows written by the handlers' former ad-hoc tables
+DO $$
+BEGIN
+    IF to_regclass('public.chat_memory') IS NOT NULL THEN
+        INSERT INTO chat_memory.messages (
+            id, tenant_id, user_id, session_id, content, message_type, created_at, metadata
+        )
+        SELECT id, tenant_id, user_id, session_id, content, message_type, created_at, metadata
+        FROM public.chat_memory
+        ON CONFLICT (id) DO NOTHING;
+    END IF;
+
+    IF to_regclass('public.rag_feedback') IS NOT NULL THEN
+        INSERT INTO rag_feedback.entries (
+            id, tenant_id, user_id, response_id, feedback_note, rating, created_at, metadata
+        )
+        SELECT id, tenant_id, user_id, response_id, feedback, rating, created_at, metadata
+        FROM public.rag_feedback
+        ON CONFLICT (id) DO NOTHING;
+    END IF;
+END
+$$;
+
+-- Composite indexes for the tenant-scoped "newest first" reads
+CREATE INDEX IF NOT EXISTS idx_messages_tenant_created
+    ON chat_memory.messages(tenant_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_tenant_user_created
+    ON chat_memory.messages(tenant_id, user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_tenant_session_created
+    ON chat_memory.messages(tenant_id, session_id, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_rag_feedback_tenant_created
+    ON rag_feedback.entries(tenant_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_rag_feedback_tenant_user_created
+    ON rag_feedback.entries(tenant_id, user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_rag_feedback_tenant_response_created
+    ON rag_feedback.entries(tenant_id, response_id, created_at DESC);
+
+INSERT INTO public.schema_migrations (version, name) VALUES (2, '002_handler_schema')
+ON CONFLICT (version) DO NOTHING;
+
+COMMENT ON COLUMN chat_memory.messages.session_id IS 'Client session the message belongs to (Functions API)';
+COMMENT ON COLUMN rag_feedback.entries.response_id IS 'Response the feedback refers to (Functions API)';
+COMMENT ON COLUMN rag_feedback.entries.rating IS 'User rating of the response (1-5 scale)';
@@ -0,0 +1,19 @@
+-- =====================================================
+-- Apex MVP Database Schema - 003
+-- Idempotency keys for POST /api/feedback/batch: a retried batch carrying
+-- the same key returns the stored response instead of writing again.
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS rag_feedback.batch_requests (
+    idempotency_key VARCHAR(255) PRIMARY KEY,
+    response JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Supports purging old keys by age
+CREATE INDEX IF NOT EXISTS idx_batch_requests_created_at ON rag_feedback.batch_requests(created_at);
+
+INSERT INTO public.schema_migrations (version, name) VALUES (3, '003_feedback_batch_requests')
+ON CONFLICT (version) DO NOTHING;
+
+COMMENT ON TABLE rag_feedback.batch_requests IS 'Responses of idempotent feedback batch calls, keyed by Idempotency-Key';
@@ -0,0 +1,38 @@
+-- =====================================================
+-- Apex MVP Database Schema - 004
+-- Keyset pagination for GET /api/memory and GET /api/feedback.
+-- Pages are read as "(created_at, id) < (cursor) ORDER BY created_at DESC,
+-- id DESC", so the tenant indexes from 002 gain id as a tiebreaker and
+-- created_at becomes NOT NULL (NULLs would sort first and escape the cursor).
+-- =====================================================
+
+UPDATE chat_memory.messages SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE chat_memory.messages ALTER COLUMN created_at SET NOT NULL;
+
+UPDATE rag_feedback.entries SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE rag_feedback.entries ALTER COLUMN created_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_messages_tenant_created_id
+    ON chat_memory.messages(tenant_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_tenant_user_created_id
+    ON chat_memory.messages(tenant_id, user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_tenant_session_created_id
+    ON chat_memory.messages(tenant_id, session_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_rag_feedback_tenant_created_id
+    ON rag_feedback.entries(tenant_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_rag_feedback_tenant_user_created_id
+    ON rag_feedback.entries(tenant_id, user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_rag_feedback_tenant_response_created_id
+    ON rag_feedback.entries(tenant_id, response_id, created_at DESC, id DESC);
+
+-- Superseded by the indexes above
+DROP INDEX IF EXISTS chat_memory.idx_messages_tenant_created;
+DROP INDEX IF EXISTS chat_memory.idx_messages_tenant_user_created;
+DROP INDEX IF EXISTS chat_memory.idx_messages_tenant_session_created;
+DROP INDEX IF EXISTS rag_feedback.idx_rag_feedback_tenant_created;
+DROP INDEX IF EXISTS rag_feedback.idx_rag_feedback_tenant_user_created;
+DROP INDEX IF EXISTS rag_feedback.idx_rag_feedback_tenant_response_created;
+
+INSERT INTO public.schema_migrations (version, name) VALUES (4, '004_keyset_pagination')
+ON CONFLICT (version) DO NOTHING;
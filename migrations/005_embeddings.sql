@@ -0,0 +1,30 @@
+-- =====================================================
+-- Apex MVP Database Schema - 005
+-- Embedding store behind the Flask API's POST /memory and /memory/search.
+-- Vectors are packed little-endian float32 (4 bytes per dimension) rather
+-- than JSON text; see api/vectors.py.
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS chat_memory.embeddings (
+    id VARCHAR(36) PRIMARY KEY DEFAULT gen_random_uuid()::text,
+    tenant_id VARCHAR(255) NOT NULL,
+    project_id VARCHAR(255) NOT NULL,
+    embedding BYTEA NOT NULL,
+    dim INTEGER NOT NULL CHECK (dim > 0),
+    content TEXT NOT NULL,
+    metadata JSONB,
+    source VARCHAR(500),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CHECK (octet_length(embedding) = dim * 4)
+);
+
+-- Search scans one tenant/project (and dimension) at a time
+CREATE INDEX IF NOT EXISTS idx_embeddings_tenant_project
+    ON chat_memory.embeddings(tenant_id, project_id, dim);
+CREATE INDEX IF NOT EXISTS idx_embeddings_created_at ON chat_memory.embeddings(created_at);
+
+INSERT INTO public.schema_migrations (version, name) VALUES (5, '005_embeddings')
+ON CONFLICT (version) DO NOTHING;
+
+COMMENT ON TABLE chat_memory.embeddings IS 'Embedded content chunks for RAG retrieval';
+COMMENT ON COLUMN chat_memory.embeddings.embedding IS 'Packed little-endian float32 vector of length dim';
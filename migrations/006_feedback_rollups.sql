@@ -0,0 +1,52 @@
+-- =====================================================
+-- Apex MVP Database Schema - 006
+-- Daily rating rollups behind GET /api/feedback/stats. One row per
+-- (tenant, response, UTC day) holding the count, rating sum and 1-5
+-- histogram, kept current by the feedback POST handlers in the same
+-- transaction as the insert, so a stats read scans buckets, not entries.
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS rag_feedback.rating_rollups (
+    tenant_id VARCHAR(255) NOT NULL,
+    -- '' for legacy rows without a response id
+    response_id VARCHAR(255) NOT NULL DEFAULT '',
+    day DATE NOT NULL,
+    rating_count BIGINT NOT NULL DEFAULT 0,
+    rating_sum BIGINT NOT NULL DEFAULT 0,
+    rating_1 BIGINT NOT NULL DEFAULT 0,
+    rating_2 BIGINT NOT NULL DEFAULT 0,
+    rating_3 BIGINT NOT NULL DEFAULT 0,
+    rating_4 BIGINT NOT NULL DEFAULT 0,
+    rating_5 BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (tenant_id, response_id, day)
+);
+
+-- Per-day series for a tenant without touching every response's buckets
+CREATE INDEX IF NOT EXISTS idx_rating_rollups_tenant_day
+    ON rag_feedback.rating_rollups(tenant_id, day);
+
+-- Backfill from existing feedback (no-op when re-run: rebuilt from scratch)
+DELETE FROM rag_feedback.rating_rollups;
+INSERT INTO rag_feedback.rating_rollups (
+    tenant_id, response_id, day, rating_count, rating_sum,
+    rating_1, rating_2, rating_3, rating_4, rating_5
+)
+SELECT
+    tenant_id,
+    COALESCE(response_id, ''),
+    (created_at AT TIME ZONE 'UTC')::date,
+    count(*),
+    sum(rating),
+    count(*) FILTER (WHERE rating = 1),
+    count(*) FILTER (WHERE rating = 2),
+    count(*) FILTER (WHERE rating = 3),
+    count(*) FILTER (WHERE rating = 4),
+    count(*) FILTER (WHERE rating = 5)
+FROM rag_feedback.entries
+WHERE rating IS NOT NULL
+GROUP BY 1, 2, 3;
+
+INSERT INTO public.schema_migrations (version, name) VALUES (6, '006_feedback_rollups')
+ON CONFLICT (version) DO NOTHING;
+
+COMMENT ON TABLE rag_feedback.rating_rollups IS 'Per tenant/response/UTC day rating counts, sums and 1-5 histogram';
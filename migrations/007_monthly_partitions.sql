@@ -0,0 +1,155 @@
+-- =====================================================
+-- Apex MVP Database Schema - 007
+-- Range-partitions chat_memory.messages and rag_feedback.entries by month
+-- of created_at (UTC). Each insert only maintains the current month's
+-- indexes, old months are dropped or archived as whole tables instead of
+-- DELETEd, and the tenant "newest first" reads prune to the months a
+-- cursor can still reach.
+--
+-- Partitioned tables need the partition key in every unique constraint, so
+-- the primary keys become (id, created_at); the handlers' inserts skip ids
+-- that already exist in any month (functions/shared_code/writes.py).
+--
+-- Existing rows are copied into the new tables inside this migration's
+-- transaction: on a large database run it in a maintenance window.
+-- Future months are created ahead of time by the partition maintenance job
+-- (functions/shared_code/partitions.py); a DEFAULT partition catches rows
+-- that arrive before their month exists and the job moves them out.
+-- =====================================================
+
+CREATE SCHEMA IF NOT EXISTS archive;
+
+-- Per-tenant retention overrides read by the maintenance job; NULL months
+-- fall back to PARTITION_RETENTION_MONTHS (unset = keep forever)
+CREATE TABLE IF NOT EXISTS public.tenant_retention (
+    tenant_id VARCHAR(255) PRIMARY KEY,
+    memory_months INTEGER CHECK (memory_months > 0),
+    feedback_months INTEGER CHECK (feedback_months > 0),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create (and attach) the partition of parent covering the UTC month of
+-- month, moving any rows already sitting in the DEFAULT partition into it.
+-- Returns false when the partition already exists.
+CREATE OR REPLACE FUNCTION public.create_month_partition(parent regclass, month date)
+RETURNS boolean AS $$
+DECLARE
+    parent_schema text;
+    parent_name text;
+    part_name text;
+    lower_bound timestamptz := date_trunc('month', month::timestamp) AT TIME ZONE 'UTC';
+    upper_bound timestamptz := (date_trunc('month', month::timestamp) + interval '1 month') AT TIME ZONE 'UTC';
+BEGIN
+    SELECT n.nspname, c.relname INTO parent_schema, parent_name
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.oid = parent;
+    part_name := parent_name || '_p' || to_char(month, 'YYYY_MM');
+    IF to_regclass(format('%I.%I', parent_schema, part_name)) IS NOT NULL THEN
+        RETURN false;
+    END IF;
+
+    EXECUTE format(
+        'CREATE TABLE %I.%I (LIKE %s INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+        parent_schema, part_name, parent
+    );
+    IF to_regclass(format('%I.%I', parent_schema, parent_name || '_default')) IS NOT NULL THEN
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM %I.%I WHERE created_at >= $1 AND created_at < $2 RETURNING *) '
+            'INSERT INTO %I.%I SELECT * FROM moved',
+            parent_schema, parent_name || '_default', parent_schema, part_name
+        ) USING lower_bound, upper_bound;
+    END IF;
+    -- Attaching builds the partitioned indexes and constraints on the new table
+    EXECUTE format(
+        'ALTER TABLE %s ATTACH PARTITION %I.%I FOR VALUES FROM (%L) TO (%L)',
+        parent, parent_schema, part_name, lower_bound, upper_bound
+    );
+    RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Swap an unpartitioned table for a monthly partitioned copy of it, keeping
+-- its rows, foreign keys and (optionally) the updated_at trigger
+CREATE OR REPLACE FUNCTION pg_temp.partition_by_month(target regclass, updated_at_trigger text)
+RETURNS void AS $$
+DECLARE
+    target_schema text;
+    target_name text;
+    first_month date;
+    foreign_keys text[];
+    fk text;
+BEGIN
+    SELECT n.nspname, c.relname INTO target_schema, target_name
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.oid = target;
+    IF (SELECT relkind FROM pg_class WHERE oid = target) = 'p' THEN
+        RETURN;
+    END IF;
+
+    SELECT array_agg(pg_get_constraintdef(oid)) INTO foreign_keys
+    FROM pg_constraint WHERE conrelid = target AND contype = 'f';
+    EXECUTE format('SELECT (min(created_at) AT TIME ZONE ''UTC'')::date FROM %s', target) INTO first_month;
+
+    EXECUTE format('ALTER TABLE %s RENAME TO %I', target, target_name || '_unpartitioned');
+    EXECUTE format(
+        'CREATE TABLE %I.%I (LIKE %I.%I INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING COMMENTS) '
+        'PARTITION BY RANGE (created_at)',
+        target_schema, target_name, target_schema, target_name || '_unpartitioned'
+    );
+    EXECUTE format(
+        'CREATE TABLE %I.%I PARTITION OF %I.%I DEFAULT',
+        target_schema, target_name || '_default', target_schema, target_name
+    );
+    -- Every month that has rows, plus the current and next three
+    PERFORM public.create_month_partition(format('%I.%I', target_schema, target_name)::regclass, m::date)
+    FROM generate_series(
+        date_trunc('month', LEAST(COALESCE(first_month, current_date), (now() AT TIME ZONE 'UTC')::date)::timestamp),
+        date_trunc('month', (now() AT TIME ZONE 'UTC')::timestamp) + interval '3 months',
+        interval '1 month'
+    ) AS m;
+
+    EXECUTE format(
+        'INSERT INTO %I.%I SELECT * FROM %I.%I',
+        target_schema, target_name, target_schema, target_name || '_unpartitioned'
+    );
+    -- Dropping the old table frees its index and constraint names for the new one
+    EXECUTE format('DROP TABLE %I.%I', target_schema, target_name || '_unpartitioned');
+    EXECUTE format('ALTER TABLE %I.%I ADD PRIMARY KEY (id, created_at)', target_schema, target_name);
+    FOREACH fk IN ARRAY COALESCE(foreign_keys, '{}') LOOP
+        EXECUTE format('ALTER TABLE %I.%I ADD %s', target_schema, target_name, fk);
+    END LOOP;
+    IF updated_at_trigger IS NOT NULL AND to_regproc('public.update_updated_at_column') IS NOT NULL THEN
+        EXECUTE format(
+            'CREATE TRIGGER %I BEFORE UPDATE ON %I.%I FOR EACH ROW EXECUTE FUNCTION public.update_updated_at_column()',
+            updated_at_trigger, target_schema, target_name
+        );
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT pg_temp.partition_by_month('chat_memory.messages', NULL);
+SELECT pg_temp.partition_by_month('rag_feedback.entries', 'update_rag_feedback_updated_at');
+
+-- Partitioned indexes (one per month underneath) for the keyset reads from
+-- 004; the single-column indexes from 001 are not carried over
+CREATE INDEX IF NOT EXISTS idx_messages_tenant_created_id
+    ON chat_memory.messages(tenant_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_tenant_user_created_id
+    ON chat_memory.messages(tenant_id, user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_tenant_session_created_id
+    ON chat_memory.messages(tenant_id, session_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_rag_feedback_tenant_created_id
+    ON rag_feedback.entries(tenant_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_rag_feedback_tenant_user_created_id
+    ON rag_feedback.entries(tenant_id, user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_rag_feedback_tenant_response_created_id
+    ON rag_feedback.entries(tenant_id, response_id, created_at DESC, id DESC);
+
+INSERT INTO public.schema_migrations (version, name) VALUES (7, '007_monthly_partitions')
+ON CONFLICT (version) DO NOTHING;
+
+COMMENT ON TABLE chat_memory.messages IS 'Individual messages within conversations, partitioned by month of created_at';
+COMMENT ON TABLE rag_feedback.entries IS 'User feedback entries for RAG responses, partitioned by month of created_at';
+COMMENT ON TABLE public.tenant_retention IS 'Per-tenant retention in months for memory and feedback; NULL uses the default';
+COMMENT ON SCHEMA archive IS 'Expired partitions and rows moved aside by the partition maintenance job';
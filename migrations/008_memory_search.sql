@@ -0,0 +1,87 @@
+-- =====================================================
+-- Apex MVP Database Schema - 008
+-- Full-text search over chat memory (GET /api/memory/search). content is
+-- indexed through a stored generated tsvector, so the search reads a GIN
+-- index instead of scanning a tenant's messages, and every insert keeps it
+-- current without any handler change.
+--
+-- With the btree_gin extension the index leads with tenant_id, so a search
+-- only walks its own tenant's postings; where the extension cannot be
+-- installed (not allow-listed on the server) the index covers content_tsv
+-- alone and the planner ANDs it with the tenant keyset index from 007.
+--
+-- Adding the column rewrites every partition: on a large database run this
+-- migration in a maintenance window.
+-- =====================================================
+
+ALTER TABLE chat_memory.messages
+    ADD COLUMN IF NOT EXISTS content_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('english'::regconfig, COALESCE(content, ''))) STORED;
+
+-- Rows archived by the partition maintenance job are copied with SELECT *,
+-- so the archive copy needs the same columns (as a plain column)
+ALTER TABLE IF EXISTS archive.messages_expired ADD COLUMN IF NOT EXISTS content_tsv tsvector;
+
+-- New partitions must carry the generated column as generated, and rows
+-- moved out of the DEFAULT partition are copied without it (it is recomputed)
+CREATE OR REPLACE FUNCTION public.create_month_partition(parent regclass, month date)
+RETURNS boolean AS $$
+DECLARE
+    parent_schema text;
+    parent_name text;
+    part_name text;
+    columns text;
+    lower_bound timestamptz := date_trunc('month', month::timestamp) AT TIME ZONE 'UTC';
+    upper_bound timestamptz := (date_trunc('month', month::timestamp) + interval '1 month') AT TIME ZONE 'UTC';
+BEGIN
+    SELECT n.nspname, c.relname INTO parent_schema, parent_name
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.oid = parent;
+    part_name := parent_name || '_p' || to_char(month, 'YYYY_MM');
+    IF to_regclass(format('%I.%I', parent_schema, part_name)) IS NOT NULL THEN
+        RETURN false;
+    END IF;
+
+    EXECUTE format(
+        'CREATE TABLE %I.%I (LIKE %s INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)',
+        parent_schema, part_name, parent
+    );
+    IF to_regclass(format('%I.%I', parent_schema, parent_name || '_default')) IS NOT NULL THEN
+        SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO columns
+        FROM pg_attribute
+        WHERE attrelid = parent AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM %I.%I WHERE created_at >= $1 AND created_at < $2 RETURNING *) '
+            'INSERT INTO %I.%I (%s) SELECT %s FROM moved',
+            parent_schema, parent_name || '_default', parent_schema, part_name, columns, columns
+        ) USING lower_bound, upper_bound;
+    END IF;
+    -- Attaching builds the partitioned indexes and constraints on the new table
+    EXECUTE format(
+        'ALTER TABLE %s ATTACH PARTITION %I.%I FOR VALUES FROM (%L) TO (%L)',
+        parent, parent_schema, part_name, lower_bound, upper_bound
+    );
+    RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    BEGIN
+        CREATE EXTENSION IF NOT EXISTS btree_gin;
+    EXCEPTION WHEN OTHERS THEN
+        RAISE NOTICE 'btree_gin unavailable (%), indexing content_tsv without tenant_id', SQLERRM;
+    END;
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'btree_gin') THEN
+        CREATE INDEX IF NOT EXISTS idx_messages_tenant_content_tsv
+            ON chat_memory.messages USING gin (tenant_id, content_tsv);
+    ELSE
+        CREATE INDEX IF NOT EXISTS idx_messages_content_tsv
+            ON chat_memory.messages USING gin (content_tsv);
+    END IF;
+END $$;
+
+INSERT INTO public.schema_migrations (version, name) VALUES (8, '008_memory_search')
+ON CONFLICT (version) DO NOTHING;
+
+COMMENT ON COLUMN chat_memory.messages.content_tsv IS 'English tsvector of content for GET /api/memory/search';
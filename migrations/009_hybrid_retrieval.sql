@@ -0,0 +1,45 @@
+-- =====================================================
+-- Apex MVP Database Schema - 009
+-- Hybrid retrieval (POST /memory/search/hybrid in the Flask API): keyword
+-- candidates over chat_memory.embeddings come from a generated tsvector
+-- with a GIN index, vector candidates from the existing vector search.
+--
+-- The feedback boost per document_id (= embeddings.id) is aggregated from
+-- rag_feedback.entries by each API worker and refreshed incrementally:
+-- only documents whose feedback changed since the last refresh are
+-- re-summed, found through the (tenant_id, updated_at) index below.
+-- =====================================================
+
+ALTER TABLE chat_memory.embeddings
+    ADD COLUMN IF NOT EXISTS content_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('english'::regconfig, content)) STORED;
+
+-- btree_gin (see 008) lets the index lead with the tenant/project scope
+DO $$
+BEGIN
+    BEGIN
+        CREATE EXTENSION IF NOT EXISTS btree_gin;
+    EXCEPTION WHEN OTHERS THEN
+        RAISE NOTICE 'btree_gin unavailable (%), indexing content_tsv without tenant_id', SQLERRM;
+    END;
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'btree_gin') THEN
+        CREATE INDEX IF NOT EXISTS idx_embeddings_tenant_project_content_tsv
+            ON chat_memory.embeddings USING gin (tenant_id, project_id, content_tsv);
+    ELSE
+        CREATE INDEX IF NOT EXISTS idx_embeddings_content_tsv
+            ON chat_memory.embeddings USING gin (content_tsv);
+    END IF;
+END $$;
+
+-- Re-summing one document's feedback, and finding documents with feedback
+-- changed since a watermark (the 001 single-column indexes were not carried
+-- over by 007)
+CREATE INDEX IF NOT EXISTS idx_rag_feedback_tenant_document
+    ON rag_feedback.entries(tenant_id, document_id) WHERE document_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_rag_feedback_tenant_updated
+    ON rag_feedback.entries(tenant_id, updated_at) WHERE document_id IS NOT NULL;
+
+INSERT INTO public.schema_migrations (version, name) VALUES (9, '009_hybrid_retrieval')
+ON CONFLICT (version) DO NOTHING;
+
+COMMENT ON COLUMN chat_memory.embeddings.content_tsv IS 'English tsvector of content for hybrid keyword candidates';
@@ -0,0 +1,20 @@
+-- =====================================================
+-- Apex MVP Database Schema - 010
+-- Stored token counts for GET /api/memory/context. Every write path fills
+-- token_count (functions/shared_code/tokens.py), so filling a token budget
+-- reads integers instead of re-tokenizing content.
+--
+-- A nullable column without a default is a catalog-only change: no rewrite
+-- of existing partitions. Rows written before this migration keep NULL and
+-- are estimated from length(content) when read (see shared_code/context.py).
+-- =====================================================
+
+ALTER TABLE chat_memory.messages ADD COLUMN IF NOT EXISTS token_count integer;
+
+-- Expired rows are archived with SELECT * (see 008)
+ALTER TABLE IF EXISTS archive.messages_expired ADD COLUMN IF NOT EXISTS token_count integer;
+
+INSERT INTO public.schema_migrations (version, name) VALUES (10, '010_token_counts')
+ON CONFLICT (version) DO NOTHING;
+
+COMMENT ON COLUMN chat_memory.messages.token_count IS 'Tokens in content, counted when the message was written';
@@ -0,0 +1,42 @@
+-- =====================================================
+-- Apex MVP Database Schema - 011
+-- Session compaction (functions/shared_code/compaction.py): messages older
+-- than the compaction horizon are folded, oldest first, into one rolling
+-- summary per session and marked archived. Reads of a session return the
+-- summary plus the live messages after it, bounded by the summary's
+-- (through_created_at, through_id) keyset however old the session is.
+--
+-- archived_at is nullable without a default: a catalog-only change, no
+-- rewrite of existing partitions.
+-- =====================================================
+
+ALTER TABLE chat_memory.messages ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP WITH TIME ZONE;
+
+-- Expired rows are archived with SELECT * (see 008)
+ALTER TABLE IF EXISTS archive.messages_expired ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP WITH TIME ZONE;
+
+CREATE TABLE IF NOT EXISTS chat_memory.session_summaries (
+    tenant_id VARCHAR(255) NOT NULL,
+    session_id VARCHAR(255) NOT NULL,
+    content TEXT NOT NULL,
+    token_count INTEGER NOT NULL,
+    message_count INTEGER NOT NULL,
+    first_created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    -- Newest message folded in, as a (created_at, id) keyset position
+    through_created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    through_id VARCHAR(255) NOT NULL,
+    summarizer VARCHAR(255) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (tenant_id, session_id)
+);
+
+-- Finding sessions with messages past the horizon; compacted rows leave it
+CREATE INDEX IF NOT EXISTS idx_messages_uncompacted_created
+    ON chat_memory.messages(created_at) WHERE archived_at IS NULL;
+
+INSERT INTO public.schema_migrations (version, name) VALUES (11, '011_session_compaction')
+ON CONFLICT (version) DO NOTHING;
+
+COMMENT ON TABLE chat_memory.session_summaries IS 'Rolling summary of the compacted (archived) messages of each session';
+COMMENT ON COLUMN chat_memory.messages.archived_at IS 'Set when the message was folded into chat_memory.session_summaries';
@@ -0,0 +1,20 @@
+-- =====================================================
+-- Apex MVP Database Schema - 012
+-- Content-hash dedup for document ingestion (api/ingest.py): each chunk
+-- stores the SHA-256 of its normalized text, unique per tenant/project, so
+-- re-ingesting a document only embeds and inserts chunks not stored yet,
+-- and concurrent runs cannot insert the same chunk twice.
+--
+-- Rows stored through POST /memory keep a NULL hash and are not
+-- deduplicated against.
+-- =====================================================
+
+ALTER TABLE chat_memory.embeddings ADD COLUMN IF NOT EXISTS content_hash BYTEA;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_embeddings_tenant_project_content_hash
+    ON chat_memory.embeddings(tenant_id, project_id, content_hash) WHERE content_hash IS NOT NULL;
+
+INSERT INTO public.schema_migrations (version, name) VALUES (12, '012_embedding_content_hash')
+ON CONFLICT (version) DO NOTHING;
+
+COMMENT ON COLUMN chat_memory.embeddings.content_hash IS 'SHA-256 of the whitespace-normalized chunk text, set by api/ingest.py';
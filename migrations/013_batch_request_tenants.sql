@@ -0,0 +1,21 @@
+-- =====================================================
+-- Apex MVP Database Schema - 013
+-- Scope feedback batch idempotency keys (003) to the tenant, so two tenants
+-- that pick the same Idempotency-Key never see each other's stored response.
+--
+-- Keys stored before this migration get tenant '' and are never replayed
+-- again; the partition-maintenance job purges them with the other old keys
+-- (IDEMPOTENCY_KEY_RETENTION_DAYS, see functions/shared_code/partitions.py).
+-- =====================================================
+
+-- A constant default is a catalog-only change: no table rewrite
+ALTER TABLE rag_feedback.batch_requests ADD COLUMN IF NOT EXISTS tenant_id VARCHAR(255) NOT NULL DEFAULT '';
+ALTER TABLE rag_feedback.batch_requests ALTER COLUMN tenant_id DROP DEFAULT;
+
+ALTER TABLE rag_feedback.batch_requests DROP CONSTRAINT IF EXISTS batch_requests_pkey;
+ALTER TABLE rag_feedback.batch_requests ADD CONSTRAINT batch_requests_pkey PRIMARY KEY (tenant_id, idempotency_key);
+
+INSERT INTO public.schema_migrations (version, name) VALUES (13, '013_batch_request_tenants')
+ON CONFLICT (version) DO NOTHING;
+
+COMMENT ON TABLE rag_feedback.batch_requests IS 'Responses of idempotent feedback batch calls, keyed by tenant and Idempotency-Key';
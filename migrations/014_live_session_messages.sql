@@ -0,0 +1,16 @@
+-- =====================================================
+-- Apex MVP Database Schema - 014
+-- Session reads (GET /api/memory and /api/memory/context with a session_id)
+-- return the live, not yet compacted messages of the session. They used to
+-- start after the summary's (through_created_at, through_id) keyset position
+-- (011), which hid live messages written late with an older created_at.
+-- This index holds only live rows, so filtering on archived_at IS NULL is an
+-- index range that does not grow with the compacted part of the session.
+-- =====================================================
+
+CREATE INDEX IF NOT EXISTS idx_messages_tenant_session_live
+    ON chat_memory.messages(tenant_id, session_id, created_at DESC, id DESC)
+    WHERE archived_at IS NULL;
+
+INSERT INTO public.schema_migrations (version, name) VALUES (14, '014_live_session_messages')
+ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The function app imports shared_code from the functions folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "functions"))
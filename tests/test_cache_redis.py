@@ -0,0 +1,147 @@
+"""RedisBackend and the shared_code.cache helpers against fakeredis."""
+
+import time
+
+import fakeredis
+import pytest
+
+from shared_code import cache, pagination
+
+TENANT = "t1"
+
+
+def memory_row(row_id, created_at, user_id="u1", session_id="s1"):
+	return {
+		"id": row_id,
+		"tenant_id": TENANT,
+		"user_id": user_id,
+		"session_id": session_id,
+		"content": f"message {row_id}",
+		"message_type": "chat",
+		"created_at": created_at,
+		"metadata": {},
+	}
+
+
+@pytest.fixture
+def client():
+	return fakeredis.FakeRedis()
+
+
+@pytest.fixture
+def backend(client, monkeypatch):
+	backend = cache.RedisBackend(client, ttl=30)
+	monkeypatch.setattr(cache, "_backend", backend)
+	monkeypatch.setattr(cache, "_errors", 0)
+	monkeypatch.setattr(cache, "WRITE_THROUGH", True)
+	return backend
+
+
+def test_get_many_misses_then_hits(backend):
+	key = cache.page_key("memory", TENANT, "u1", "s1", 2)
+	rows = [memory_row("b", "2024-01-02T00:00:00+00:00"), memory_row("a", "2024-01-01T00:00:00+00:00")]
+	assert backend.get_many([key]) == [None]
+	backend.put(key, rows)
+	assert backend.get_many([key, cache.page_key("memory", TENANT, "u1", "s2", 2)]) == [rows, None]
+	assert backend.stats() == {"hits": 1, "misses": 2, "invalidations": 0, "updates": 0, "backend": "redis"}
+
+
+def test_empty_page_is_cached(backend):
+	key = cache.page_key("memory", TENANT, "u1", "s1", 10)
+	backend.put(key, [])
+	assert backend.get_many([key]) == [[]]
+
+
+def test_put_sets_ttl_on_page_and_tag(backend, client):
+	key = cache.page_key("memory", TENANT, "u1", "s1", 10)
+	backend.put(key, [memory_row("a", "2024-01-01T00:00:00+00:00")])
+	assert 0 < client.ttl(backend._name(key)) <= 30
+	assert 0 < client.ttl(backend._tag(key[:2])) <= 30
+
+
+def test_pages_expire_after_ttl(client):
+	backend = cache.RedisBackend(client, ttl=1)
+	key = cache.page_key("memory", TENANT, "u1", "s1", 10)
+	backend.put(key, [memory_row("a", "2024-01-01T00:00:00+00:00")])
+	assert backend.get_many([key])[0] is not None
+	time.sleep(1.1)
+	assert backend.get_many([key]) == [None]
+
+
+def test_get_page_returns_cursor_from_iso_rows(backend):
+	key = cache.page_key("memory", TENANT, "u1", "s1", 2)
+	rows = [
+		memory_row("c", "2024-01-03T00:00:00+00:00"),
+		memory_row("b", "2024-01-02T00:00:00+00:00"),
+		memory_row("a", "2024-01-01T00:00:00+00:00"),
+	]
+	cache.put_page(key, rows)
+	data, cursor = cache.get_page(key)
+	assert [r["id"] for r in data] == ["c", "b"]
+	created_at, row_id = pagination.decode_cursor(cursor)
+	assert (created_at.isoformat(), row_id) == ("2024-01-02T00:00:00+00:00", "b")
+
+
+def test_written_prepends_and_trims_matching_pages(backend):
+	session_page = cache.page_key("memory", TENANT, "u1", "s1", 2)
+	user_page = cache.page_key("memory", TENANT, "u1", None, 2)
+	other_session = cache.page_key("memory", TENANT, "u1", "s2", 2)
+	old = [memory_row("b", "2024-01-02T00:00:00+00:00"), memory_row("a", "2024-01-01T00:00:00+00:00")]
+	for key in (session_page, user_page, other_session):
+		cache.put_page(key, [dict(r, session_id=key[3] or "s1") for r in old])
+
+	cache.written("memory", [memory_row("c", "2024-01-03T00:00:00+00:00"), memory_row("d", "2024-01-04T00:00:00+00:00")])
+
+	# Newest first, trimmed to limit + 1 rows
+	assert [r["id"] for r in backend.get_many([session_page])[0]] == ["d", "c", "b"]
+	assert [r["id"] for r in backend.get_many([user_page])[0]] == ["d", "c", "b"]
+	assert [r["id"] for r in backend.get_many([other_session])[0]] == ["b", "a"]
+	assert backend.stats()["updates"] == 2
+
+
+def test_written_leaves_missing_pages_missing(backend):
+	key = cache.page_key("memory", TENANT, "u1", "s1", 2)
+	cache.put_page(key, [])
+	backend._client.delete(backend._name(key))
+	cache.written("memory", [memory_row("a", "2024-01-01T00:00:00+00:00")])
+	assert backend.get_many([key]) == [None]
+
+
+def test_written_invalidates_in_invalidate_mode(backend, monkeypatch):
+	monkeypatch.setattr(cache, "WRITE_THROUGH", False)
+	mine = cache.page_key("memory", TENANT, "u1", "s1", 5)
+	other_user = cache.page_key("memory", TENANT, "u2", "s1", 5)
+	for key in (mine, other_user):
+		cache.put_page(key, [])
+	cache.written("memory", [memory_row("a", "2024-01-01T00:00:00+00:00")])
+	assert backend.get_many([mine, other_user]) == [None, []]
+	assert backend.stats()["invalidations"] == 1
+	assert backend._client.smembers(backend._tag(("memory", TENANT))) == {backend._name(other_user).encode()}
+
+
+def test_compacted_drops_session_pages_and_summary(backend):
+	summary = {"content": "earlier", "token_count": 1, "through_created_at": "2024-01-01T00:00:00+00:00", "through_id": "a"}
+	session_page = cache.page_key("memory", TENANT, "u1", "s1", 5)
+	all_sessions = cache.page_key("memory", TENANT, "u1", None, 5)
+	other_session = cache.page_key("memory", TENANT, "u1", "s2", 5)
+	for key in (session_page, all_sessions, other_session):
+		cache.put_page(key, [])
+	cache.put_summary(TENANT, "s1", summary)
+	assert cache.get_summary(TENANT, "s1") == [summary]
+
+	cache.compacted(TENANT, "s1")
+
+	assert backend.get_many([session_page, all_sessions, other_session]) == [None, None, []]
+	assert cache.get_summary(TENANT, "s1") is None
+
+
+def test_backend_errors_are_misses(monkeypatch):
+	# Nothing listens on port 1, so every call fails to connect
+	backend = cache.RedisBackend.from_url("redis://127.0.0.1:1/0", ttl=30)
+	monkeypatch.setattr(cache, "_backend", backend)
+	monkeypatch.setattr(cache, "_errors", 0)
+	key = cache.page_key("memory", TENANT, "u1", "s1", 5)
+	assert cache.get_page(key) is None
+	cache.put_page(key, [])
+	cache.written("memory", [memory_row("a", "2024-01-01T00:00:00+00:00")])
+	assert cache.stats()["errors"] == 3
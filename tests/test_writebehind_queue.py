@@ -0,0 +1,164 @@
+"""WriteBehindQueue on a temporary SQLite file, and batch isolation in the flusher."""
+
+import types
+
+import pytest
+
+from shared_code import writebehind
+
+
+@pytest.fixture
+def clock(monkeypatch):
+	"""Controllable ``time.time()`` as seen by the queue."""
+	now = [1_000_000.0]
+	monkeypatch.setattr(writebehind, "time", types.SimpleNamespace(time=lambda: now[0]))
+	return now
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+	return writebehind.WriteBehindQueue(str(tmp_path / "queue.sqlite"), max_pending=10, lease=60, max_attempts=3)
+
+
+def records(*ids):
+	return [{"id": i, "tenant_id": "t1", "content": f"message {i}"} for i in ids]
+
+
+def claimed_ids(claimed):
+	return [record["id"] for _, _, record in claimed]
+
+
+def test_enqueue_claim_ack(queue):
+	queue.enqueue("memory", records("a", "b"))
+	queue.enqueue("feedback", records("f"))
+
+	kind, claimed = queue.claim(10)
+	assert kind == "memory"
+	assert claimed_ids(claimed) == ["a", "b"]
+	assert [attempts for _, attempts, _ in claimed] == [0, 0]
+	# Leased rows are not handed out again
+	kind, claimed_feedback = queue.claim(10)
+	assert (kind, claimed_ids(claimed_feedback)) == ("feedback", ["f"])
+	assert queue.claim(10) == (None, [])
+
+	queue.ack([seq for seq, _, _ in claimed + claimed_feedback])
+	assert queue.stats()["pending"] == 0
+
+
+def test_claim_respects_limit_and_order(queue):
+	queue.enqueue("memory", records("a", "b", "c"))
+	assert claimed_ids(queue.claim(2)[1]) == ["a", "b"]
+	assert claimed_ids(queue.claim(2)[1]) == ["c"]
+
+
+def test_expired_lease_is_claimed_again(queue, clock):
+	queue.enqueue("memory", records("a"))
+	_, first = queue.claim(10)
+	clock[0] += 59
+	assert queue.claim(10) == (None, [])
+	clock[0] += 1
+	_, again = queue.claim(10)
+	assert [seq for seq, _, _ in again] == [seq for seq, _, _ in first]
+
+
+def test_fail_backs_off_then_dead_letters(queue, clock):
+	queue.enqueue("memory", records("a"))
+	_, claimed = queue.claim(10)
+	queue.fail(claimed, ValueError("rejected"))
+
+	# First retry after 2 ** 1 seconds, released from its lease
+	clock[0] += 1.9
+	assert queue.claim(10) == (None, [])
+	clock[0] += 0.1
+	_, claimed = queue.claim(10)
+	assert [attempts for _, attempts, _ in claimed] == [1]
+
+	queue.fail(claimed, ValueError("rejected"))
+	clock[0] += 4
+	_, claimed = queue.claim(10)
+	queue.fail(claimed, ValueError("rejected again"))
+
+	stats = queue.stats()
+	assert (stats["pending"], stats["dead"]) == (0, 1)
+	conn = queue._connect()
+	assert conn.execute("SELECT record_id, attempts, last_error FROM dead").fetchall() == [
+		("a", 3, "rejected again")
+	]
+
+
+def test_backoff_is_capped(queue, clock, monkeypatch):
+	monkeypatch.setattr(writebehind, "MAX_BACKOFF_SECONDS", 3.0)
+	queue.enqueue("memory", records("a"))
+	_, claimed = queue.claim(10)
+	queue.fail([(seq, 1, record) for seq, _, record in claimed], ValueError("rejected"))
+	clock[0] += 3
+	assert claimed_ids(queue.claim(10)[1]) == ["a"]
+
+
+def test_requeue_dead(queue, clock):
+	queue.enqueue("memory", records("a", "b"))
+	_, claimed = queue.claim(10)
+	queue.fail([(seq, 2, record) for seq, _, record in claimed], ValueError("rejected"))
+	assert queue.stats()["dead"] == 2
+
+	assert queue.requeue_dead() == 2
+	stats = queue.stats()
+	assert (stats["pending"], stats["dead"]) == (2, 0)
+	_, claimed = queue.claim(10)
+	assert claimed_ids(claimed) == ["a", "b"]
+	assert [attempts for _, attempts, _ in claimed] == [0, 0]
+
+
+def test_requeue_dead_rolls_back_on_conflict(queue):
+	queue.enqueue("memory", records("a"))
+	_, claimed = queue.claim(10)
+	queue.fail([(seq, 2, record) for seq, _, record in claimed], ValueError("rejected"))
+	conn = queue._connect()
+	conn.execute(
+		"INSERT INTO queue (seq, kind, record_id, payload, enqueued_at) VALUES (?, 'memory', 'a', '{}', 0)",
+		(claimed[0][0],),
+	)
+	with pytest.raises(Exception):
+		queue.requeue_dead()
+	assert not conn.in_transaction
+	assert queue.stats()["dead"] == 1
+
+
+def test_max_pending_backpressure(queue):
+	queue.enqueue("memory", records(*"abcdefgh"))
+	with pytest.raises(writebehind.QueueFull):
+		queue.enqueue("memory", records("i", "j", "k"))
+	# All or nothing: the rejected call queued none of its records
+	assert queue.stats()["pending"] == 8
+	queue.enqueue("memory", records("i", "j"))
+	assert queue.stats()["pending"] == 10
+
+
+def test_flusher_isolates_rejected_records(queue, monkeypatch):
+	flushed = []
+
+	def flush(kind, batch):
+		if any(r["id"] == "bad" for r in batch):
+			raise ValueError("rejected")
+		flushed.extend(r["id"] for r in batch)
+
+	monkeypatch.setattr(writebehind, "_flush", flush)
+	queue.enqueue("memory", records("a", "b", "bad", "c", "d"))
+	_, claimed = queue.claim(10)
+	failed = writebehind.Flusher(queue).write("memory", claimed)
+	assert [entry[2]["id"] for entry, _ in failed] == ["bad"]
+	assert sorted(flushed) == ["a", "b", "c", "d"]
+
+
+def test_flusher_does_not_split_when_postgres_is_unreachable(queue, monkeypatch):
+	calls = []
+
+	def flush(kind, batch):
+		calls.append(len(batch))
+		raise ConnectionRefusedError()
+
+	monkeypatch.setattr(writebehind, "_flush", flush)
+	queue.enqueue("memory", records("a", "b", "c"))
+	_, claimed = queue.claim(10)
+	assert len(writebehind.Flusher(queue).write("memory", claimed)) == 3
+	assert calls == [3]